@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+Benchmark pipeline KTP Scanner per stage.
+
+Jalankan tiap stage (decode, crop, deskew, warp, quality, OCR resize, blur, readtext, extract) di foto KTP sintetis beberapa resolusi,
+laporkan p50/p95 latency, throughput, dan peak RSS per stage.
+
+Contoh:
+    python ktp_bench.py --save-baseline bench_baseline.json      # di scanning station
+    python ktp_bench.py --baseline bench_baseline.json           # exit 1 kalau lebih lambat
+    python ktp_bench.py --no-ocr --resolutions 1280x720 --iterations 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+
+import numpy as np
+import cv2
+
+import ktp_core
+
+DEFAULT_RESOLUTIONS = ["1280x720", "1920x1080", "4000x3000"]
+
+# Contoh hasil readtext untuk benchmark extractor tanpa OCR
+SAMPLE_TEXT_LIST = [
+    "PROVINSI JAWA TIMUR", "KABUPATEN SIDOARJO", "NIK", ": 3515011234560001",
+    "Nama", ": BUDI SANTOSO", "Tempat/Tgl Lahir", ": SIDOARJO, 01-01-1990",
+    "Jenis Kelamin", ": LAKI-LAKI", "Alamat", ": JL. MAWAR NO. 1", "RT/RW", ": 001/002",
+    "Kel/Desa", ": BUDURAN", "Kecamatan", ": BUDURAN", "Agama", ": ISLAM",
+    "Status Perkawinan", ": KAWIN", "Pekerjaan", ": KARYAWAN SWASTA",
+    "Kewarganegaraan", ": WNI", "Berlaku Hingga", ": SEUMUR HIDUP",
+]
+
+
+# --- SYNTHETIC KTP ---
+def make_synthetic_photo(width, height, seed=0):
+    """Foto sintetis: kartu KTP biru (rasio 1.58) miring sedikit di atas meja bertekstur"""
+    rng = np.random.default_rng(seed)
+    photo = rng.integers(90, 140, size=(height, width, 3), dtype=np.uint8)
+    photo = cv2.GaussianBlur(photo, (0, 0), 3)
+
+    card_w = int(min(width * 0.7, height * 0.7 * 1.58))
+    card_h = int(card_w / 1.58)
+    card = np.zeros((card_h, card_w, 3), np.uint8)
+    card[:] = (215, 185, 120)  # BGR biru muda khas e-KTP
+
+    scale = card_w / 1000
+    thickness = max(1, int(2 * scale))
+    for i, header in enumerate(SAMPLE_TEXT_LIST[:2]):
+        cv2.putText(card, header, (int(0.3 * card_w), int((0.07 + i * 0.06) * card_h)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7 * scale, (20, 20, 20), thickness, cv2.LINE_AA)
+    pairs = SAMPLE_TEXT_LIST[2:]
+    for i in range(0, min(len(pairs), 20), 2):
+        y = int((0.2 + i * 0.04) * card_h)
+        cv2.putText(card, pairs[i], (int(0.03 * card_w), y), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6 * scale, (20, 20, 20), thickness, cv2.LINE_AA)
+        cv2.putText(card, pairs[i + 1], (int(0.22 * card_w), y), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6 * scale, (20, 20, 20), thickness, cv2.LINE_AA)
+    # Foto wajah
+    cv2.rectangle(card, (int(0.74 * card_w), int(0.2 * card_h)),
+                  (int(0.95 * card_w), int(0.75 * card_h)), (150, 150, 150), -1)
+
+    # Tempel kartu, miring 3 derajat
+    M = cv2.getRotationMatrix2D((card_w / 2, card_h / 2), 3, 1.0)
+    M[0, 2] += (width - card_w) / 2
+    M[1, 2] += (height - card_h) / 2
+    mask = cv2.warpAffine(np.full((card_h, card_w), 255, np.uint8), M, (width, height))
+    warped = cv2.warpAffine(card, M, (width, height))
+    photo[mask > 0] = warped[mask > 0]
+    return photo
+
+
+def encode_jpeg(image, quality=90):
+    ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+# --- MEMORY SAMPLER ---
+def current_rss_bytes():
+    """RSS proses sekarang (Linux /proc), fallback ru_maxrss"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Sampling RSS di background thread selama stage jalan, simpan peak"""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = current_rss_bytes()
+        self.peak = self.start_rss
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+        return False
+
+
+# --- STAGES ---
+def _stage_crop(img):
+    small, edges, ratio = ktp_core.card_edge_map(img)
+    region, contour = ktp_core.locate_card(img, small, edges, ratio)
+    quad = ktp_core.fit_card_quad(contour, ratio) if contour is not None else None
+    if region is None:
+        region = (0, 0, img.shape[1], img.shape[0])
+    return img, edges, region, quad
+
+
+def _stage_deskew(state):
+    img, edges, region, quad = state
+    skew = ktp_core.estimate_skew(edges) if quad is None else 0.0
+    return img, ktp_core.plan_card_warp(region, quad, skew, ktp_core.MAX_DIMENSION)
+
+
+def _stage_warp(state):
+    img, (src, size, _, _) = state
+    return ktp_core.warp_card(img, src, size)
+
+
+def _stage_ocr_resize(img):
+    h, w = img.shape[:2]
+    target_width = ktp_core.ocr_target_width(w, h)
+    if target_width == w:
+        return img
+    return cv2.resize(img, (target_width, int(h * (target_width / w))), interpolation=cv2.INTER_AREA)
+
+
+def _stage_blur(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(gray, (5, 5), 0)
+
+
+def _stage_extract(text_list):
+    ktp_core.extract_nama(text_list)
+    ktp_core.extract_nik(text_list)
+    ktp_core.extract_form_data(text_list)
+    return text_list
+
+
+def pipeline_stages(reader=None):
+    """
+    Daftar (nama stage, fungsi) sesuai urutan worker_process.
+    Tiap fungsi terima output stage sebelumnya.
+    """
+    stages = [
+        ("decode", lambda data: ktp_core.decode_image(data)[0]),
+        ("crop", _stage_crop),
+        ("deskew", _stage_deskew),
+        ("warp", _stage_warp),
+        ("quality", lambda img: (ktp_core.check_image_quality(img), img)[1]),
+        ("ocr_resize", _stage_ocr_resize),
+        ("blur", _stage_blur),
+    ]
+    if reader is not None:
+        stages.append(("readtext", lambda img: [
+            r[1].strip() for r in reader.readtext(img) if len(r[1].strip()) > 1
+        ]))
+    else:
+        stages.append(("readtext", None))  # di-skip, extractor pakai SAMPLE_TEXT_LIST
+    stages.append(("extract", _stage_extract))
+    return stages
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_benchmark(resolutions, iterations=10, reader=None, seed=0):
+    """
+    Returns: dict hasil {"<WxH>": {"<stage>": {p50_ms, p95_ms, throughput_per_s, peak_rss_mb, peak_rss_delta_mb}}}
+    """
+    results = {}
+    stages = pipeline_stages(reader)
+
+    for resolution in resolutions:
+        width, height = (int(v) for v in resolution.lower().split("x"))
+        data = encode_jpeg(make_synthetic_photo(width, height, seed))
+        timings = {name: [] for name, fn in stages if fn is not None}
+        peaks = {name: 0 for name in timings}
+        deltas = {name: 0 for name in timings}
+
+        for _ in range(iterations):
+            value = data
+            for name, fn in stages:
+                if fn is None:
+                    value = list(SAMPLE_TEXT_LIST)
+                    continue
+                with RssSampler() as sampler:
+                    started = time.perf_counter()
+                    value = fn(value)
+                    elapsed = time.perf_counter() - started
+                timings[name].append(elapsed)
+                peaks[name] = max(peaks[name], sampler.peak)
+                deltas[name] = max(deltas[name], sampler.peak - sampler.start_rss)
+
+        results[resolution] = {
+            name: {
+                "p50_ms": _percentile(values, 50) * 1000,
+                "p95_ms": _percentile(values, 95) * 1000,
+                "throughput_per_s": len(values) / sum(values) if sum(values) > 0 else float("inf"),
+                "peak_rss_mb": peaks[name] / (1024 * 1024),
+                "peak_rss_delta_mb": deltas[name] / (1024 * 1024),
+            }
+            for name, values in timings.items()
+        }
+        total = [sum(t) for t in zip(*timings.values())]
+        results[resolution]["total"] = {
+            "p50_ms": _percentile(total, 50) * 1000,
+            "p95_ms": _percentile(total, 95) * 1000,
+            "throughput_per_s": len(total) / sum(total) if sum(total) > 0 else float("inf"),
+            "peak_rss_mb": max(peaks.values()) / (1024 * 1024),
+            "peak_rss_delta_mb": max(deltas.values()) / (1024 * 1024),
+        }
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2, min_ms=2.0):
+    """
+    Bandingkan p50 tiap stage dengan baseline.
+    Regresi = lebih lambat > tolerance (relatif) DAN > min_ms (absolut, hindari noise stage kecil)
+    Returns: list (resolution, stage, baseline_ms, current_ms)
+    """
+    regressions = []
+    for resolution, stages in results.items():
+        for stage, stats in stages.items():
+            base = baseline.get("results", {}).get(resolution, {}).get(stage)
+            if not base:
+                continue
+            base_ms, cur_ms = base["p50_ms"], stats["p50_ms"]
+            if cur_ms > base_ms * (1 + tolerance) and cur_ms - base_ms > min_ms:
+                regressions.append((resolution, stage, base_ms, cur_ms))
+    return regressions
+
+
+def print_report(results, out=sys.stdout):
+    for resolution, stages in results.items():
+        print(f"\n📐 {resolution}", file=out)
+        print(f"  {'stage':<12} {'p50 ms':>9} {'p95 ms':>9} {'per s':>9} {'RSS MB':>8} {'ΔRSS MB':>8}", file=out)
+        for stage, s in stages.items():
+            print(f"  {stage:<12} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['throughput_per_s']:9.1f} "
+                  f"{s['peak_rss_mb']:8.0f} {s['peak_rss_delta_mb']:8.1f}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ktp_bench', description='Benchmark per-stage pipeline KTP Scanner')
+    parser.add_argument('--resolutions', nargs='+', default=DEFAULT_RESOLUTIONS, help='Resolusi foto, format WxH')
+    parser.add_argument('--iterations', type=int, default=10, help='Jumlah ulangan per resolusi')
+    parser.add_argument('--no-ocr', action='store_true', help='Skip readtext (tanpa load model OCR)')
+    parser.add_argument('-o', '--output', default=None, help='Simpan hasil ke file JSON')
+    parser.add_argument('--baseline', default=None, help='File JSON baseline untuk dibandingkan')
+    parser.add_argument('--save-baseline', default=None, help='Simpan hasil sebagai baseline baru')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Toleransi regresi p50 relatif (default: 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    reader = None
+    if not args.no_ocr:
+        from ktp_ocr import create_reader
+        reader = create_reader()
+        ktp_core.warm_up_reader(reader)
+
+    results = run_benchmark(args.resolutions, args.iterations, reader)
+    print_report(results)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pipeline_version": ktp_core.PIPELINE_VERSION,
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count(), "opencv": cv2.__version__},
+        "iterations": args.iterations,
+        "ocr": reader is not None,
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as fh:
+                json.dump(report, fh, indent=2)
+            print(f"\n💾 {path}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ REGRESI PERFORMA (p50 lebih lambat dari baseline):", file=sys.stderr)
+            for resolution, stage, base_ms, cur_ms in regressions:
+                print(f"   {resolution} {stage}: {base_ms:.1f} ms → {cur_ms:.1f} ms "
+                      f"(+{(cur_ms / base_ms - 1) * 100:.0f}%)", file=sys.stderr)
+            return 1
+        print(f"\n✅ Tidak ada regresi dibanding baseline {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
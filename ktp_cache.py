@@ -0,0 +1,127 @@
+"""
+Cache hasil OCR di disk, key = SHA-256(bytes foto + PIPELINE_VERSION).
+Foto yang di-upload ulang (beda nama file, beda session, setelah refresh)
+langsung pakai hasil readtext lama tanpa OCR ulang.
+Ukuran dibatasi, entry yang paling lama tidak dipakai dibuang duluan (LRU).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from ktp_core import PIPELINE_VERSION
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ktp-scanner")
+DEFAULT_MAX_MB = 256
+
+
+class OcrCache:
+    """
+    SQLite (WAL) di cache_dir/ocr_cache.sqlite3.
+    Aman dipakai dari banyak thread & worker process: koneksi dibuat per thread,
+    dan object ini bisa di-pickle (hanya path & limit yang dikirim ke worker).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_MAX_MB, version=PIPELINE_VERSION):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.version = version
+        self.path = os.path.join(cache_dir, "ocr_cache.sqlite3")
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """Config dari env: KTP_CACHE_DIR, KTP_CACHE_MAX_MB (0 = cache mati)"""
+        max_mb = os.environ.get("KTP_CACHE_MAX_MB", "").strip()
+        max_mb = int(max_mb) if max_mb.isdigit() else DEFAULT_MAX_MB
+        if max_mb == 0:
+            return None
+        return cls(os.environ.get("KTP_CACHE_DIR") or DEFAULT_CACHE_DIR, max_mb)
+
+    def __getstate__(self):
+        return {"cache_dir": self.cache_dir, "max_bytes": self.max_bytes,
+                "version": self.version, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                " key TEXT PRIMARY KEY,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON ocr_cache(last_access)")
+            self._local.conn = conn
+        return conn
+
+    def key_for(self, f_bytes):
+        """SHA-256 dari versi pipeline + bytes foto"""
+        digest = hashlib.sha256(self.version.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(f_bytes)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns: payload dict atau None (cache miss / error)"""
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT payload FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError):
+            # Cache bukan critical path - kalau rusak/terkunci, anggap miss
+            return None
+
+    def put(self, key, payload):
+        try:
+            blob = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, payload, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time())
+            )
+            self._evict(conn)
+        except (sqlite3.Error, TypeError, ValueError):
+            pass
+
+    def _evict(self, conn):
+        """Buang entry LRU sampai total ukuran di bawah max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access ASC"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM ocr_cache WHERE key = ?", victims)
+
+    def stats(self):
+        """Returns: (jumlah entry, total bytes)"""
+        try:
+            return self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()
+        except sqlite3.Error:
+            return 0, 0
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM ocr_cache")
+        except sqlite3.Error:
+            pass
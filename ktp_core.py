@@ -0,0 +1,1691 @@
+"""
+Core pipeline KTP Scanner: crop -> quality -> rotate -> OCR -> extract.
+Modul ini tidak import streamlit, jadi bisa dipakai dari worker process,
+script, maupun UI.
+"""
+import os
+import functools
+import numpy as np
+import cv2
+import re
+import io
+from PIL import Image
+
+from ktp_ocr import OCR_BACKEND
+from ktp_metrics import StageTimer
+from ktp_fixes import FixSnapshot
+from ktp_nik import nik_confidence, parse_birth_date, score_nik, windows as nik_windows
+
+# --- FUNGSI VALIDASI KUALITAS FOTO ---
+def check_image_quality(image):
+    """
+    Validasi kualitas foto KTP sebelum OCR
+    Returns: (is_valid, message, warnings)
+    """
+    try:
+        h, w = image.shape[:2]
+        warnings = []
+        
+        # 1. Cek resolusi minimal (lebih toleran)
+        if w < 200 or h < 150:
+            return False, f"❌ Resolusi terlalu kecil ({w}x{h}). Min: 200x150 px", warnings
+        
+        if w < 400 or h < 250:
+            warnings.append(f"⚠️ Resolusi rendah ({w}x{h}), hasil OCR mungkin kurang akurat")
+        
+        # 2. Cek aspect ratio - SKIP! Terlalu banyak false positive
+        # Banyak foto KTP yang valid tapi aspect ratio aneh karena:
+        # - Foto miring/rotated
+        # - Ada border/margin
+        # - Cropped tidak sempurna
+        # - Screenshot dengan padding
+        
+        # aspect_ratio = w / h if h > 0 else 0
+        # if aspect_ratio < 0.8 or aspect_ratio > 2.5:
+        #     warnings.append(f"⚠️ Rasio foto {aspect_ratio:.2f}:1 (ideal: ~1.5:1)")
+        
+        # 3. Cek blur/focus (lebih toleran)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        
+        if laplacian_var < 30:  # Turunin dari 50
+            return False, f"❌ Foto terlalu blur (score: {laplacian_var:.0f}). Min: 30", warnings
+        
+        if laplacian_var < 80:  # Warning threshold
+            warnings.append(f"⚠️ Foto agak blur (score: {laplacian_var:.0f})")
+        
+        # 4. Cek brightness (lebih toleran)
+        mean_brightness = np.mean(gray)
+        
+        if mean_brightness < 20:  # Turunin dari 30
+            return False, f"❌ Foto terlalu gelap ({mean_brightness:.0f}). Min: 20", warnings
+        
+        if mean_brightness > 245:  # Naikin dari 240
+            return False, f"❌ Foto terlalu terang ({mean_brightness:.0f}). Max: 245", warnings
+        
+        if mean_brightness < 50:
+            warnings.append(f"⚠️ Foto agak gelap ({mean_brightness:.0f})")
+        
+        if mean_brightness > 210:
+            warnings.append(f"⚠️ Foto agak terang ({mean_brightness:.0f})")
+        
+        # All checks passed
+        quality_score = f"OK (focus: {laplacian_var:.0f}, brightness: {mean_brightness:.0f})"
+        return True, quality_score, warnings
+        
+    except Exception as e:
+        # Jika validasi error, tetap lanjut
+        return True, "⚠️ Validasi skip", []
+
+# --- GEOMETRI KARTU: CROP + ORIENTASI + DESKEW DALAM 1 WARP ---
+# Sisi panjang edge map untuk deteksi kartu & estimasi kemiringan
+# (Canny/Hough di foto 2000px cuma buang waktu, sudut cukup akurat di sini)
+EDGE_MAP_SIZE = 640
+# Kemiringan di bawah ini dianggap noise estimator, tidak dikoreksi
+MIN_SKEW_DEGREES = 1.5
+# Sudut hanya dipercaya kalau >= MIN_SKEW_AGREEMENT (fraksi panjang total)
+# segmen garis berada dalam +-SKEW_AGREEMENT_DEGREES dari median
+SKEW_AGREEMENT_DEGREES = 1.0
+MIN_SKEW_AGREEMENT = 0.5
+# Segmen garis minimal (fraksi lebar edge map) yang ikut estimasi kemiringan
+MIN_SKEW_SEGMENT = 0.15
+# Ukuran kartu setelah koreksi perspektif (rasio ID-1 85.6 x 54 mm), semua
+# stage setelahnya (OCR, ROI template) kerja di ukuran tetap ini
+RECTIFIED_SIZE = (1000, 630)
+# Lembar scan berisi beberapa KTP (fotokopi A4): luas minimal tiap kartu,
+# ukuran minimal relatif kartu terbesar, dan batas jumlah kartu per foto
+MULTI_CARD_MIN_AREA = 0.04
+MULTI_CARD_SIZE_RATIO = 0.5
+MAX_CARDS_PER_IMAGE = 12
+# Kompresi PNG kartu hasil split yang dikirim ke job kartu berikutnya (cepat > kecil)
+CARD_IMAGE_PNG_COMPRESSION = 1
+
+def card_edge_map(image):
+    """
+    Grayscale + Canny di resolusi kecil (sisi panjang EDGE_MAP_SIZE).
+    Edge yang sama dipakai crop (contour -> sudut kartu) dan deskew (HoughLinesP).
+    Returns: (small BGR, edges, ratio) - ratio = ukuran asli / ukuran small
+    """
+    h, w = image.shape[:2]
+    ratio = max(1.0, max(w, h) / EDGE_MAP_SIZE)
+    if ratio > 1:
+        small = cv2.resize(image, (int(w / ratio), int(h / ratio)), interpolation=cv2.INTER_AREA)
+    else:
+        small = image
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 30, 100)
+    return small, edges, ratio
+
+def _card_candidates(contours, w, h, ratio, min_area=0.15):
+    """Filter contour (koordinat edge map) yang ukuran & rasionya mirip KTP"""
+    candidates = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        
+        # KTP minimal 15% dari total area (lembar scan: MULTI_CARD_MIN_AREA), max 90%
+        if area < (w * h * min_area) or area > (w * h * 0.90):
+            continue
+        
+        # Get bounding box
+        x, y, cw, ch = cv2.boundingRect(contour)
+        
+        # Skip jika terlalu kecil (batas dalam pixel foto asli)
+        # Kartu portrait juga diterima, diputar 90° saat warp
+        long_side, short_side = max(cw, ch), min(cw, ch)
+        if long_side * ratio < 200 or short_side * ratio < 100:
+            continue
+        
+        # Aspect ratio KTP ~ 1.4-1.7, tapi lebih toleran
+        aspect = long_side / short_side if short_side > 0 else 0
+        if aspect < 1.2 or aspect > 2.0:
+            continue
+        
+        candidates.append((area, x, y, cw, ch, aspect, contour))
+    return candidates
+
+def _overlap_ratio(a, b):
+    """Luas irisan 2 bounding box (x, y, w, h) dibagi luas box yang lebih kecil"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    return ix * iy / max(1, min(a[2] * a[3], b[2] * b[3]))
+
+def _select_cards(small, edges, ratio, min_area):
+    """Candidate KTP dari edge map (method 1), fallback area biru (method 2)"""
+    h, w = edges.shape[:2]
+    
+    # Method 1: Cari KTP area dengan edge detection (dilate untuk connect edges)
+    dilated = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+    contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    ktp_candidates = _card_candidates(contours, w, h, ratio, min_area)
+    
+    # Method 2: Jika tidak detect dengan edge, coba detect blue area (KTP warna biru)
+    if not ktp_candidates:
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        
+        # Range warna biru KTP (cyan-blue)
+        lower_blue = np.array([80, 40, 40])
+        upper_blue = np.array([130, 255, 255])
+        mask_blue = cv2.inRange(hsv, lower_blue, upper_blue)
+        
+        contours_blue, _ = cv2.findContours(mask_blue, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        ktp_candidates = _card_candidates(contours_blue, w, h, ratio, min_area)
+    return ktp_candidates
+
+def _multi_cards(candidates):
+    """
+    Kartu-kartu terpisah di 1 lembar: candidate tidak saling tumpang tindih
+    dengan ukuran mirip (>= MULTI_CARD_SIZE_RATIO x kartu terbesar), urut
+    baca (baris atas dulu, kiri ke kanan). < 2 kartu = bukan lembar multi.
+    """
+    chosen = []
+    for cand in sorted(candidates, key=lambda c: -c[0]):
+        if chosen and cand[0] < chosen[0][0] * MULTI_CARD_SIZE_RATIO:
+            break
+        if all(_overlap_ratio(cand[1:5], c[1:5]) < 0.2 for c in chosen):
+            chosen.append(cand)
+        if len(chosen) == MAX_CARDS_PER_IMAGE:
+            break
+    if len(chosen) < 2:
+        return []
+    row_h = min(c[4] for c in chosen)
+    return sorted(chosen, key=lambda c: (int((c[2] + c[4] / 2) // row_h), c[1]))
+
+def locate_cards(image, small, edges, ratio):
+    """
+    Deteksi area KTP dalam screenshot/dokumen dari edge map kecil.
+    Lembar scan berisi beberapa KTP (fotokopi A4) -> semua kartu, urut baca.
+    Improved: Handle multiple KTP, KTP dengan text form di bawah
+    Returns: list ((x1, y1, x2, y2) di koordinat foto asli, contour di edge map),
+    kosong kalau tidak detect
+    """
+    # Lembar multi-KTP: tiap kartu bisa cuma ~7% luas A4
+    cards = _multi_cards(_select_cards(small, edges, ratio, MULTI_CARD_MIN_AREA))
+    if not cards:
+        ktp_candidates = _select_cards(small, edges, ratio, 0.15)
+        if not ktp_candidates:
+            return []
+        # Ambil candidate terbaik: aspect ratio mendekati 1.58 (ideal KTP), lalu by area
+        ktp_candidates.sort(key=lambda c: (abs(c[5] - 1.58), -c[0]))
+        cards = ktp_candidates[:1]
+    
+    H, W = image.shape[:2]
+    margin = 5
+    located = []
+    for _, x, y, cw, ch, _, contour in cards:
+        # Crop dengan margin kecil (5px di foto asli)
+        x1 = max(0, int(x * ratio) - margin)
+        y1 = max(0, int(y * ratio) - margin)
+        x2 = min(W, int((x + cw) * ratio) + margin)
+        y2 = min(H, int((y + ch) * ratio) + margin)
+        
+        # Validasi crop tidak terlalu kecil
+        if min(x2 - x1, y2 - y1) <= 100 or max(x2 - x1, y2 - y1) <= 150:
+            continue
+        located.append(((x1, y1, x2, y2), contour))
+    return located
+
+def locate_card(image, small, edges, ratio):
+    """
+    Kartu pertama dari locate_cards
+    Returns: ((x1, y1, x2, y2), contour) atau (None, None) kalau tidak detect
+    """
+    cards = locate_cards(image, small, edges, ratio)
+    return cards[0] if cards else (None, None)
+
+def detect_and_crop_ktp(image):
+    """
+    Crop KTP dari screenshot/dokumen (tanpa rotate)
+    Returns: (cropped KTP image atau original, was_cropped)
+    """
+    try:
+        region, _ = locate_card(image, *card_edge_map(image))
+        if region is None:
+            return image, False
+        x1, y1, x2, y2 = region
+        return image[y1:y2, x1:x2], True
+    except Exception:
+        return image, False
+
+def _fold_angle(degrees):
+    """Sudut garis -> kemiringan terhadap sumbu terdekat, (-45, 45]"""
+    return -((-degrees + 45) % 90 - 45)
+
+def estimate_skew(edges):
+    """
+    Kemiringan konten (derajat, positif = searah jarum jam) dari edge map
+    kecil, untuk foto yang tepi kartunya tidak terdeteksi: median (berbobot
+    panjang) segmen HoughLinesP. Garis horizontal & vertikal sama-sama dipakai
+    (di-fold ke sumbu terdekat), jadi foto portrait tetap terukur sebelum
+    diputar 90°. Returns 0.0 kalau garis-garisnya tidak sepakat (1 garis
+    miring di background tidak boleh memutar seluruh foto).
+    """
+    w = edges.shape[1]
+    segments = cv2.HoughLinesP(edges, 1, np.pi / 360, 60,
+                               minLineLength=int(w * MIN_SKEW_SEGMENT), maxLineGap=4)
+    if segments is None or len(segments) < 2:
+        return 0.0
+    
+    x1, y1, x2, y2 = segments.reshape(-1, 4).astype(np.float64).T
+    angles = _fold_angle(np.degrees(np.arctan2(y2 - y1, x2 - x1)))
+    lengths = np.hypot(x2 - x1, y2 - y1)
+    order = np.argsort(angles)
+    cumulative = np.cumsum(lengths[order])
+    skew = float(angles[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+    agreeing = lengths[np.abs(angles - skew) <= SKEW_AGREEMENT_DEGREES].sum()
+    if agreeing < MIN_SKEW_AGREEMENT * cumulative[-1]:
+        return 0.0
+    return skew
+
+def fit_card_quad(contour, ratio):
+    """
+    4 sudut kartu dari contour edge map: approxPolyDP kalau hasilnya segi
+    empat, kalau tidak (sudut tertutup jari / membulat) pakai minAreaRect
+    Returns: array (4, 2) float32 di koordinat foto asli (belum diurutkan)
+    """
+    hull = cv2.convexHull(contour)
+    approx = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+    if len(approx) == 4:
+        quad = approx.reshape(4, 2).astype(np.float32)
+    else:
+        quad = cv2.boxPoints(cv2.minAreaRect(hull))
+    return quad * ratio
+
+def order_card_quad(quad):
+    """
+    Urutkan sudut jadi (kiri atas, kanan atas, kanan bawah, kiri bawah) dengan
+    sisi atas = sisi panjang. Kartu portrait diputar 90° searah jarum jam.
+    Sudut diurutkan menurut arah dari titik tengah (searah jarum jam di
+    koordinat gambar), mulai dari yang paling kiri atas, jadi kartu miring
+    ~45° tetap menghasilkan 4 sudut berbeda.
+    Returns: (quad (4, 2) float32, orientation_angle)
+    """
+    pts = np.asarray(quad, np.float32).reshape(4, 2)
+    center = pts.mean(axis=0)
+    clockwise = pts[np.argsort(np.arctan2(pts[:, 1] - center[1], pts[:, 0] - center[0]))]
+    # Kiri atas = x + y terkecil (seri: yang lebih atas)
+    start = np.lexsort((clockwise[:, 1], clockwise.sum(axis=1)))[0]
+    ordered = np.roll(clockwise, -start, axis=0)
+    top = np.hypot(*(ordered[1] - ordered[0]))
+    side = np.hypot(*(ordered[2] - ordered[1]))
+    if side > top:
+        # Kiri bawah jadi kiri atas setelah diputar searah jarum jam
+        return ordered[[3, 0, 1, 2]], 90
+    return ordered, 0
+
+def _rotated_region_quad(region, angle):
+    """Sudut persegi region yang diputar angle derajat (searah jarum jam) di pusatnya"""
+    x1, y1, x2, y2 = region
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    theta = np.radians(angle)
+    rot = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]], np.float32)
+    corners = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], np.float32) - (cx, cy)
+    return corners @ rot.T + (cx, cy)
+
+def plan_card_warp(region, quad, skew, max_dimension):
+    """
+    Sumber 1 warp perspektif untuk crop + rotate 90° (portrait) + deskew + resize.
+    quad (sudut kartu) ada: kartu diluruskan ke RECTIFIED_SIZE.
+    quad None: region diputar sebesar skew, di-downscale ke max_dimension.
+    Returns: (src quad (4, 2) urut kiri atas searah jarum jam, (out_w, out_h),
+    orientation_angle, rotation_angle)
+    """
+    if quad is not None:
+        src, orientation_angle = order_card_quad(quad)
+        top = src[1] - src[0]
+        rotation_angle = float(_fold_angle(np.degrees(np.arctan2(top[1], top[0]))))
+        return src, RECTIFIED_SIZE, orientation_angle, round(rotation_angle, 1)
+    
+    rotation_angle = skew if abs(skew) >= MIN_SKEW_DEGREES else 0.0
+    x1, y1, x2, y2 = region
+    
+    # KTP seharusnya landscape: portrait (height > width) diputar 90° searah jarum jam
+    src, orientation_angle = order_card_quad(_rotated_region_quad(region, rotation_angle))
+    out_w, out_h = (y2 - y1, x2 - x1) if orientation_angle else (x2 - x1, y2 - y1)
+    
+    # MEMORY OPTIMIZATION: sekalian reduce ke max_dimension
+    scale = min(1.0, max_dimension / max(out_w, out_h))
+    return src, (max(1, int(out_w * scale)), max(1, int(out_h * scale))), orientation_angle, rotation_angle
+
+def warp_card(image, src, size):
+    """
+    Terapkan rencana plan_card_warp dalam 1x resampling (warpPerspective).
+    Region tegak tanpa rotasi cukup slice + resize INTER_AREA. Kalau kartu
+    mengecil > 2x, area kartu di-pyrDown dulu (anti-aliasing, warp tidak
+    punya INTER_AREA).
+    """
+    out_w, out_h = size
+    x1, y1 = np.floor(src.min(axis=0)).astype(int)
+    x2, y2 = np.ceil(src.max(axis=0)).astype(int)
+    upright = src[0, 1] == src[1, 1] and src[0, 0] == src[3, 0] and src[0, 0] < src[1, 0]
+    if upright and x1 >= 0 and y1 >= 0:
+        card = image[y1:y2, x1:x2]
+        if (out_w, out_h) != (x2 - x1, y2 - y1):
+            card = cv2.resize(card, (out_w, out_h), interpolation=cv2.INTER_AREA)
+        return card
+    
+    h, w = image.shape[:2]
+    src = src.astype(np.float32)
+    if max(x2 - x1, y2 - y1) > 2 * max(out_w, out_h):
+        x1, y1 = max(0, x1), max(0, y1)
+        image = cv2.pyrDown(image[y1:min(h, y2), x1:min(w, x2)])
+        src = ((src - (x1, y1)) / 2).astype(np.float32)
+    dst = np.array([[0, 0], [out_w, 0], [out_w, out_h], [0, out_h]], np.float32)
+    M = cv2.getPerspectiveTransform(src, dst)
+    return cv2.warpPerspective(image, M, (out_w, out_h), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+
+def rectify_card(image, max_dimension=None, timer=None, card_index=0, other_cards=None):
+    """
+    Crop -> orientasi -> deskew / koreksi perspektif -> resize, 1 edge map & 1 warp
+    card_index: kartu ke-berapa (urut baca) kalau 1 foto berisi beberapa KTP
+    other_cards: list opsional, diisi kartu lain di foto yang sama yang sudah
+    di-warp (img, orientation_angle, rotation_angle, rectified), urut card_index,
+    supaya job kartu berikutnya tidak perlu decode & deteksi ulang
+    Returns: (img kartu atau None kalau card_index tidak ada, was_cropped,
+    orientation_angle, rotation_angle, rectified, card_count)
+    rectified: sudut kartu terdeteksi, img = kartu lurus ukuran RECTIFIED_SIZE
+    """
+    if max_dimension is None:
+        max_dimension = MAX_DIMENSION
+    if timer is None:
+        timer = StageTimer()
+    
+    small, edges, ratio = card_edge_map(image)
+    try:
+        cards = locate_cards(image, small, edges, ratio)
+    except Exception:
+        cards = []
+    card_count = max(1, len(cards))
+    if card_index >= card_count:
+        return None, False, 0, 0.0, False, card_count
+    region, contour = cards[card_index] if cards else (None, None)
+    quad = fit_card_quad(contour, ratio) if contour is not None else None
+    was_cropped = region is not None
+    if region is None:
+        h, w = image.shape[:2]
+        region = (0, 0, w, h)
+    timer.mark("crop", small)
+    
+    try:
+        skew = estimate_skew(edges) if quad is None else 0.0
+    except Exception:
+        skew = 0.0
+    src, size, orientation_angle, rotation_angle = plan_card_warp(region, quad, skew, max_dimension)
+    timer.mark("deskew", edges)
+    
+    img = warp_card(image, src, size)
+    timer.mark("warp", img)
+    
+    if other_cards is not None and card_count > 1:
+        for index, (other_region, other_contour) in enumerate(cards):
+            if index == card_index:
+                continue
+            # Kartu dari locate_cards selalu punya contour -> quad, tanpa estimasi skew
+            other_quad = fit_card_quad(other_contour, ratio)
+            other_src, other_size, other_orientation, other_rotation = plan_card_warp(
+                other_region, other_quad, 0.0, max_dimension)
+            other_cards.append((warp_card(image, other_src, other_size), other_orientation, other_rotation, True))
+    return img, was_cropped, orientation_angle, rotation_angle, quad is not None, card_count
+
+# --- FUNGSI EKSTRAKSI ---
+
+# Koreksi typo OCR untuk NIK: huruf yang sering terbaca sebagai angka
+NIK_CHAR_FIXES = {
+    'O': '0', 'D': '0', 'Q': '0', 'U': '0', 'C': '0',
+    'L': '1', 'I': '1', 'T': '1', 'J': '1', '!': '1',
+    'Z': '2', 'E': '3', 'A': '4', 'S': '5', 
+    'G': '6', 'b': '6', '?': '7', 'B': '8', '&': '8'
+}
+# Tabel translate dibuat sekali: spasi, ":" & "-" dibuang, huruf -> angka
+_NIK_TABLE = str.maketrans({**NIK_CHAR_FIXES, " ": None, ":": None, "-": None})
+_NON_DIGIT = re.compile(r'\D')
+
+def clean_nik_advanced(text):
+    return _NON_DIGIT.sub('', text.upper().translate(_NIK_TABLE))
+
+# Kamus koreksi hardcoded (dari testing manual)
+NAMA_FIXES_TESTED = {
+    'SUGIHANTI': 'SUGIANTI', 
+    'PCATII': 'PERTIWI', 
+    'PCATI': 'PERTIWI', 
+    'PCATWI': 'PERTIWI', 
+    'MAAGI': 'MARGI', 
+    'HANJTI': 'ANTI', 
+    'ANJTI': 'ANTI'
+}
+
+# Kamus nama Indonesia umum
+NAMA_COMMON_FIXES = {
+    'SIT1': 'SITI', 'S1TI': 'SITI', 'SlTI': 'SITI',
+    'DEW1': 'DEWI', 'DEWl': 'DEWI', 'D3WI': 'DEWI',
+    'NUR': 'NUR', 'NUH': 'NUR', 'NUB': 'NUR',
+    'SRI': 'SRI', 'SR1': 'SRI', 'SRl': 'SRI',
+    'ANI': 'ANI', 'AN1': 'ANI', 'ANl': 'ANI',
+    'MUHAMAD': 'MUHAMMAD', 'MUHA MAD': 'MUHAMMAD', 'MOHAMAD': 'MUHAMMAD',
+    'MOIIAMMAD': 'MUHAMMAD', 'MUIIAMMAD': 'MUHAMMAD',
+    'AOMAD': 'AHMAD', 'ACMAD': 'AHMAD', 'AHMAO': 'AHMAD',
+    'AGUS': 'AGUS', 'ACUS': 'AGUS', 'AGU5': 'AGUS',
+    'BUDI': 'BUDI', 'BUD1': 'BUDI', 'BUDl': 'BUDI',
+    'RAHMAWAT1': 'RAHMAWATI', 'RAHMAWAT': 'RAHMAWATI',
+    'RAHMAWAN1': 'RAHMAWANI', 'RAHMAWAN': 'RAHMAWANI',
+    'SUGIARTO': 'SUGIARTO', 'SUG1ARTO': 'SUGIARTO',
+    'PRAT1WI': 'PRATIWI', 'PRATlWI': 'PRATIWI',
+    'PERMATA': 'PERMATA', 'PCRMATA': 'PERMATA',
+    'SUSANT1': 'SUSANTI', 'SUSANTl': 'SUSANTI',
+    'YUDH1': 'YUDHI', 'YUDHl': 'YUDHI',
+    'KUSUMO': 'KUSUMO', 'KUSUMA': 'KUSUMA',
+    'WIBOWO': 'WIBOWO', 'W1BOWO': 'WIBOWO',
+    'UTAM1': 'UTAMI', 'UTAMl': 'UTAMI',
+    'SETYAN1': 'SETYANI', 'SETYANl': 'SETYANI',
+    'WIDOD0': 'WIDODO', 'WID0DO': 'WIDODO',
+    'SUHARTO': 'SUHARTO', 'SUHART0': 'SUHARTO',
+    'WAHYUD1': 'WAHYUDI', 'WAHYUDl': 'WAHYUDI',
+    'SUPRI': 'SUPRI', 'SUPH1': 'SUPRI',
+}
+
+# Koreksi karakter umum (setelah koreksi kata)
+NAMA_CHAR_FIXES = {'1': 'I', '0': 'O', '5': 'S'}
+_NAMA_CHAR_TABLE = str.maketrans(NAMA_CHAR_FIXES)
+
+def _trie_regex(words):
+    """
+    Regex alternation berbentuk trie (prefix digabung), mis. PCATI(?:I|WI)?
+    Engine re cukup ikuti 1 cabang per karakter, jadi cepat walau ada 10k+
+    kata; cabang yang lebih panjang dicoba dulu (longest match).
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            # Kata berakhir di sini tapi bisa lebih panjang: greedy, coba yang panjang dulu
+            return ("(?:" + body + ")?") if len(branches) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+class NameNormalizer:
+    """
+    Koreksi typo NAMA yang sudah di-compile: tiap kamus jadi 1 regex trie
+    (yang terpanjang menang), jadi 1 pass per kamus berapapun jumlah koreksi.
+    Urutan pass sama seperti dulu: kamus hardcoded, lalu learned fixes (key-nya
+    nama yang sudah dikoreksi kamus hardcoded), lalu koreksi karakter via
+    tabel str.translate.
+    """
+
+    def __init__(self, learned=None):
+        self.learned = dict(learned or {})
+        # Learned fix menang kalau key-nya sama dengan kamus hardcoded
+        base = {w: r for w, r in {**NAMA_COMMON_FIXES, **NAMA_FIXES_TESTED}.items() if w not in self.learned}
+        self._passes = [
+            (re.compile(_trie_regex(fixes)), fixes)
+            for fixes in (base, {w: r for w, r in self.learned.items() if w})
+            if fixes
+        ]
+        self._char_table = _NAMA_CHAR_TABLE
+
+    def __call__(self, nama_raw):
+        result = nama_raw
+        for pattern, fixes in self._passes:
+            result = pattern.sub(lambda m: fixes[m.group(0)], result)
+        return result.translate(self._char_table).strip()
+
+@functools.lru_cache(maxsize=8)
+def _build_name_normalizer(learned_items):
+    return NameNormalizer(dict(learned_items))
+
+# Normalizer per version FixSnapshot (snapshot hasil unpickle / object baru
+# dengan version sama tidak di-compile ulang)
+NORMALIZER_CACHE_SIZE = 8
+_VERSION_NORMALIZERS = {}
+
+def _snapshot_normalizer(snapshot):
+    normalizer = _VERSION_NORMALIZERS.get(snapshot.version)
+    # Version sama tapi isi beda (store lain di proses yang sama): compile sendiri
+    if normalizer is None or normalizer.learned != snapshot.fixes:
+        normalizer = _build_name_normalizer(frozenset(snapshot.items()))
+        if len(_VERSION_NORMALIZERS) >= NORMALIZER_CACHE_SIZE:
+            _VERSION_NORMALIZERS.pop(next(iter(_VERSION_NORMALIZERS), None), None)
+        _VERSION_NORMALIZERS[snapshot.version] = normalizer
+    return normalizer
+
+def get_name_normalizer(learned_fixes=None):
+    """Normalizer untuk set learned_fixes ini (di-compile ulang hanya kalau isinya berubah)"""
+    if isinstance(learned_fixes, FixSnapshot):
+        # Snapshot immutable: compile sekali per version, dibaca tanpa lock
+        normalizer = learned_fixes.normalizer
+        if normalizer is None:
+            normalizer = learned_fixes.normalizer = _snapshot_normalizer(learned_fixes)
+        return normalizer
+    return _build_name_normalizer(frozenset((learned_fixes or {}).items()))
+
+def fix_nama_typo(nama_raw, learned_fixes=None):
+    if not nama_raw: return ""
+    return get_name_normalizer(learned_fixes)(nama_raw)
+
+# --- INDEX LABEL OCR ---
+# Label KTP & form, di-compile sekali (dulu di-compile ulang tiap baris)
+LABEL_PATTERNS = {
+    "NIK": re.compile(r'\bNIK\b', re.IGNORECASE),
+    "NAMA": re.compile(r'\bnama\b|namà', re.IGNORECASE),
+    "NAMA_LENGKAP": re.compile(r'nama\s*lengkap\s*:', re.IGNORECASE),
+    "NAMA_IBU": re.compile(r'nama\s*ibu\s*kandung|nama\s*gadis\s*ibu', re.IGNORECASE),
+    "NO_HP": re.compile(r'no\s*\.?\s*hp|no\s*\.?\s*telp|telepon|handphone', re.IGNORECASE),
+    "EMAIL": re.compile(r'email|e-mail|e\s*mail', re.IGNORECASE),
+    "LAHIR": re.compile(r'lahir', re.IGNORECASE),
+}
+# Prefilter: baris tanpa salah satu kata ini pasti bukan label
+_ANY_LABEL = re.compile(r'nik|nam|no|tel|hand|mail|lahir', re.IGNORECASE)
+_FEMALE_RE = re.compile(r'PEREMPUAN|WANITA')
+_MALE_RE = re.compile(r'LAKI')
+
+# Blacklist kata yang BUKAN nama
+NAMA_BLACKLIST = (
+    "PROVINSI", "KABUPATEN", "KOTA", "NIK", "NAMA", "LAHIR", "DARAH", 
+    "ALAMAT", "RT/RW", "KEL/DESA", "KECAMATAN", "AGAMA", "KAWIN", 
+    "PEKERJAAN", "ISLAM", "KRISTEN", "KATOLIK", "HINDU", "BUDDHA", "KONGHUCU",
+    "WNI", "BELUM", "STATUS", "PERKAWINAN", "PERKAWNAN", "BERLAKU", 
+    "HINGGA", "SEUMUR", "HIDUP", "TANGGAL", "TEMPAT", "JENIS", "KELAMIN", 
+    "GOLONGAN", "GOLAN", "KEWARGANEGARAAN", "WARGA", "NEGARA", "REPUBLIK", 
+    "INDONESIA", "SIDOARJO", "SURABAYA", "MOJOKERTO", "MALANG", "GRESIK",
+    "PASURUAN", "PROBOLINGGO", "JAWA", "TIMUR", "BARAT", "SELATAN", "UTARA", 
+    "TENGAH", "KARYAWAN", "SWASTA", "PEDAGANG", "PETANI", "BURUH", "PNS", 
+    "TNI", "POLRI", "MENGURUS", "RUMAH", "TANGGA", "PELAJAR", "MAHASISWA",
+    "WIRASWASTA", "WIRAUSAHA"
+)
+# Semua kata blacklist dalam 1 regex trie: 1 scan per kandidat (tetap cocok
+# sebagai substring, sama seperti `word in cleaned`)
+_BLACKLIST_RE = re.compile(_trie_regex(NAMA_BLACKLIST))
+
+_NON_NAME_CHARS = re.compile(r'[^A-Z\s]')
+_EMAIL_RE = re.compile(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', re.IGNORECASE)
+_LABELED_EMAIL_RE = re.compile(r':\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', re.IGNORECASE)
+_AFTER_COLON_RE = re.compile(r':\s*(.+)')
+_LABELED_HP_RE = re.compile(r':\s*([0-9\s\-\+]+)')
+_NAMA_LENGKAP_VALUE_RE = re.compile(r'nama\s*lengkap\s*:\s*(.+)', re.IGNORECASE)
+
+class OcrTextIndex:
+    """
+    Hasil OCR yang sudah di-tokenize 1x: versi uppercase, digit saja, huruf
+    saja per baris, plus posisi baris tiap label (labels["NIK"] = [i, ...]).
+    Semua extractor baca dari sini, jadi text_list tidak di-scan berulang.
+    """
+
+    def __init__(self, text_list):
+        self.lines = [t.strip() for t in text_list]
+        self.upper = [t.upper() for t in self.lines]
+        self.digits = [_NON_DIGIT.sub('', t) for t in self.lines]
+        self.alpha = [_NON_NAME_CHARS.sub('', t).strip() for t in self.upper]
+        self.labels = {name: [] for name in LABEL_PATTERNS}
+        for i, text in enumerate(self.lines):
+            if not _ANY_LABEL.search(text):
+                continue
+            for name, pattern in LABEL_PATTERNS.items():
+                if pattern.search(text):
+                    self.labels[name].append(i)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def birth_info(self):
+        """
+        Tanggal lahir & jenis kelamin hasil OCR, untuk cross-check NIK
+        Returns: ((hari, bulan, tahun) atau None, True/False/None perempuan)
+        """
+        birth_date = None
+        for i in self.labels["LAHIR"]:
+            for j in range(i, min(i + 3, len(self))):
+                birth_date = parse_birth_date(self.lines[j])
+                if birth_date:
+                    break
+            if birth_date:
+                break
+        female = None
+        for text in self.upper:
+            if _FEMALE_RE.search(text):
+                female = True
+                break
+            if _MALE_RE.search(text):
+                female = False
+                break
+        return birth_date, female
+
+def _as_index(text_list):
+    return text_list if isinstance(text_list, OcrTextIndex) else OcrTextIndex(text_list)
+
+# NIK dengan confidence struktur di bawah ini dianggap gagal (memicu retry)
+NIK_MIN_CONFIDENCE = 0.6
+
+def best_nik_in_text(text, birth_date=None, female=None, nums=None):
+    """
+    Kandidat NIK terbaik dalam 1 teks: semua window 16 digit dari angka asli
+    dan dari koreksi huruf -> angka (clean_nik_advanced, dikurangi skor per
+    huruf yang dikoreksi).
+    Returns: (nik, skor) atau ("", None)
+    """
+    nums = _NON_DIGIT.sub('', text) if nums is None else nums
+    sources = [(nums, 0.0)]
+    cleaned = clean_nik_advanced(text)
+    if cleaned != nums:
+        sources.append((cleaned, 0.5 * (len(cleaned) - len(nums))))
+    
+    best, best_score = "", None
+    for digits, penalty in sources:
+        candidates = nik_windows(digits)
+        if not candidates and len(digits) > 16:
+            # Deretan angka kepanjangan (tergabung teks lain): ambil awalnya saja
+            candidates = [digits[:16]]
+            penalty += 1
+        for extra, candidate in enumerate(candidates):
+            # Potongan dari deretan yang lebih panjang sedikit kurang meyakinkan
+            score = score_nik(candidate, birth_date, female) - penalty - 0.25 * (len(digits) - 16)
+            if best_score is None or score > best_score:
+                best, best_score = candidate, score
+    return best, best_score
+
+def extract_nik_scored(text_list):
+    """
+    Semua kandidat NIK di-skor berdasarkan struktur (kode wilayah, tanggal
+    lahir DDMMYY, nomor urut) + cocok tidaknya dengan tanggal lahir & jenis
+    kelamin hasil OCR. Baris dekat label "NIK" dapat bonus.
+    Returns: (nik, confidence 0..1) atau ("", 0.0)
+    """
+    idx = _as_index(text_list)
+    birth_date, female = idx.birth_info()
+    near_label = {j for i in idx.labels["NIK"] for j in range(i, min(i + 5, len(idx)))}
+    
+    best, best_score = "", None
+    for j, text in enumerate(idx.lines):
+        nums = idx.digits[j]
+        # Koreksi huruf -> angka hanya untuk baris yang memang banyak angkanya
+        if len(nums) < 8 and j not in near_label:
+            continue
+        candidate, score = best_nik_in_text(text, birth_date, female, nums)
+        if score is None:
+            continue
+        if j in near_label:
+            score += 1
+        if best_score is None or score > best_score:
+            best, best_score = candidate, score
+    
+    if not best:
+        return "", 0.0
+    return best, round(nik_confidence(best, birth_date, female), 2)
+
+def extract_nik(text_list):
+    """Extract NIK 16 digit (text_list: list baris OCR atau OcrTextIndex)"""
+    return extract_nik_scored(text_list)[0]
+
+def _clean_name(text):
+    return _NON_NAME_CHARS.sub('', text.upper()).strip()
+
+def extract_form_data(text_list):
+    """
+    Extract data tambahan dari form text di bawah KTP
+    (nama lengkap, nama ibu kandung, no HP, email)
+    Kalau label muncul berkali-kali, yang terakhir dipakai.
+    Returns: dict with extracted data
+    """
+    form_data = {
+        "NAMA_FORM": "",
+        "NAMA_IBU": "",
+        "NO_HP": "",
+        "EMAIL": ""
+    }
+    
+    try:
+        idx = _as_index(text_list)
+        n = len(idx)
+        
+        # Extract NAMA LENGKAP dari form (setelah ":" atau di baris berikutnya)
+        for i in reversed(idx.labels["NAMA_LENGKAP"]):
+            match = _NAMA_LENGKAP_VALUE_RE.search(idx.lines[i])
+            nama = _clean_name(match.group(1)) if match else (idx.alpha[i + 1] if i + 1 < n else "")
+            if len(nama) > 5:
+                form_data["NAMA_FORM"] = nama
+                break
+        
+        # Extract NAMA IBU KANDUNG
+        for i in reversed(idx.labels["NAMA_IBU"]):
+            match = _AFTER_COLON_RE.search(idx.lines[i])
+            nama_ibu = _clean_name(match.group(1)) if match else (idx.alpha[i + 1] if i + 1 < n else "")
+            if len(nama_ibu) > 3:
+                form_data["NAMA_IBU"] = nama_ibu
+                break
+        
+        # Extract NO HP / NO TELP (08xxx atau 62xxx, 10-15 digit)
+        for i in reversed(idx.labels["NO_HP"]):
+            match = _LABELED_HP_RE.search(idx.lines[i])
+            if match:
+                hp = _NON_DIGIT.sub('', match.group(1))
+                if 10 <= len(hp) <= 15:
+                    form_data["NO_HP"] = hp
+                    break
+            else:
+                # Atau cari di baris yang sama/berikutnya
+                found = next((
+                    nums for nums in idx.digits[i:i + 2]
+                    if 10 <= len(nums) <= 15 and nums.startswith(('08', '62'))
+                ), None)
+                if found:
+                    form_data["NO_HP"] = found
+                    break
+        
+        # Extract EMAIL setelah label (baris sama atau berikutnya)
+        for i in reversed(idx.labels["EMAIL"]):
+            match = _LABELED_EMAIL_RE.search(idx.lines[i])
+            if not match and i + 1 < n:
+                match = _EMAIL_RE.search(idx.lines[i + 1])
+            if match:
+                form_data["EMAIL"] = match.group(1).lower()
+                break
+        
+        # Cari email pattern di semua text (tanpa label)
+        if not form_data["EMAIL"]:
+            for text in idx.lines:
+                if "@" in text:
+                    match = _EMAIL_RE.search(text)
+                    if match:
+                        form_data["EMAIL"] = match.group(1).lower()
+                        break
+        
+        return form_data
+        
+    except Exception as e:
+        return form_data
+
+def extract_nama(text_list, learned_fixes=None):
+    """Extract nama dengan filtering sederhana tapi efektif"""
+    idx = _as_index(text_list)
+    
+    # STRATEGI 1: Cari setelah label "Nama"
+    for i in idx.labels["NAMA"]:
+        for j in range(i + 1, min(i + 3, len(idx))):
+            cleaned = idx.alpha[j]
+            
+            # Basic filters
+            if len(cleaned) < 5 or len(cleaned) > 50:
+                continue
+            if not ' ' in cleaned:  # Harus ada spasi
+                continue
+            if _BLACKLIST_RE.search(cleaned):
+                continue
+            
+            # Check angka di original text
+            if len(idx.digits[j]) > 3:
+                continue
+            
+            return fix_nama_typo(cleaned, learned_fixes)
+    
+    # STRATEGI 2: Cari text yang kayak nama (panjang & ada spasi)
+    candidates = []
+    for j, cleaned in enumerate(idx.alpha):
+        # Filter basic
+        if len(cleaned) < 10 or len(cleaned) > 50:
+            continue
+        
+        words = cleaned.split()
+        if len(words) < 2 or len(words) > 5:
+            continue
+        
+        # Skip blacklist
+        if _BLACKLIST_RE.search(cleaned):
+            continue
+        
+        # Skip jika ada kata yang terlalu panjang
+        if any(len(word) > 20 for word in words):
+            continue
+        
+        # Check digit count
+        if len(idx.digits[j]) > 3:
+            continue
+        
+        candidates.append(cleaned)
+    
+    # Return yang terpanjang
+    if candidates:
+        return fix_nama_typo(max(candidates, key=len), learned_fixes)
+    
+    return ""
+
+def extract_fields(text_list, learned_fixes=None):
+    """
+    Tokenize hasil OCR sekali, lalu extract semua field dari index yang sama
+    Returns: (nama, nik, form_data)
+    """
+    idx = OcrTextIndex(text_list)
+    return extract_nama(idx, learned_fixes), extract_nik(idx), extract_form_data(idx)
+
+# --- ROI OCR (TEMPLATE LAYOUT e-KTP) ---
+# Baca hanya baris NIK & Nama tanpa text detection (CRAFT).
+# Kolom nilai (setelah label "NIK :" / "Nama :") sebagai fraksi lebar/tinggi kartu,
+# diukur dari layout standar e-KTP 85.6 x 54 mm: (x1, y1, x2, y2)
+KTP_ROI_TEMPLATE = {
+    "NIK": (0.20, 0.15, 0.74, 0.27),
+    "NAMA": (0.20, 0.26, 0.74, 0.35),
+}
+ROI_ALLOWLIST = {
+    "NIK": "0123456789",
+    "NAMA": "ABCDEFGHIJKLMNOPQRSTUVWXYZ '.,-",
+}
+# Confidence minimal hasil ROI, di bawah ini fallback ke full-card readtext
+ROI_MIN_CONFIDENCE = 0.5
+# KTP_ROI_OCR=0 untuk selalu pakai full-card OCR
+ROI_OCR = os.environ.get("KTP_ROI_OCR", "1") != "0"
+
+def is_card_aspect(w, h):
+    """Rasio w x h seperti 1 kartu KTP landscape?"""
+    return h > 0 and 1.4 <= w / h <= 1.8
+
+def is_card_layout(image):
+    """Gambar sudah berupa 1 kartu landscape (bukan screenshot / form)?"""
+    h, w = image.shape[:2]
+    return is_card_aspect(w, h)
+
+def read_ktp_roi(processed, reader):
+    """
+    Recognize baris NIK & Nama di posisi template (tanpa detector).
+    Returns: list [box, text, confidence] berformat sama dengan readtext
+    (label "NIK"/"Nama" disisipkan sebelum nilainya supaya extractor tetap sama),
+    atau None kalau hasilnya meragukan (caller fallback ke full-card OCR)
+    """
+    h, w = processed.shape[:2]
+    ocr_results = []
+    
+    for field, label in (("NIK", "NIK"), ("NAMA", "Nama")):
+        x1, y1, x2, y2 = KTP_ROI_TEMPLATE[field]
+        box = [int(x1 * w), int(x2 * w), int(y1 * h), int(y2 * h)]
+        results = reader.recognize(
+            processed,
+            horizontal_list=[box],
+            free_list=[],
+            allowlist=ROI_ALLOWLIST[field],
+            detail=1
+        )
+        if not results:
+            return None
+        
+        # 1 box = 1 hasil, ambil yang confidence tertinggi kalau ada lebih
+        _, text, conf = max(results, key=lambda r: r[2])
+        text = str(text).strip()
+        conf = float(conf)
+        
+        if conf < ROI_MIN_CONFIDENCE:
+            return None
+        if field == "NIK" and len(re.sub(r'[^0-9]', '', text)) != 16:
+            return None
+        if field == "NAMA" and len(re.sub(r'[^A-Za-z]', '', text)) < 3:
+            return None
+        
+        quad = [[float(box[0]), float(box[2])], [float(box[1]), float(box[2])],
+                [float(box[1]), float(box[3])], [float(box[0]), float(box[3])]]
+        ocr_results.append([quad, label, 1.0])
+        ocr_results.append([quad, text, conf])
+    
+    return ocr_results
+
+# --- EKSTRAKSI BERBASIS LAYOUT (BOX + CONFIDENCE) ---
+# KTP_LAYOUT_EXTRACT=0 untuk pakai ekstraksi berbasis teks saja
+LAYOUT_EXTRACTION = os.environ.get("KTP_LAYOUT_EXTRACT", "1") != "0"
+# Field dengan confidence di bawah ini di-OCR ulang (hanya box nilainya)
+LAYOUT_REFINE_CONFIDENCE = 0.6
+# Minimal overlap vertikal (fraksi tinggi box terkecil) supaya dianggap 1 baris
+ROW_OVERLAP = 0.5
+
+class OcrLayout:
+    """
+    Hasil readtext dalam array numpy: boxes (N, 4) float32 [x1, y1, x2, y2]
+    (bounding box sumbu-sejajar dari quad), conf (N,) float32, texts list.
+    """
+    __slots__ = ("texts", "boxes", "conf")
+
+    def __init__(self, ocr_results):
+        self.texts = [str(r[1]).strip() for r in ocr_results]
+        if ocr_results:
+            quads = np.asarray([r[0] for r in ocr_results], dtype=np.float32).reshape(len(ocr_results), -1, 2)
+            self.boxes = np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1)
+        else:
+            # readtext kosong (foto polos / gagal baca)
+            self.boxes = np.zeros((0, 4), np.float32)
+        self.conf = np.asarray([r[2] for r in ocr_results], dtype=np.float32)
+
+    def row_right_of(self, i):
+        """Index box di baris yang sama dengan box i dan di kanannya (urut x)"""
+        b = self.boxes
+        top = np.maximum(b[:, 1], b[i, 1])
+        bottom = np.minimum(b[:, 3], b[i, 3])
+        heights = np.minimum(b[:, 3] - b[:, 1], b[i, 3] - b[i, 1])
+        same_row = (bottom - top) > ROW_OVERLAP * np.maximum(heights, 1)
+        # Box nilai bisa sama persis dengan box label (hasil ROI), jadi pakai x1 >= x1 label
+        right = b[:, 0] >= b[i, 0] - 1
+        mask = same_row & right
+        mask[i] = False
+        candidates = np.nonzero(mask)[0]
+        return candidates[np.argsort(b[candidates, 0], kind="stable")]
+
+def _text_after_label(text, pattern):
+    match = pattern.search(text)
+    return text[match.end():].lstrip(" :") if match else text
+
+def _layout_candidates(layout, pattern, exclude=None):
+    """
+    Kandidat nilai tiap label: sisa teks di box label + semua box di kanannya
+    Yields: (teks gabungan, confidence terendah, index box nilai)
+    index box label ikut di members kalau nilainya 1 box dengan label
+    """
+    for i, text in enumerate(layout.texts):
+        if not pattern.search(text) or (exclude is not None and exclude.search(text)):
+            continue
+        row = layout.row_right_of(i)
+        # Pasangan label + nilai dengan box identik (ROI / retry): nilainya pasti box itu
+        paired = [j for j in row if np.allclose(layout.boxes[j], layout.boxes[i])]
+        if paired:
+            row = paired[-1:]
+        parts, members = [], []
+        inline = _text_after_label(text, pattern)
+        if inline:
+            parts.append(inline)
+            members.append(i)
+        for j in row:
+            value = layout.texts[j].lstrip(" :")
+            if value and not pattern.search(value):
+                parts.append(value)
+                members.append(int(j))
+        if members:
+            yield " ".join(parts), float(layout.conf[members].min()), members
+
+def layout_fields(ocr_results, learned_fixes=None, normalize=True, birth_info=(None, None)):
+    """
+    Cocokkan label ke nilai berdasarkan posisi (nilai di kanan "NIK :" /
+    "Nama :"), ambil kandidat valid dengan confidence tertinggi.
+    normalize=False: nilai mentah (tanpa koreksi typo nama), untuk refine
+    birth_info: (tanggal lahir, perempuan) dari OcrTextIndex.birth_info untuk skor NIK
+    Returns: {"NIK": (nilai, conf, members), "NAMA": (...)} - field yang ketemu saja
+    """
+    layout = OcrLayout(ocr_results)
+    found = {}
+    
+    best, best_rank = None, None
+    for text, conf, members in _layout_candidates(layout, LABEL_PATTERNS["NIK"]):
+        nik, score = best_nik_in_text(text, *birth_info)
+        # Struktur NIK dulu, confidence OCR sebagai penentu kalau skornya sama
+        if score is not None and (best_rank is None or (score, conf) > best_rank):
+            best, best_rank = (nik, conf, members), (score, conf)
+    if best:
+        found["NIK"] = best
+    
+    best = None
+    for text, conf, members in _layout_candidates(layout, LABEL_PATTERNS["NAMA"],
+                                                  exclude=LABEL_PATTERNS["NAMA_IBU"]):
+        # Angka di tengah nama (SANT0SO) dikoreksi dulu, bukan dibuang
+        cleaned = _clean_name(text.translate(_NAMA_CHAR_TABLE))
+        if len(cleaned.replace(" ", "")) < 3 or _BLACKLIST_RE.search(cleaned):
+            continue
+        if best is None or conf > best[1]:
+            best = (cleaned, conf, members)
+    if best:
+        value, conf, members = best
+        found["NAMA"] = (fix_nama_typo(value, learned_fixes) if normalize else value, conf, members)
+    
+    return found
+
+def ocr_target_width(w, h):
+    """Lebar input OCR: lebih kecil untuk file besar (hemat memory)"""
+    # Kartu hasil koreksi perspektif sudah di ukuran tetap, tidak di-resize lagi
+    if (w, h) == RECTIFIED_SIZE:
+        return w
+    return 1200 if (w > 2000 or h > 1500) else 1500
+
+def refine_low_confidence_fields(ocr_results, img, reader):
+    """
+    Pass kedua hanya untuk field yang confidence-nya rendah: recognize ulang
+    gabungan box nilainya di gambar kartu resolusi asli (tanpa blur) dengan
+    allowlist field. ocr_results di-update in-place kalau hasilnya lebih yakin.
+    Returns: jumlah field yang diperbaiki
+    """
+    h, w = img.shape[:2]
+    scale = w / ocr_target_width(w, h)
+    gray = None
+    refined = 0
+    
+    for field, (value, conf, members) in layout_fields(ocr_results, normalize=False).items():
+        # Nilai yang 1 box dengan labelnya tidak bisa di-crop terpisah
+        if conf >= LAYOUT_REFINE_CONFIDENCE or LABEL_PATTERNS[field].search(ocr_results[members[0]][1]):
+            continue
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        
+        quads = np.asarray([ocr_results[m][0] for m in members], dtype=np.float32).reshape(-1, 2) * scale
+        x1, y1 = np.floor(quads.min(axis=0)).astype(int)
+        x2, y2 = np.ceil(quads.max(axis=0)).astype(int)
+        pad = max(2, int((y2 - y1) * 0.15))
+        box = [int(max(0, x1 - pad)), int(min(w, x2 + pad)), int(max(0, y1 - pad)), int(min(h, y2 + pad))]
+        
+        results = reader.recognize(gray, horizontal_list=[box], free_list=[],
+                                   allowlist=ROI_ALLOWLIST[field], detail=1)
+        if not results:
+            continue
+        _, text, new_conf = max(results, key=lambda r: r[2])
+        text, new_conf = str(text).strip(), float(new_conf)
+        if new_conf <= conf or not text:
+            continue
+        if field == "NIK" and len(_NON_DIGIT.sub('', text)) != 16:
+            continue
+        
+        # Box pertama dapat teks baru, sisanya dikosongkan (sudah tergabung)
+        first, *rest = members
+        ocr_results[first][1] = text
+        ocr_results[first][2] = new_conf
+        for m in rest:
+            ocr_results[m][1] = ""
+        refined += 1
+    
+    return refined
+
+# --- RETRY BERTINGKAT (PREPROCESSING ALTERNATIF) ---
+# Dulu slider MANUAL (kontras / denoise / threshold), sekarang dicoba otomatis
+# berurutan dari yang paling murah, hanya untuk field yang gagal.
+def _variant_clahe(gray):
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+
+def _variant_sharpen(gray):
+    blurred = cv2.GaussianBlur(gray, (0, 0), 2)
+    return cv2.addWeighted(gray, 1.6, blurred, -0.6, 0)
+
+def _variant_denoise(gray):
+    return cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=15)
+
+def _variant_threshold(gray):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+
+def _variant_upscale(gray):
+    return cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+
+RETRY_VARIANTS = (
+    ("clahe", _variant_clahe),
+    ("sharpen", _variant_sharpen),
+    ("threshold", _variant_threshold),
+    ("denoise", _variant_denoise),
+    ("upscale2x", _variant_upscale),
+)
+# Budget waktu retry per file (ms), KTP_RETRY_BUDGET_MS=0 untuk mematikan
+RETRY_BUDGET_MS = int(os.environ.get("KTP_RETRY_BUDGET_MS", "2000") or 0)
+
+def _field_value_ok(field, text):
+    if field == "NIK":
+        nums = _NON_DIGIT.sub('', text)
+        return len(nums) == 16 and nik_confidence(nums) >= NIK_MIN_CONFIDENCE
+    cleaned = _clean_name(text)
+    return len(cleaned.replace(" ", "")) >= 3 and not _BLACKLIST_RE.search(cleaned)
+
+def _retry_region(ocr_results, field, w, h):
+    """
+    Area yang di-OCR ulang (koordinat input OCR): baris di kanan label kalau
+    labelnya terbaca, kalau tidak posisi template e-KTP (khusus layout kartu)
+    Returns: [x1, x2, y1, y2] atau None
+    """
+    layout = OcrLayout(ocr_results)
+    pattern = LABEL_PATTERNS[field]
+    for i, text in enumerate(layout.texts):
+        if pattern.search(text) and not (field == "NAMA" and LABEL_PATTERNS["NAMA_IBU"].search(text)):
+            x1, y1, x2, y2 = layout.boxes[i]
+            pad = (y2 - y1) * 0.3
+            return [int(x2), int(w), int(max(0, y1 - pad)), int(min(h, y2 + pad))]
+    if is_card_aspect(w, h):
+        x1, y1, x2, y2 = KTP_ROI_TEMPLATE[field]
+        return [int(x1 * w), int(x2 * w), int(y1 * h), int(y2 * h)]
+    return None
+
+def recover_missing_fields(ocr_results, img, reader, fields, budget_ms=RETRY_BUDGET_MS):
+    """
+    Cascade preprocessing untuk field yang gagal (NIK bukan 16 digit / NAMA
+    kosong): tiap variant di-recognize hanya di area field itu, berhenti di
+    variant pertama yang valid atau saat budget waktu habis.
+    Hasil ditambahkan ke ocr_results sebagai pasangan [label, nilai] (format
+    sama dengan ROI), jadi extractor & cache tetap sama.
+    Returns: list (field, nama variant) yang berhasil
+    """
+    if budget_ms <= 0 or not fields:
+        return []
+    import time
+    deadline = time.perf_counter() + budget_ms / 1000
+    
+    h, w = img.shape[:2]
+    ocr_w = ocr_target_width(w, h)
+    scale = w / ocr_w
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    recovered = []
+    
+    for field in fields:
+        region = _retry_region(ocr_results, field, ocr_w, int(h / scale))
+        if region is None or region[1] - region[0] < 10 or region[3] - region[2] < 5:
+            continue
+        x1, x2, y1, y2 = (int(v * scale) for v in region)
+        crop = gray[y1:y2, x1:x2]
+        
+        for name, variant in RETRY_VARIANTS:
+            if time.perf_counter() >= deadline:
+                return recovered
+            processed = variant(crop)
+            ph, pw = processed.shape[:2]
+            results = reader.recognize(processed, horizontal_list=[[0, pw, 0, ph]], free_list=[],
+                                       allowlist=ROI_ALLOWLIST[field], detail=1)
+            if not results:
+                continue
+            _, text, conf = max(results, key=lambda r: r[2])
+            text, conf = str(text).strip(), float(conf)
+            if conf < ROI_MIN_CONFIDENCE or not _field_value_ok(field, text):
+                continue
+            
+            quad = [[float(region[0]), float(region[2])], [float(region[1]), float(region[2])],
+                    [float(region[1]), float(region[3])], [float(region[0]), float(region[3])]]
+            ocr_results.append([quad, "NIK" if field == "NIK" else "Nama", 1.0])
+            ocr_results.append([quad, text, conf])
+            recovered.append((field, name))
+            break
+    
+    return recovered
+
+# --- WARM-UP OCR ---
+def make_warmup_image(width=1500):
+    """KTP sintetis (grayscale, ukuran input OCR) dengan teks di posisi template ROI"""
+    height = int(width / 1.58)
+    img = np.full((height, width), 235, np.uint8)
+    lines = [
+        (0.05, 0.08, "PROVINSI JAWA TIMUR"),
+        (0.05, 0.22, "NIK"),
+        (KTP_ROI_TEMPLATE["NIK"][0] + 0.02, 0.22, "3515011234560001"),
+        (0.05, 0.31, "Nama"),
+        (KTP_ROI_TEMPLATE["NAMA"][0] + 0.02, 0.31, "BUDI SANTOSO"),
+        (0.05, 0.40, "Tempat/Tgl Lahir : SIDOARJO, 01-01-1990"),
+    ]
+    for x, y, text in lines:
+        cv2.putText(img, text, (int(x * width), int(y * height)),
+                    cv2.FONT_HERSHEY_SIMPLEX, width / 1000, 20, 2, cv2.LINE_AA)
+    return cv2.GaussianBlur(img, (5, 5), 0)
+
+def warm_up_reader(reader):
+    """
+    1x inference dummy (detector + recognizer + ROI path) supaya load weight,
+    alokasi memory, dan kernel torch sudah "panas" sebelum scan pertama
+    """
+    img = make_warmup_image()
+    reader.readtext(img)
+    if ROI_OCR:
+        read_ktp_roi(img, reader)
+
+# --- DECODE ---
+# Max width/height sebelum OCR (foto lebih besar di-downscale ke sini)
+MAX_DIMENSION = 2000
+
+# Flag imdecode untuk JPEG reduced-scale (libjpeg DCT scaling 1/2, 1/4, 1/8)
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def decode_image(f_bytes, min_side=MAX_DIMENSION):
+    """
+    Decode foto upload langsung di resolusi kecil kalau bisa.
+    Header dibaca dulu (PIL, tanpa decode pixel); untuk JPEG dipilih skala
+    reduced terkecil yang sisi panjangnya masih >= min_side, jadi detail yang
+    sampai ke OCR sama seperti decode penuh lalu downscale ke MAX_DIMENSION,
+    tapi tanpa alokasi buffer BGR 12MP.
+    Returns: (img BGR atau None, skala reduksi)
+    """
+    nparr = np.frombuffer(f_bytes, np.uint8)
+    
+    try:
+        with Image.open(io.BytesIO(f_bytes)) as header:
+            fmt = header.format
+            w, h = header.size
+    except Exception:
+        fmt, w, h = None, 0, 0
+    
+    if fmt == "JPEG":
+        for scale, flag in _REDUCED_DECODE_FLAGS:
+            if max(w, h) // scale >= min_side:
+                img = cv2.imdecode(nparr, flag)
+                if img is not None:
+                    return img, scale
+                break
+    
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR), 1
+
+# --- WORKER PROCESS ---
+# Naikkan setiap ada perubahan crop/rotate/preprocessing/OCR supaya cache lama tidak dipakai
+PIPELINE_VERSION = "4.7" + ("+roi" if ROI_OCR else "") + ("+layout" if LAYOUT_EXTRACTION else "") + f"+{OCR_BACKEND}"
+
+def pack_card_image(img, orientation_angle, rotation_angle, rectified, decode_scale, card_count):
+    """
+    Kartu ke-2 dst. dari lembar multi-KTP yang sudah di-crop & diluruskan,
+    dikirim ke job kartu itu (PNG lossless, kecil & pickle-friendly)
+    Returns: dict (lihat prepare_card_image card_image)
+    """
+    ok, buf = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, CARD_IMAGE_PNG_COMPRESSION])
+    if not ok:
+        return None
+    return {
+        "image": buf.tobytes(),
+        "orientation_angle": int(orientation_angle),
+        "rotation_angle": float(rotation_angle),
+        "rectified": bool(rectified),
+        "decode_scale": int(decode_scale),
+        "card_count": int(card_count),
+    }
+
+def prepare_card_image(f_bytes, filename, timer=None, card_index=0, card_image=None):
+    """
+    Decode -> crop + orientation + deskew + downscale (1 warp) -> quality
+    Returns: (img BGR yang dilihat OCR, meta, None) atau (None, None, error_dict)
+    timer: StageTimer opsional, durasi tiap stage dicatat di sini
+    card_index: kartu ke-berapa kalau 1 foto berisi beberapa KTP (meta["card_count"])
+    card_image: kartu yang sudah di-crop oleh job kartu pertama (pack_card_image),
+    f_bytes tidak dipakai. Job kartu pertama lembar multi-KTP mengisi
+    meta["card_images"] / error["CARD_IMAGES"]: list card_image kartu 1..N-1
+    """
+    if timer is None:
+        timer = StageTimer()
+    
+    card_images = None
+    if card_image is not None:
+        img = cv2.imdecode(np.frombuffer(card_image["image"], np.uint8), cv2.IMREAD_COLOR)
+        timer.mark("decode", img)
+        if img is None:
+            return None, None, {
+                "error": True,
+                "message": f"❌ Kartu ke-{card_index + 1} tidak ditemukan: {filename}",
+                "FILENAME": filename
+            }
+        was_cropped = True
+        orientation_angle = card_image["orientation_angle"]
+        rotation_angle = card_image["rotation_angle"]
+        rectified = card_image["rectified"]
+        decode_scale = card_image["decode_scale"]
+        card_count = card_image["card_count"]
+    else:
+        img, decode_scale = decode_image(f_bytes)
+        timer.mark("decode", img)
+        
+        if img is None:
+            return None, None, {
+                "error": True,
+                "message": f"❌ Cannot decode image: {filename}",
+                "FILENAME": filename
+            }
+        
+        # STEP 0-2: Crop KTP dari screenshot, portrait -> landscape, koreksi
+        # kemiringan & downscale ke MAX_DIMENSION: 1 edge map kecil, 1 warp
+        # Lembar multi-KTP: kartu lain ikut di-warp di sini (deteksi cukup 1x)
+        other_cards = [] if card_index == 0 else None
+        img, was_cropped, orientation_angle, rotation_angle, rectified, card_count = rectify_card(
+            img, MAX_DIMENSION, timer, card_index, other_cards)
+        if img is None:
+            return None, None, {
+                "error": True,
+                "message": f"❌ Kartu ke-{card_index + 1} tidak ditemukan: {filename}",
+                "FILENAME": filename
+            }
+        if other_cards:
+            card_images = [pack_card_image(*other, decode_scale, card_count) for other in other_cards]
+            timer.mark("split")
+    
+    # VALIDASI KUALITAS FOTO (CRITICAL!)
+    is_valid, quality_msg, warnings = check_image_quality(img)
+    timer.mark("quality", img)
+    
+    if not is_valid:
+        return None, None, {
+            "error": True,
+            "message": f"{filename}: {quality_msg}",
+            "FILENAME": filename,
+            # Kartu lain di foto yang sama tetap diproses
+            "CARD_INDEX": card_index,
+            "CARD_COUNT": card_count,
+            "CARD_IMAGES": card_images
+        }
+    
+    meta = {
+        "quality_msg": quality_msg,
+        "warnings": warnings,
+        "was_cropped": bool(was_cropped),
+        "rectified": bool(rectified),
+        "decode_scale": int(decode_scale),
+        "orientation_angle": int(orientation_angle),
+        "rotation_angle": float(rotation_angle),
+        "card_index": int(card_index),
+        "card_count": int(card_count),
+    }
+    if card_images:
+        meta["card_images"] = card_images
+    return img, meta, None
+
+def read_card_text(img, reader, timer=None, rectified=False):
+    """
+    OCR resize -> grayscale + blur -> readtext (ROI atau full card)
+    rectified: img hasil warp kartu (RECTIFIED_SIZE). ROI template hanya
+    dipakai di sini; foto mentah 16:9 juga lolos cek aspect ratio tapi
+    posisi NIK/Nama-nya tidak sesuai template.
+    Returns: (ocr_results, ocr_mode)
+    ocr_results: list [box, text, confidence] (JSON-friendly, bisa di-cache)
+    """
+    if timer is None:
+        timer = StageTimer()
+    
+    # STEP 3: Resize untuk OCR - OPTIMIZED untuk cloud
+    h, w = img.shape[:2]
+    
+    # Adaptive sizing: lebih kecil untuk file besar
+    target_width = ocr_target_width(w, h)
+    
+    if target_width == w:
+        img_ocr = img
+    else:
+        img_ocr = cv2.resize(img, (target_width, int(h * (target_width/w))), interpolation=cv2.INTER_AREA)
+    timer.mark("ocr_resize", img_ocr)
+    
+    # STEP 4: Preprocessing - SIMPLE IS BETTER!
+    gray = cv2.cvtColor(img_ocr, cv2.COLOR_BGR2GRAY)
+    
+    # Just blur, jangan terlalu banyak processing
+    processed = cv2.GaussianBlur(gray, (5, 5), 0)
+    timer.mark("blur", processed)
+    
+    # Clear intermediate
+    del gray
+    
+    # STEP 5: OCR
+    # 5A: ROI mode - kartu sudah rapi, baca baris NIK & Nama saja
+    ocr_results = None
+    if ROI_OCR and rectified:
+        ocr_results = read_ktp_roi(processed, reader)
+    ocr_mode = "roi" if ocr_results else "full"
+    
+    # 5B: Full-card readtext (fallback kalau ROI gagal / bukan layout kartu)
+    if ocr_results is None:
+        results = reader.readtext(processed)
+        ocr_results = [
+            [[[float(x), float(y)] for x, y in box], str(text), float(conf)]
+            for box, text, conf in results
+        ]
+        del results
+    timer.mark("readtext", processed)
+    
+    # Clear processed image
+    del processed
+    
+    return ocr_results, ocr_mode
+
+# --- PREVIEW THUMBNAIL ---
+# Format preview di kartu UI: "jpeg" (progressive) atau "webp"
+THUMBNAIL_FORMAT = os.environ.get("KTP_THUMBNAIL_FORMAT", "jpeg").strip().lower()
+THUMBNAIL_QUALITY = 90
+_THUMBNAIL_EXECUTOR = None
+
+def make_thumbnail(img, thumbnail_size):
+    """Downscale (INTER_AREA) gambar kartu yang sudah di-crop/rotate ke lebar preview"""
+    h, w = img.shape[:2]
+    if w > thumbnail_size:
+        img = cv2.resize(img, (thumbnail_size, max(1, int(h * thumbnail_size / w))), interpolation=cv2.INTER_AREA)
+    return img
+
+def encode_thumbnail(thumb):
+    """Encode preview ke bytes (WebP atau progressive JPEG)"""
+    if THUMBNAIL_FORMAT == "webp":
+        ok, buf = cv2.imencode('.webp', thumb, [cv2.IMWRITE_WEBP_QUALITY, THUMBNAIL_QUALITY])
+    else:
+        ok, buf = cv2.imencode('.jpg', thumb, [
+            cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY,
+            cv2.IMWRITE_JPEG_PROGRESSIVE, 1,
+        ])
+    return buf.tobytes() if ok else None
+
+def _encode_thumbnail_timed(thumb):
+    # Durasi encode diukur di thread yang menjalankannya (bukan di worker)
+    timer = StageTimer()
+    data = encode_thumbnail(thumb)
+    timer.mark("preview_encode", thumb)
+    return data, timer.samples
+
+def submit_thumbnail(img, thumbnail_size):
+    """
+    Resize sekarang (murah, img besar bisa langsung dibebaskan), encode di
+    background thread selama readtext jalan (cv2 release GIL).
+    Returns: Future (bytes, sample timing stage "preview_encode")
+    """
+    global _THUMBNAIL_EXECUTOR
+    if _THUMBNAIL_EXECUTOR is None:
+        import concurrent.futures
+        _THUMBNAIL_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ktp-thumb")
+    thumb = make_thumbnail(img, thumbnail_size)
+    return _THUMBNAIL_EXECUTOR.submit(_encode_thumbnail_timed, thumb)
+
+def extract_ktp_fields(ocr_results, learned_fixes=None):
+    """
+    Semua field dari hasil readtext: extractor teks (1x tokenize, label index),
+    lalu NIK/Nama dari posisi box menggantikan tebakan teks kalau ketemu
+    Returns: (nama, nik, form_data, confidence struktur NIK)
+    """
+    # Simple text extraction - jangan over-filter!
+    text_list = [r[1].strip() for r in ocr_results if len(r[1].strip()) > 1]
+    idx = OcrTextIndex(text_list)
+    name = extract_nama(idx, learned_fixes)
+    nik, nik_conf = extract_nik_scored(idx)
+    form_data = extract_form_data(idx)
+    
+    # Nilai di kanan label lebih bisa dipercaya dari tebakan teks
+    if LAYOUT_EXTRACTION:
+        birth_info = idx.birth_info()
+        by_layout = layout_fields(ocr_results, learned_fixes, birth_info=birth_info)
+        if "NIK" in by_layout:
+            layout_nik = by_layout["NIK"][0]
+            layout_conf = round(nik_confidence(layout_nik, *birth_info), 2)
+            # Posisi box menang, kecuali strukturnya jelas lebih buruk dari kandidat teks
+            if layout_conf >= nik_conf or layout_conf >= NIK_MIN_CONFIDENCE:
+                nik, nik_conf = layout_nik, layout_conf
+        if "NAMA" in by_layout:
+            name = by_layout["NAMA"][0]
+    return name, nik, form_data, nik_conf
+
+def _attach_cache_key(card_images, cache_key):
+    # Job kartu berikutnya tidak pegang bytes foto asli, key cache ikut dikirim
+    for packed in card_images or ():
+        if packed is not None:
+            packed["cache_key"] = cache_key
+    return card_images
+
+def worker_process(file_item, thumbnail_size, reader, learned_fixes=None, cache=None, card_index=0,
+                   card_image=None):
+    # Timing per stage ikut di result ("STAGE_TIMINGS"), dikumpulkan BatchScanner
+    # 1 foto berisi beberapa KTP: hasil kartu pertama membawa "CARD_COUNT" &
+    # "CARD_IMAGES" (kartu 1..N-1 sudah di-crop), kartu berikutnya di-OCR paralel
+    # oleh BatchScanner (card_index=1..N-1, card_image) tanpa decode & deteksi ulang
+    timer = StageTimer()
+    try:
+        if reader is None:
+            return None
+        
+        # CACHE: foto yang sama (walau beda nama file) tidak di-OCR ulang
+        if card_image is not None:
+            f_bytes = None
+            base_key = card_image.get("cache_key")
+        else:
+            f_bytes = file_item.getvalue()
+            base_key = cache.key_for(f_bytes) if cache is not None else None
+        cache_key = f"{base_key}#{card_index}" if base_key and card_index else base_key
+        cached = cache.get(cache_key) if cache_key else None
+        
+        # Preview dibuat dari gambar yang sama dengan input OCR (1x decode,
+        # sudah di-crop & di-rotate), encode jalan paralel dengan readtext
+        preview_future = None
+        card_images = None
+        
+        if cached:
+            ocr_results, meta = cached["readtext"], cached["meta"]
+            if thumbnail_size:
+                # OCR di-skip, tapi preview tetap butuh kartu yang di-crop/rotate
+                img, fresh_meta, error = prepare_card_image(f_bytes, file_item.name, card_index=card_index,
+                                                            card_image=card_image)
+                if img is not None:
+                    preview_future = submit_thumbnail(img, thumbnail_size)
+                    card_images = fresh_meta.get("card_images")
+                del img
+        else:
+            timer.reset()
+            img, meta, error = prepare_card_image(f_bytes, file_item.name, timer, card_index, card_image)
+            if error:
+                _attach_cache_key(error.get("CARD_IMAGES"), base_key)
+                error["STAGE_TIMINGS"] = timer.samples
+                return error
+            card_images = meta.pop("card_images", None)
+            if thumbnail_size:
+                preview_future = submit_thumbnail(img, thumbnail_size)
+                timer.mark("preview_resize")
+            ocr_results, meta["ocr_mode"] = read_card_text(img, reader, timer, meta["rectified"])
+            if LAYOUT_EXTRACTION:
+                # Pass kedua hanya untuk NIK/Nama yang confidence-nya rendah
+                meta["refined_fields"] = refine_low_confidence_fields(ocr_results, img, reader)
+                timer.mark("refine")
+            
+            # Retry bertingkat hanya kalau NIK / NAMA gagal (early exit, dibatasi waktu)
+            name, nik, _, nik_conf = extract_ktp_fields(ocr_results, learned_fixes)
+            nik_ok = len(nik) == 16 and nik_conf >= NIK_MIN_CONFIDENCE
+            missing = [f for f, ok in (("NIK", nik_ok), ("NAMA", bool(name))) if not ok]
+            if missing:
+                recovered = recover_missing_fields(ocr_results, img, reader, missing)
+                meta["retry_variants"] = [f"{field}:{variant}" for field, variant in recovered]
+                timer.mark("retry")
+            del img
+        del f_bytes
+        timer.reset()
+        
+        # STEP 6: Extract data dari KTP + FORM TEXT (fallback/supplement)
+        # (selalu dihitung ulang dari readtext, supaya learned_fixes terbaru ikut dipakai)
+        extracted_name, extracted_nik, form_data, nik_conf = extract_ktp_fields(ocr_results, learned_fixes)
+        
+        # MERGE DATA: Gunakan form data sebagai fallback atau perbandingan
+        final_name = extracted_name or form_data.get("NAMA_FORM", "")
+        final_nik = extracted_nik
+        final_nama_ibu = form_data.get("NAMA_IBU", "")
+        final_hp = form_data.get("NO_HP", "")
+        final_email = form_data.get("EMAIL", "")
+        
+        # Perbandingan nama (jika ada kedua-duanya)
+        if extracted_name and form_data.get("NAMA_FORM") and extracted_name != form_data["NAMA_FORM"]:
+            # Ada perbedaan - prioritas form (lebih jelas)
+            final_name = form_data["NAMA_FORM"]
+        
+        timer.mark("extract")
+        
+        if cache_key and not cached:
+            cache.put(cache_key, {
+                "readtext": ocr_results,
+                "meta": meta,
+                "fields": {
+                    "NAMA": final_name,
+                    "NOMORIDENTITAS": final_nik,
+                    "NAMA_IBU": final_nama_ibu,
+                    "NO_HP": final_hp,
+                    "EMAIL": final_email
+                }
+            })
+        
+        # VALIDASI HASIL OCR - Tetap simpan foto walaupun gagal!
+        has_error = False
+        error_detail = ""
+        
+        if not final_name and not final_nik:
+            has_error = True
+            error_detail = "Nama & NIK tidak terdeteksi"
+        elif not final_name:
+            has_error = True
+            error_detail = "Nama tidak terdeteksi"
+        elif not final_nik:
+            has_error = True  
+            error_detail = "NIK tidak terdeteksi"
+        
+        # STEP 7: Ambil preview (sudah di-encode di background selama OCR)
+        # thumbnail_size None/0 = tanpa preview (mode headless/CLI)
+        image_data = None
+        if preview_future is not None:
+            image_data, encode_samples = preview_future.result()
+            timer.samples.extend(encode_samples)
+        
+        rotation_info = meta["quality_msg"]
+        if cached:
+            rotation_info += " | Dari cache (OCR di-skip)"
+        if meta.get("ocr_mode") == "roi":
+            rotation_info += " | ROI OCR (NIK & Nama)"
+        if meta.get("retry_variants"):
+            rotation_info += " | Retry preprocessing: " + ", ".join(meta["retry_variants"])
+        if meta.get("refined_fields"):
+            rotation_info += f" | OCR ulang {meta['refined_fields']} field (confidence rendah)"
+        if meta.get("rectified"):
+            rotation_info += " | Kartu diluruskan (perspektif)"
+        elif meta["was_cropped"]:
+            rotation_info += " | Auto-cropped dari screenshot"
+        if meta["warnings"]:
+            rotation_info += " | " + " | ".join(meta["warnings"])
+        card_count = meta.get("card_count", 1)
+        if card_count > 1:
+            rotation_info += f" | Kartu {card_index + 1}/{card_count} dalam 1 foto"
+        if meta["orientation_angle"] != 0:
+            rotation_info += f" | Rotated {meta['orientation_angle']}°"
+        if meta["rotation_angle"] != 0:
+            rotation_info += f" | Adjusted {meta['rotation_angle']:.1f}°"
+        if final_nik and nik_conf < NIK_MIN_CONFIDENCE:
+            rotation_info += f" | ⚠️ NIK meragukan (struktur {nik_conf:.0%}), cek manual"
+        
+        # Return data dengan flag error (tapi tetap ada foto!)
+        return {
+            "error": has_error,
+            "error_detail": error_detail if has_error else None,
+            "IMAGE_DATA": image_data,
+            "NAMA": final_name,
+            "NOMORIDENTITAS": final_nik,
+            "NIK_CONFIDENCE": nik_conf,
+            "NAMA_IBU": final_nama_ibu,  # NEW!
+            "NO_HP": final_hp,            # NEW!
+            "EMAIL": final_email,         # NEW!
+            "FILENAME": file_item.name,
+            "CARD_INDEX": card_index,
+            "CARD_COUNT": card_count,
+            "CARD_IMAGES": _attach_cache_key(card_images, base_key),
+            "ROTATION_INFO": rotation_info,
+            "STAGE_TIMINGS": timer.samples
+        }
+    except Exception as e:
+        return {
+            "error": True,
+            "message": f"❌ Error processing {file_item.name}: {str(e)}",
+            "FILENAME": file_item.name,
+            "STAGE_TIMINGS": timer.samples
+        }
+
+def result_to_record(res, ktp_id):
+    """Konversi hasil worker_process ke baris data_db (format UI & export)"""
+    return {
+        "KTP_ID": ktp_id,
+        "IMAGE_DATA": res.get("IMAGE_DATA"),
+        "NAMA": res.get("NAMA", ""),
+        "NOMORIDENTITAS": res.get("NOMORIDENTITAS", ""),
+        "NAMA GADIS IBU": res.get("NAMA_IBU", ""),  # Auto-fill dari form!
+        "CIF NO": "",
+        "NO HP": res.get("NO_HP", ""),              # Auto-fill dari form!
+        "EMAIL": res.get("EMAIL", ""),              # Auto-fill dari form!
+        # Alasan OCR tidak lengkap (filter "kartu error" di UI, kolom CLI)
+        "KETERANGAN": res.get("error_detail") or "",
+        # Sumber halaman dokumen (PDF/TIFF), kosong untuk foto biasa
+        "SUMBER": res.get("SOURCE_FILE", ""),
+        "HALAMAN": res.get("PAGE") or ""
+    }
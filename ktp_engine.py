@@ -0,0 +1,357 @@
+"""
+Batch scanning engine KTP Scanner.
+Menjalankan worker_process secara paralel dengan worker pool yang dibatasi
+(jumlah worker + memory budget), hasil di-stream begitu tiap file selesai.
+"""
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+from ktp_core import warm_up_reader, worker_process
+from ktp_fixes import FixSnapshot
+from ktp_metrics import StageMetrics
+from ktp_ocr import create_reader
+
+# Estimasi RAM (MB) untuk 1 instance EasyOCR ['id', 'en'] + runtime torch
+OCR_MODEL_MB = 400
+# Estimasi RAM (MB) per file yang sedang diproses (decode 12MP + intermediate OCR)
+PER_FILE_MB = 120
+
+
+class ScanItem:
+    """File ringan (nama + bytes) yang bisa dikirim ke worker process"""
+    __slots__ = ("name", "data")
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+def available_memory_mb():
+    """Batas RAM container (cgroup) atau RAM fisik, dalam MB"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as fh:
+                raw = fh.read().strip()
+            if raw.isdigit() and int(raw) < (1 << 50):
+                return int(raw) // (1024 * 1024)
+        except OSError:
+            continue
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def plan_workers(max_workers=None, memory_budget_mb=None, use_processes=None):
+    """
+    Tentukan mode pool & jumlah worker dari jumlah core dan memory budget.
+    Process pool butuh 1 model OCR per worker, thread pool share 1 model.
+    Returns: (use_processes, workers)
+    """
+    cpu = os.cpu_count() or 1
+    workers = max(1, max_workers or cpu)
+
+    if memory_budget_mb is None:
+        total = available_memory_mb()
+        # Sisakan 25% untuk Streamlit, pandas, dan session state
+        memory_budget_mb = int(total * 0.75) if total else None
+
+    if memory_budget_mb is not None:
+        proc_fit = memory_budget_mb // (OCR_MODEL_MB + PER_FILE_MB)
+        thread_fit = max(1, (memory_budget_mb - OCR_MODEL_MB) // PER_FILE_MB)
+    else:
+        proc_fit = workers
+        thread_fit = workers
+
+    if use_processes is None:
+        # Process pool hanya worth it kalau minimal 2 model muat di RAM
+        use_processes = proc_fit >= 2 and workers >= 2
+
+    if use_processes:
+        workers = max(1, min(workers, proc_fit))
+    else:
+        workers = max(1, min(workers, thread_fit))
+
+    return use_processes, workers
+
+
+# --- WORKER PROCESS STATE ---
+_WORKER_READER = None
+# FixSnapshot terakhir yang diterima worker (dari initializer / task yang membawanya)
+_WORKER_FIXES = None
+
+
+def _init_worker(torch_threads, learned_fixes=None):
+    """Initializer tiap worker process: bagi core & load model OCR sekali
+    (torch / onnxruntime intra-op thread = jatah core per worker).
+    learned_fixes: FixSnapshot saat pool dibuat, task cukup membawa version-nya"""
+    global _WORKER_READER, _WORKER_FIXES
+    _WORKER_FIXES = learned_fixes
+    try:
+        import cv2
+        cv2.setNumThreads(torch_threads)
+    except Exception:
+        pass
+    try:
+        _WORKER_READER = create_reader(threads=torch_threads)
+        warm_up_reader(_WORKER_READER)
+    except Exception:
+        _WORKER_READER = None
+
+
+def _worker_ready():
+    return _WORKER_READER is not None
+
+
+def _process_in_worker(item, thumbnail_size, fixes_version, cache, card_index=0, card_image=None,
+                       learned_fixes=None):
+    """
+    fixes_version: version FixSnapshot yang harus dipakai (None = pakai learned_fixes apa adanya).
+    Snapshot hanya ikut dikirim kalau worker belum punya version itu; kalau version
+    worker beda, task dikembalikan sebagai STALE_FIXES dan di-submit ulang oleh scan()
+    """
+    global _WORKER_FIXES
+    if _WORKER_READER is None:
+        return {
+            "error": True,
+            "message": f"❌ OCR engine gagal dimuat di worker: {item.name}",
+            "FILENAME": item.name
+        }
+    if fixes_version is not None:
+        if learned_fixes is not None:
+            _WORKER_FIXES = learned_fixes
+        learned_fixes = _WORKER_FIXES
+        if learned_fixes is None or learned_fixes.version != fixes_version:
+            return {"STALE_FIXES": True, "FILENAME": item.name}
+    return worker_process(item, thumbnail_size, _WORKER_READER, learned_fixes, cache, card_index, card_image)
+
+
+class BatchScanner:
+    """
+    Worker pool untuk scan banyak KTP sekaligus.
+
+    - Process pool: tiap worker punya model OCR sendiri, core dibagi rata
+    - Thread pool: fallback untuk RAM kecil, share 1 reader (torch & OpenCV
+      release GIL saat compute)
+    Jumlah file in-flight dibatasi supaya bytes upload tidak semua di-copy
+    ke queue pool sekaligus.
+    Foto berisi beberapa KTP (lembar scan): hasil kartu pertama membawa
+    CARD_COUNT & CARD_IMAGES (kartu sisanya sudah di-crop), kartu sisanya
+    di-submit sebagai job terpisah (OCR paralel) tanpa decode & deteksi ulang.
+    Timing per stage dari tiap worker dikumpulkan di self.metrics.
+    """
+
+    def __init__(self, max_workers=None, memory_budget_mb=None, use_processes=None, metrics=None):
+        self.use_processes, self.workers = plan_workers(max_workers, memory_budget_mb, use_processes)
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Config dari env: KTP_MAX_WORKERS, KTP_MEMORY_BUDGET_MB, KTP_POOL (process/thread),
+        KTP_METRICS_WINDOW / KTP_METRICS_LOG (lihat StageMetrics.from_env)"""
+        def _int_env(name):
+            value = os.environ.get(name, "").strip()
+            return int(value) if value.isdigit() else None
+
+        pool = os.environ.get("KTP_POOL", "").strip().lower()
+        use_processes = {"process": True, "thread": False}.get(pool)
+        return cls(_int_env("KTP_MAX_WORKERS"), _int_env("KTP_MEMORY_BUDGET_MB"), use_processes,
+                   StageMetrics.from_env())
+
+    def warm_up(self):
+        """
+        Mode process: spawn semua worker sekarang (load model + warm-up di
+        initializer) supaya scan pertama tidak menunggu model.
+        Returns: True kalau semua worker siap
+        """
+        if not self.use_processes:
+            return True
+        executor = self._get_executor()
+        # Submit sekaligus: belum ada worker idle, jadi pool spawn semua worker
+        futures = [executor.submit(_worker_ready) for _ in range(self.workers)]
+        return all(f.result() for f in futures)
+
+    def _get_executor(self, learned_fixes=None):
+        """learned_fixes: FixSnapshot untuk initializer kalau pool baru dibuat"""
+        with self._lock:
+            return self._get_executor_locked(learned_fixes)
+
+    def _get_executor_locked(self, learned_fixes=None):
+        if self._executor is None:
+            if self.use_processes:
+                cpu = os.cpu_count() or 1
+                torch_threads = max(1, cpu // self.workers)
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # spawn: jangan fork proses Streamlit yang punya banyak thread
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(torch_threads, learned_fixes)
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="ktp-scan"
+                )
+        return self._executor
+
+    def scan(self, items, thumbnail_size, reader=None, learned_fixes=None, cache=None):
+        """
+        Proses semua items secara paralel.
+        items: iterable object dengan .name & .getvalue() (boleh generator lazy,
+               item berikutnya baru diambil saat ada slot kosong)
+        reader: dipakai di mode thread (mode process load model sendiri)
+        cache: OcrCache opsional, hasil readtext dipakai ulang untuk foto yang sama
+        Yields: (item, result) sesuai urutan selesai, 1 per kartu
+        (result["CARD_INDEX"] / ["CARD_COUNT"] untuk foto berisi beberapa KTP)
+        """
+        # Snapshot LearnedFixStore sudah immutable, dict biasa di-copy dulu
+        if isinstance(learned_fixes, FixSnapshot):
+            fixes = learned_fixes if len(learned_fixes) else None
+        else:
+            fixes = dict(learned_fixes) if learned_fixes else None
+        # Mode process: snapshot dikirim sekali per worker (initializer / task STALE_FIXES),
+        # task biasa hanya membawa version-nya
+        fixes_version = fixes.version if isinstance(fixes, FixSnapshot) else None
+        max_in_flight = self.workers + 1
+
+        def submit(item, card_index, card_image, send_fixes=False):
+            executor = self._get_executor(fixes if fixes_version is not None else None)
+            if self.use_processes:
+                # Kartu yang sudah di-crop tidak butuh bytes foto asli
+                light = ScanItem(item.name, item.getvalue() if card_image is None else None)
+                payload = fixes if fixes_version is None or send_fixes else None
+                future = executor.submit(_process_in_worker, light, thumbnail_size, fixes_version, cache,
+                                         card_index, card_image, payload)
+            else:
+                future = executor.submit(worker_process, item, thumbnail_size, reader, fixes, cache,
+                                         card_index, card_image)
+            pending[future] = (item, card_index, card_image, executor)
+
+        pending = {}
+        items_iter = iter(items)
+        exhausted = False
+        # Kartu ke-2 dst. dari foto multi-KTP, didahulukan dari file baru
+        extra_cards = deque()
+
+        while pending or extra_cards or not exhausted:
+            while len(pending) < max_in_flight:
+                if extra_cards:
+                    item, card_index, card_image = extra_cards.popleft()
+                elif not exhausted:
+                    try:
+                        item, card_index, card_image = next(items_iter), 0, None
+                    except StopIteration:
+                        exhausted = True
+                        break
+                else:
+                    break
+
+                submit(item, card_index, card_image)
+
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item, card_index, card_image, executor = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Worker mati (OOM, BrokenProcessPool) - pool dibuat ulang di batch berikutnya
+                    if isinstance(e, BrokenProcessPool):
+                        self._discard_executor(executor)
+                    result = {
+                        "error": True,
+                        "message": f"❌ Error processing {item.name}: {str(e)}",
+                        "FILENAME": item.name
+                    }
+                if result and result.get("STALE_FIXES"):
+                    # Worker masih pegang snapshot lama: kirim ulang sekali dengan snapshot terbaru
+                    submit(item, card_index, card_image, send_fixes=True)
+                    continue
+                card_images = result.pop("CARD_IMAGES", None) if result else None
+                if result:
+                    # Halaman PDF/TIFF (ktp_ingest.PageScanItem): tandai sumbernya
+                    if getattr(item, "page", None):
+                        result["SOURCE_FILE"] = item.source
+                        result["PAGE"] = item.page
+                    self.metrics.observe(item.name, result.pop("STAGE_TIMINGS", None),
+                                         error=bool(result.get("error")))
+                    if card_index == 0:
+                        # Kartu yang gagal di-crop (None / tidak ada) dideteksi ulang dari foto asli
+                        card_images = card_images or []
+                        extra_cards.extend(
+                            (item, i, card_images[i - 1] if i <= len(card_images) else None)
+                            for i in range(1, result.get("CARD_COUNT", 1))
+                        )
+                yield item, result
+
+    def _discard_executor(self, broken):
+        """Buang pool yang rusak (kalau belum diganti thread/sesi lain)"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class OcrWarmup:
+    """
+    Load & warm-up OCR di background thread (sekali per proses server).
+    status: "loading" -> "ready" / "error", UI bisa tampilkan readiness tanpa blocking.
+    """
+
+    def __init__(self, scanner):
+        self.scanner = scanner
+        self.reader = None
+        self.status = "loading"
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ktp-ocr-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            if self.scanner.use_processes:
+                # Worker process punya model sendiri, reader utama tidak perlu
+                if not self.scanner.warm_up():
+                    raise RuntimeError("OCR engine gagal dimuat di worker process")
+            else:
+                reader = create_reader()
+                warm_up_reader(reader)
+                self.reader = reader
+            self.status = "ready"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "error"
+        finally:
+            self._ready.set()
+
+    @property
+    def is_ready(self):
+        return self.status == "ready"
+
+    def wait(self, timeout=None):
+        """Tunggu warm-up selesai. Returns: True kalau OCR siap dipakai"""
+        self._ready.wait(timeout)
+        return self.is_ready
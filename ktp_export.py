@@ -0,0 +1,105 @@
+"""
+Export data nasabah ke Excel / CSV / JSONL / Parquet.
+Dipakai tombol download di UI dan CLI ktp_scan.py (kolom sama persis).
+"""
+import io
+import json
+import importlib.util
+
+import pandas as pd
+import xlsxwriter
+
+EXPORT_COLUMNS = ["NO", "NAMA", "NOMORIDENTITAS", "NAMA GADIS IBU", "CIF NO", "NO HP", "EMAIL"]
+SOURCE_COLUMNS = ["FILENAME", "KETERANGAN"]
+# Kolom sumber halaman, hanya kalau ada data dari PDF/TIFF
+DOCUMENT_COLUMNS = ["SUMBER", "HALAMAN"]
+
+
+def build_export_rows(records, include_source=False):
+    """
+    Konversi baris data_db ke baris export (tanpa foto KTP)
+    include_source: tambah kolom FILENAME & KETERANGAN (untuk CLI)
+    Kolom SUMBER & HALAMAN ikut kalau ada baris dari dokumen multi-halaman.
+    """
+    from_documents = any(row.get("HALAMAN") for row in records)
+    rows = []
+    for idx, row in enumerate(records):
+        export_row = {
+            "NO": idx + 1,
+            "NAMA": row["NAMA"],
+            "NOMORIDENTITAS": row["NOMORIDENTITAS"],
+            "NAMA GADIS IBU": row.get("NAMA GADIS IBU", ""),
+            "CIF NO": row.get("CIF NO", ""),
+            "NO HP": row.get("NO HP", ""),
+            "EMAIL": row.get("EMAIL", "")
+        }
+        if include_source:
+            export_row["FILENAME"] = row.get("FILENAME", "")
+            export_row["KETERANGAN"] = row.get("KETERANGAN", "")
+        if from_documents:
+            export_row["SUMBER"] = row.get("SUMBER") or row.get("FILENAME", "")
+            export_row["HALAMAN"] = row.get("HALAMAN", "")
+        rows.append(export_row)
+    return rows
+
+
+def _columns(rows):
+    return EXPORT_COLUMNS + [c for c in SOURCE_COLUMNS + DOCUMENT_COLUMNS if rows and c in rows[0]]
+
+
+def _to_dataframe(rows):
+    return pd.DataFrame(rows, columns=_columns(rows))
+
+
+def export_excel(rows):
+    """
+    Excel bytes (sheet 'Data KTP'). Ditulis baris per baris dengan xlsxwriter
+    mode constant_memory (baris lama langsung di-flush ke file temp), jadi
+    memory tidak naik walau ribuan baris. pandas to_excel tidak bisa dipakai
+    di mode ini karena menulis per kolom.
+    """
+    columns = _columns(rows)
+    buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {'constant_memory': True})
+    sheet = workbook.add_worksheet('Data KTP')
+    # Style header sama dengan default pandas
+    header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    sheet.write_row(0, 0, columns, header)
+    for row_idx, row in enumerate(rows, 1):
+        sheet.write_row(row_idx, 0, [row.get(c, "") for c in columns])
+    workbook.close()
+    return buffer.getvalue()
+
+
+def export_csv(rows):
+    """CSV bytes (UTF-8 dengan BOM supaya langsung kebaca di Excel)"""
+    return _to_dataframe(rows).to_csv(index=False).encode('utf-8-sig')
+
+
+def export_jsonl(rows):
+    """JSONL bytes, 1 baris JSON per nasabah"""
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8')
+
+
+def parquet_support():
+    """True kalau pyarrow / fastparquet terinstall (engine parquet pandas)"""
+    return any(importlib.util.find_spec(m) is not None for m in ("pyarrow", "fastparquet"))
+
+
+def export_parquet(rows):
+    """Parquet bytes (kolom teks tetap string, NIK tidak jadi angka)"""
+    df = _to_dataframe(rows)
+    if "HALAMAN" in df.columns:
+        # Campuran int & "" -> string supaya 1 tipe per kolom
+        df["HALAMAN"] = df["HALAMAN"].astype(str)
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+EXPORTERS = {
+    "xlsx": export_excel,
+    "csv": export_csv,
+    "jsonl": export_jsonl,
+    "parquet": export_parquet,
+}
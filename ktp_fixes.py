@@ -0,0 +1,138 @@
+"""
+Kamus koreksi nama (learned fixes) bersama untuk semua session di 1 proses server.
+
+Tiap perubahan menghasilkan FixSnapshot baru (immutable, version naik);
+pembaca (fix_nama_typo, worker scan) cukup ambil snapshot() tanpa lock dan
+memakainya sampai selesai. Hanya penulis (koreksi operator, refresh Google
+Sheets) yang antre di lock, dan yang di-merge hanya entry yang berubah.
+
+Disimpan di disk sebagai log JSONL append-only (1 baris per koreksi), jadi
+server yang baru start langsung punya semua koreksi tanpa menunggu Apps Script.
+Log dipadatkan ulang saat load kalau isinya sudah jauh lebih panjang dari kamus
+(kecuali read_only, mis. CLI yang jalan berdampingan dengan server).
+"""
+import os
+import json
+import threading
+from types import MappingProxyType
+from collections.abc import Mapping
+
+DEFAULT_FIXES_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "ktp-scanner", "learned_fixes.jsonl")
+# Padatkan log kalau jumlah baris > faktor ini x jumlah koreksi unik
+COMPACT_FACTOR = 2
+
+
+class FixSnapshot(Mapping):
+    """
+    Isi kamus pada 1 version (read-only). Normalizer hasil compile di-cache
+    di object ini (lihat ktp_core.get_name_normalizer), jadi tiap version
+    hanya di-compile sekali.
+    """
+    __slots__ = ("version", "fixes", "normalizer")
+
+    def __init__(self, version=0, fixes=None):
+        self.version = version
+        # Read-only view, dict aslinya tidak dipegang siapa pun
+        self.fixes = MappingProxyType(dict(fixes or {}))
+        self.normalizer = None
+
+    def __getitem__(self, key):
+        return self.fixes[key]
+
+    def __iter__(self):
+        return iter(self.fixes)
+
+    def __len__(self):
+        return len(self.fixes)
+
+    def __reduce__(self):
+        # Dikirim ke worker process tanpa normalizer (di-compile ulang di sana)
+        return FixSnapshot, (self.version, dict(self.fixes))
+
+    def __repr__(self):
+        return f"FixSnapshot(version={self.version}, {len(self)} koreksi)"
+
+
+class LearnedFixStore:
+    """
+    Store copy-on-write. snapshot() = atribut biasa (atomic di CPython),
+    merge() membuat snapshot baru dan menambah log di disk.
+    read_only: file log tidak pernah ditulis (tanpa compaction saat load,
+    merge hanya di memory), aman dibaca selagi server menulis log yang sama.
+    """
+
+    def __init__(self, path=DEFAULT_FIXES_PATH, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._snapshot = FixSnapshot(0, self._load())
+
+    @classmethod
+    def from_env(cls, read_only=False):
+        """Config dari env: KTP_FIXES_PATH (kosong = tanpa simpan ke disk)"""
+        path = os.environ.get("KTP_FIXES_PATH")
+        return cls(DEFAULT_FIXES_PATH if path is None else (path or None), read_only)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def merge(self, fixes):
+        """
+        Gabung koreksi {salah: benar}, hanya entry baru/berubah yang dicatat.
+        Returns: snapshot terbaru
+        """
+        with self._lock:
+            current = self._snapshot
+            changed = {w: c for w, c in fixes.items() if w and c and current.get(w) != c}
+            if not changed:
+                return current
+            merged = dict(current.fixes)
+            merged.update(changed)
+            self._append(changed)
+            self._snapshot = FixSnapshot(current.version + 1, merged)
+            return self._snapshot
+
+    # ----- disk -----
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        fixes = {}
+        lines = 0
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                        fixes[entry["wrong"]] = entry["correct"]
+                        lines += 1
+                    except (ValueError, KeyError, TypeError):
+                        # Baris terpotong (server mati saat menulis), lewati
+                        continue
+        except OSError:
+            return fixes
+        if not self.read_only and lines > COMPACT_FACTOR * max(1, len(fixes)):
+            self._rewrite(fixes)
+        return fixes
+
+    def _append(self, fixes):
+        if not self.path or self.read_only:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write("".join(json.dumps({"wrong": w, "correct": c}, ensure_ascii=False) + "\n"
+                                 for w, c in fixes.items()))
+        except OSError:
+            # Disk bukan critical path, kamus di memory tetap ter-update
+            pass
+
+    def _rewrite(self, fixes):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                fh.write("".join(json.dumps({"wrong": w, "correct": c}, ensure_ascii=False) + "\n"
+                                 for w, c in fixes.items()))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
@@ -0,0 +1,306 @@
+"""
+Ingest dokumen multi-halaman (PDF, TIFF) dan arsip ZIP untuk KTP Scanner.
+
+Halaman dirender / di-decode satu per satu saat BatchScanner minta item
+berikutnya (generator), jadi PDF 200 halaman tidak pernah dirasterisasi
+sekaligus di memory. Tiap halaman jadi ScanItem berisi bytes PNG yang
+diproses worker_process seperti foto biasa (crop, multi-KTP, OCR, ...).
+
+ZIP dibaca member per member langsung dari arsip (tanpa extract ke disk),
+member yang bukan gambar/dokumen di-skip, isi yang sama (SHA-256) hanya
+diproses sekali.
+
+Render PDF butuh pypdfium2 (opsional, `pip install pypdfium2`).
+"""
+import io
+import os
+import hashlib
+import zipfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from ktp_engine import ScanItem
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+DOCUMENT_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+ARCHIVE_EXTENSIONS = ('.zip',)
+# Member ZIP lebih besar dari ini di-skip (foto KTP wajar < 20MB, cegah zip bomb)
+MAX_MEMBER_MB = 50
+
+# Resolusi render halaman PDF; 200 DPI = A4 ~1650x2340 px, kartu ~675 px lebar
+DEFAULT_PDF_DPI = 200
+# Kompresi PNG halaman (cepat, bytes cuma hidup selama halaman diproses)
+PAGE_PNG_COMPRESSION = 1
+
+
+class DocumentError(Exception):
+    """Dokumen tidak bisa dibuka (format rusak / pypdfium2 belum terinstall)"""
+
+
+class PageScanItem(ScanItem):
+    """1 halaman dokumen: ScanItem + nama file sumber & nomor halaman (mulai 1)"""
+    __slots__ = ("source", "page")
+
+    def __init__(self, source, page, data):
+        super().__init__(f"{source} (hal. {page})", data)
+        self.source = source
+        self.page = page
+
+
+class ArchiveScanItem(ScanItem):
+    """1 member ZIP: ScanItem + nama arsip & hash isi (untuk dedupe)"""
+    __slots__ = ("source", "digest")
+
+    def __init__(self, source, member, data, digest):
+        super().__init__(f"{source}/{member}", data)
+        self.source = source
+        self.digest = digest
+
+
+def content_key(data):
+    """Key dedupe isi file (disimpan di processed_files bersama nama file)"""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def pdf_dpi_from_env():
+    """KTP_PDF_DPI (default: 200)"""
+    value = os.environ.get("KTP_PDF_DPI", "").strip()
+    return int(value) if value.isdigit() and int(value) > 0 else DEFAULT_PDF_DPI
+
+
+def is_document(name):
+    return name.lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _scannable_members(archive):
+    """Member ZIP berisi gambar/dokumen (tanpa folder, file tersembunyi, __MACOSX)"""
+    for info in archive.infolist():
+        base = os.path.basename(info.filename)
+        if info.is_dir() or not base or base.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        if not base.lower().endswith(IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS):
+            continue
+        yield info
+
+
+def iter_zip_members(source, name, seen=None, skipped=None):
+    """
+    Baca member ZIP satu per satu (decompress saat item diminta, tidak extract).
+    source: path, bytes, atau file-like (UploadedFile) ZIP
+    seen: set key content_key yang sudah diproses, member dengan isi sama di-skip
+          (set di-update dengan member yang di-yield)
+    skipped: list opsional, diisi (nama member, alasan) yang di-skip
+    Yields: ArchiveScanItem
+    """
+    seen = set() if seen is None else seen
+    skipped = [] if skipped is None else skipped
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise DocumentError(f"ZIP tidak bisa dibuka: {e}")
+    with archive:
+        for info in _scannable_members(archive):
+            if info.file_size > MAX_MEMBER_MB * 1024 * 1024:
+                skipped.append((info.filename, f"lebih dari {MAX_MEMBER_MB}MB"))
+                continue
+            try:
+                data = archive.read(info)
+            except Exception as e:
+                # Member rusak (CRC, zlib/deflate error, metode kompresi) / terenkripsi
+                skipped.append((info.filename, str(e) or type(e).__name__))
+                continue
+            key = content_key(data)
+            if key in seen:
+                skipped.append((info.filename, "duplikat"))
+                continue
+            seen.add(key)
+            yield ArchiveScanItem(name, info.filename, data, key)
+
+
+def pdf_support():
+    """True kalau pypdfium2 terinstall"""
+    try:
+        import pypdfium2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _open_pdf(source):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise DocumentError("Scan PDF butuh pypdfium2: pip install pypdfium2")
+    try:
+        return pdfium.PdfDocument(source)
+    except Exception as e:
+        raise DocumentError(f"PDF tidak bisa dibuka: {e}")
+
+
+def _encode_page(bgr):
+    ok, buf = cv2.imencode('.png', bgr, [cv2.IMWRITE_PNG_COMPRESSION, PAGE_PNG_COMPRESSION])
+    if not ok:
+        raise DocumentError("Halaman tidak bisa di-encode")
+    return buf.tobytes()
+
+
+def _render_pdf_page(pdf, index, scale):
+    page = pdf[index]
+    try:
+        bitmap = page.render(scale=scale)
+        try:
+            # pdfium render BGRx -> buang channel alpha, tanpa konversi warna
+            bgr = np.ascontiguousarray(bitmap.to_numpy()[:, :, :3])
+        finally:
+            bitmap.close()
+    finally:
+        page.close()
+    return _encode_page(bgr)
+
+
+def iter_pdf_pages(source, name, dpi=None, errors=None):
+    """
+    Render halaman PDF satu per satu.
+    source: path atau bytes PDF (path dibaca pdfium sesuai kebutuhan, tidak di-load penuh)
+    errors: list opsional, diisi (nama halaman, pesan) untuk halaman yang gagal
+            dirender (halaman lain tetap diproses)
+    Yields: PageScanItem
+    """
+    errors = [] if errors is None else errors
+    scale = (dpi or pdf_dpi_from_env()) / 72
+    pdf = _open_pdf(source)
+    try:
+        for index in range(len(pdf)):
+            try:
+                data = _render_pdf_page(pdf, index, scale)
+            except Exception as e:
+                errors.append((f"{name} (hal. {index + 1})", f"gagal dirender: {e}"))
+                continue
+            yield PageScanItem(name, index + 1, data)
+    finally:
+        pdf.close()
+
+
+def _decode_tiff_frame(image, index):
+    image.seek(index)
+    rgb = np.asarray(image.convert("RGB"))
+    return _encode_page(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+
+
+def iter_tiff_pages(source, name, errors=None):
+    """
+    Decode frame TIFF satu per satu (PIL seek, frame lain tidak di-decode).
+    source: path atau bytes TIFF
+    errors: list opsional, diisi (nama halaman, pesan) untuk frame yang rusak
+            (frame lain tetap diproses)
+    Yields: PageScanItem
+    """
+    errors = [] if errors is None else errors
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    except Exception as e:
+        raise DocumentError(f"TIFF tidak bisa dibuka: {e}")
+    with image:
+        try:
+            n_frames = getattr(image, "n_frames", 1)
+        except Exception as e:
+            raise DocumentError(f"TIFF tidak bisa dibuka: {e}")
+        for index in range(n_frames):
+            try:
+                data = _decode_tiff_frame(image, index)
+            except Exception as e:
+                errors.append((f"{name} (hal. {index + 1})", f"gagal di-decode: {e}"))
+                continue
+            yield PageScanItem(name, index + 1, data)
+
+
+def iter_document_pages(source, name, dpi=None, errors=None):
+    """PDF / TIFF -> generator PageScanItem (format dari ekstensi name)"""
+    if name.lower().endswith('.pdf'):
+        return iter_pdf_pages(source, name, dpi, errors)
+    return iter_tiff_pages(source, name, errors)
+
+
+def count_pages(source, name):
+    """
+    Jumlah halaman tanpa render (untuk progress bar); ZIP = jumlah member
+    gambar/dokumen. Returns: int, 1 kalau gagal
+    """
+    try:
+        if is_archive(name):
+            with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as archive:
+                return sum(1 for _ in _scannable_members(archive))
+        if name.lower().endswith('.pdf'):
+            pdf = _open_pdf(source)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+        if name.lower().endswith(('.tif', '.tiff')):
+            with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+                return getattr(image, "n_frames", 1)
+    except Exception:
+        pass
+    return 1
+
+
+def _expand_one(item, source, name, dpi, seen, skipped, errors):
+    if is_archive(name):
+        for member in iter_zip_members(source, name, seen, skipped):
+            if is_document(member.name):
+                # PDF/TIFF di dalam ZIP: dipecah per halaman juga; dokumen yang
+                # rusak cukup di-skip, member berikutnya tetap diproses
+                try:
+                    yield from iter_document_pages(member.data, member.name, dpi, errors)
+                except Exception as e:
+                    errors.append((member.name, str(e) or type(e).__name__))
+            else:
+                yield member
+    elif is_document(name):
+        yield from iter_document_pages(source, name, dpi, errors)
+    else:
+        yield item
+
+
+def expand_documents(files, dpi=None, seen=None):
+    """
+    File upload / file CLI (.name & .getvalue(), opsional .path) -> item scan:
+    foto apa adanya, PDF/TIFF dipecah per halaman, ZIP dibaca per member;
+    semuanya lazy (file di disk dibaca langsung dari path). BatchScanner
+    hanya menarik item saat ada slot worker kosong, jadi memory tetap
+    konstan berapapun isi arsipnya.
+    seen: set content_key yang sudah diproses (dedupe member ZIP), di-update
+    Returns: (generator item, errors list [(nama file, pesan)] untuk dokumen
+    yang gagal dibuka, halaman yang gagal dirender / member ZIP yang di-skip).
+    File / halaman yang gagal tidak menghentikan batch.
+    """
+    errors = []
+    seen = set() if seen is None else seen
+
+    def _items():
+        for f in files:
+            path = getattr(f, "path", None)
+            name = path or f.name
+            if not (is_document(name) or is_archive(name)):
+                yield f
+                continue
+            skipped = []
+            try:
+                # UploadedFile sudah file-like, ZIP dibaca langsung tanpa copy bytes
+                source = path or (f if is_archive(name) and hasattr(f, "seek") else f.getvalue())
+                yield from _expand_one(f, source, name, dpi, seen, skipped, errors)
+            except DocumentError as e:
+                errors.append((name, str(e)))
+            except Exception as e:
+                # Error tak terduga di 1 dokumen: sisa dokumen itu di-skip, file lain tetap jalan
+                errors.append((name, f"gagal dibaca: {e}"))
+            errors.extend((f"{name}/{member}", f"di-skip: {reason}") for member, reason in skipped
+                          if reason != "duplikat")
+
+    return _items(), errors
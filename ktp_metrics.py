@@ -0,0 +1,219 @@
+"""
+Instrumentasi per stage pipeline KTP Scanner.
+
+worker_process mencatat durasi & ukuran gambar tiap stage (StageTimer),
+hasilnya ikut di result dict ("STAGE_TIMINGS") supaya bisa dikirim balik
+dari worker process. BatchScanner mengumpulkan semuanya di StageMetrics:
+- histogram kumulatif format Prometheus (text exposition)
+- rolling window sampel terakhir untuk panel metrics di sidebar
+- metrics log JSONL opsional (KTP_METRICS_LOG)
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = (
+    "decode", "crop", "deskew", "warp", "split", "quality",
+    "ocr_resize", "blur", "readtext", "refine", "retry", "extract",
+    "preview_resize", "preview_encode",
+)
+
+# Batas bucket histogram (detik), OCR CPU bisa sampai puluhan detik
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_WINDOW = 200
+# Endpoint /metrics hanya bisa diakses dari mesin server kecuali KTP_METRICS_HOST di-set
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+
+class StageTimer:
+    """
+    Stopwatch ringan untuk 1 file: mark(stage, image) mencatat waktu sejak
+    mark sebelumnya + ukuran gambar output stage (w, h).
+    samples: list [stage, detik, width, height] (JSON/pickle-friendly)
+    """
+    __slots__ = ("samples", "_last")
+
+    def __init__(self):
+        self.samples = []
+        self._last = time.perf_counter()
+
+    def reset(self):
+        """Mulai hitung dari sekarang (lewati waktu yang bukan stage)"""
+        self._last = time.perf_counter()
+
+    def mark(self, stage, image=None):
+        now = time.perf_counter()
+        width = height = 0
+        shape = getattr(image, "shape", None)
+        if shape is not None:
+            height, width = shape[:2]
+        elif image is not None and hasattr(image, "size"):
+            width, height = image.size
+        self.samples.append([stage, now - self._last, int(width), int(height)])
+        self._last = now
+
+
+class StageMetrics:
+    """
+    Agregator thread-safe untuk timing semua file (1 per proses server).
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, log_path=None):
+        self.window = window
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._buckets = {}   # stage -> [count per bucket] (non-kumulatif, +Inf di akhir)
+        self._sum = {}       # stage -> total detik
+        self._count = {}     # stage -> jumlah sampel
+        self._pixels = {}    # stage -> total pixel output
+        self._recent = {}    # stage -> deque detik terakhir
+        self._files = {"ok": 0, "error": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Config dari env: KTP_METRICS_WINDOW, KTP_METRICS_LOG (path JSONL)"""
+        window = os.environ.get("KTP_METRICS_WINDOW", "").strip()
+        window = int(window) if window.isdigit() and int(window) > 0 else DEFAULT_WINDOW
+        return cls(window, os.environ.get("KTP_METRICS_LOG") or None)
+
+    def observe(self, filename, samples, error=False):
+        """Catat sampel StageTimer 1 file"""
+        if samples is None:
+            return
+        with self._lock:
+            self._files["error" if error else "ok"] += 1
+            for stage, seconds, width, height in samples:
+                buckets = self._buckets.get(stage)
+                if buckets is None:
+                    buckets = self._buckets[stage] = [0] * (len(LATENCY_BUCKETS) + 1)
+                    self._sum[stage] = 0.0
+                    self._count[stage] = 0
+                    self._pixels[stage] = 0
+                    self._recent[stage] = deque(maxlen=self.window)
+                buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+                self._sum[stage] += seconds
+                self._count[stage] += 1
+                self._pixels[stage] += width * height
+                self._recent[stage].append(seconds)
+
+        if self.log_path:
+            self._write_log(filename, samples, error)
+
+    def _write_log(self, filename, samples, error):
+        line = json.dumps({
+            "ts": round(time.time(), 3),
+            "file": filename,
+            "error": bool(error),
+            "stages": {s: {"ms": round(sec * 1000, 2), "w": w, "h": h} for s, sec, w, h in samples},
+        }, ensure_ascii=False)
+        try:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError:
+            # Metrics log bukan critical path
+            pass
+
+    def _ordered_stages(self):
+        known = [s for s in STAGES if s in self._count]
+        return known + sorted(s for s in self._count if s not in STAGES)
+
+    def rolling_summary(self):
+        """
+        Statistik rolling window per stage (untuk panel sidebar)
+        Returns: list dict {stage, n, p50_ms, p95_ms, max_ms}
+        """
+        with self._lock:
+            recent = {s: sorted(self._recent[s]) for s in self._ordered_stages()}
+        rows = []
+        for stage, values in recent.items():
+            if not values:
+                continue
+            n = len(values)
+            rows.append({
+                "stage": stage,
+                "n": n,
+                "p50_ms": round(values[(n - 1) // 2] * 1000, 1),
+                "p95_ms": round(values[min(n - 1, int(round(0.95 * (n - 1))))] * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            })
+        return rows
+
+    def rolling_histogram(self, stage):
+        """
+        Histogram rolling window 1 stage.
+        Returns: list (label bucket, jumlah) - bucket kosong di ujung dibuang
+        """
+        with self._lock:
+            values = list(self._recent.get(stage, ()))
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for seconds in values:
+            counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        labels = [f"≤{_format_bound(b)}" for b in LATENCY_BUCKETS] + [f">{_format_bound(LATENCY_BUCKETS[-1])}"]
+        nonzero = [i for i, c in enumerate(counts) if c]
+        if not nonzero:
+            return []
+        return list(zip(labels, counts))[nonzero[0]:nonzero[-1] + 1]
+
+    def stages(self):
+        with self._lock:
+            return self._ordered_stages()
+
+    def render_prometheus(self):
+        """Text exposition format Prometheus (histogram kumulatif per stage)"""
+        lines = [
+            "# HELP ktp_stage_duration_seconds Durasi tiap stage pipeline KTP per file",
+            "# TYPE ktp_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for stage in self._ordered_stages():
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, self._buckets[stage]):
+                    cumulative += count
+                    lines.append(f'ktp_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                cumulative += self._buckets[stage][-1]
+                lines.append(f'ktp_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+                lines.append(f'ktp_stage_duration_seconds_sum{{stage="{stage}"}} {self._sum[stage]:.6f}')
+                lines.append(f'ktp_stage_duration_seconds_count{{stage="{stage}"}} {self._count[stage]}')
+            lines.append("# HELP ktp_stage_output_pixels_total Total pixel gambar output tiap stage")
+            lines.append("# TYPE ktp_stage_output_pixels_total counter")
+            for stage in self._ordered_stages():
+                lines.append(f'ktp_stage_output_pixels_total{{stage="{stage}"}} {self._pixels[stage]}')
+            lines.append("# HELP ktp_files_total File yang selesai diproses")
+            lines.append("# TYPE ktp_files_total counter")
+            for status, count in self._files.items():
+                lines.append(f'ktp_files_total{{status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _format_bound(seconds):
+    return f"{seconds * 1000:g}ms" if seconds < 1 else f"{seconds:g}s"
+
+
+def serve_prometheus(metrics, port, host=DEFAULT_METRICS_HOST):
+    """
+    Endpoint /metrics (Prometheus text) di background thread.
+    Default hanya listen di localhost; host="0.0.0.0" untuk dibuka ke jaringan.
+    Returns: HTTPServer (panggil .shutdown() untuk stop)
+    """
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="ktp-metrics", daemon=True).start()
+    return server
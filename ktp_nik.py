@@ -0,0 +1,170 @@
+"""
+Validasi struktur NIK (Nomor Induk Kependudukan) 16 digit:
+
+    PP KK CC DDMMYY SSSS
+    PP   kode provinsi
+    KK   kode kabupaten (01-69) / kota (71-99)
+    CC   kode kecamatan
+    DD   tanggal lahir, perempuan +40 (41-71)
+    MMYY bulan & tahun lahir
+    SSSS nomor urut (0001-9999)
+
+Dipakai untuk memberi skor tiap kandidat NIK hasil OCR (sliding window,
+koreksi huruf -> angka) dan memilih yang paling masuk akal.
+"""
+import re
+from datetime import date
+
+# Kode provinsi Kemendagri -> (nama, kode kabupaten terbesar, kode kota terbesar)
+# Kode kab/kota di bawah batas ini dianggap masuk akal (ada celah kode karena
+# pemekaran, jadi ini cek plausibilitas, bukan daftar lengkap).
+PROVINCES = {
+    "11": ("ACEH", 18, 75),
+    "12": ("SUMATERA UTARA", 25, 78),
+    "13": ("SUMATERA BARAT", 12, 77),
+    "14": ("RIAU", 10, 73),
+    "15": ("JAMBI", 9, 72),
+    "16": ("SUMATERA SELATAN", 13, 74),
+    "17": ("BENGKULU", 9, 71),
+    "18": ("LAMPUNG", 13, 72),
+    "19": ("KEPULAUAN BANGKA BELITUNG", 6, 71),
+    "21": ("KEPULAUAN RIAU", 5, 72),
+    "31": ("DKI JAKARTA", 1, 75),
+    "32": ("JAWA BARAT", 18, 79),
+    "33": ("JAWA TENGAH", 29, 76),
+    "34": ("DI YOGYAKARTA", 4, 71),
+    "35": ("JAWA TIMUR", 29, 79),
+    "36": ("BANTEN", 4, 74),
+    "51": ("BALI", 8, 71),
+    "52": ("NUSA TENGGARA BARAT", 8, 72),
+    "53": ("NUSA TENGGARA TIMUR", 21, 71),
+    "61": ("KALIMANTAN BARAT", 12, 72),
+    "62": ("KALIMANTAN TENGAH", 13, 71),
+    "63": ("KALIMANTAN SELATAN", 11, 72),
+    "64": ("KALIMANTAN TIMUR", 11, 74),
+    "65": ("KALIMANTAN UTARA", 4, 71),
+    "71": ("SULAWESI UTARA", 11, 74),
+    "72": ("SULAWESI TENGAH", 12, 71),
+    "73": ("SULAWESI SELATAN", 26, 73),
+    "74": ("SULAWESI TENGGARA", 15, 72),
+    "75": ("GORONTALO", 5, 71),
+    "76": ("SULAWESI BARAT", 6, 0),
+    "81": ("MALUKU", 9, 72),
+    "82": ("MALUKU UTARA", 8, 72),
+    "91": ("PAPUA", 36, 71),
+    "92": ("PAPUA BARAT", 12, 71),
+    "93": ("PAPUA SELATAN", 4, 0),
+    "94": ("PAPUA TENGAH", 8, 0),
+    "95": ("PAPUA PEGUNUNGAN", 8, 0),
+    "96": ("PAPUA BARAT DAYA", 5, 71),
+}
+# Kode kecamatan terbesar yang masih dianggap wajar
+MAX_DISTRICT = 60
+
+# Bobot skor tiap bagian NIK (total = MAX_SCORE untuk NIK yang sempurna)
+SCORE_PROVINCE = 3
+SCORE_REGENCY = 2
+SCORE_DISTRICT = 1
+SCORE_BIRTH_DATE = 3
+SCORE_SERIAL = 1
+SCORE_BIRTH_MATCH = 3
+SCORE_GENDER_MATCH = 1
+MAX_SCORE = (SCORE_PROVINCE + SCORE_REGENCY + SCORE_DISTRICT + SCORE_BIRTH_DATE
+             + SCORE_SERIAL + SCORE_BIRTH_MATCH + SCORE_GENDER_MATCH)
+
+_DATE_RE = re.compile(r'(\d{1,2})\s*[-/.]\s*(\d{1,2})\s*[-/.]\s*(\d{4})')
+
+
+def parse_nik(nik):
+    """
+    Pecah NIK ke bagian-bagiannya (tanpa validasi)
+    Returns: dict {province, regency, district, day, month, year2, female, serial} atau None
+    """
+    if len(nik) != 16 or not nik.isdigit():
+        return None
+    day = int(nik[6:8])
+    female = day > 40
+    return {
+        "province": nik[0:2],
+        "regency": int(nik[2:4]),
+        "district": int(nik[4:6]),
+        "day": day - 40 if female else day,
+        "month": int(nik[8:10]),
+        "year2": int(nik[10:12]),
+        "female": female,
+        "serial": int(nik[12:16]),
+    }
+
+
+def _valid_birth_date(day, month, year2):
+    # Tahun 2 digit: cek dengan tahun kabisat (29 Feb selalu lolos)
+    try:
+        date(2000 + year2, month, day)
+        return True
+    except ValueError:
+        return False
+
+
+def parse_birth_date(text):
+    """'SIDOARJO, 01-01-1990' -> (1, 1, 1990) atau None"""
+    match = _DATE_RE.search(text)
+    if not match:
+        return None
+    day, month, year = (int(g) for g in match.groups())
+    return day, month, year
+
+
+def score_nik(nik, birth_date=None, female=None):
+    """
+    Skor struktur NIK: 0 (sampah) .. MAX_SCORE (semua bagian valid & cocok
+    dengan tanggal lahir / jenis kelamin hasil OCR)
+    birth_date: (hari, bulan, tahun) dari baris "Tempat/Tgl Lahir", opsional
+    female: True/False dari baris "Jenis Kelamin", opsional
+    """
+    parts = parse_nik(nik)
+    if parts is None:
+        return 0
+
+    score = 0
+    province = PROVINCES.get(parts["province"])
+    if province:
+        score += SCORE_PROVINCE
+        _, max_regency, max_city = province
+        regency = parts["regency"]
+        if 1 <= regency <= max_regency or 71 <= regency <= max_city:
+            score += SCORE_REGENCY
+    if 1 <= parts["district"] <= MAX_DISTRICT:
+        score += SCORE_DISTRICT
+    if _valid_birth_date(parts["day"], parts["month"], parts["year2"]):
+        score += SCORE_BIRTH_DATE
+    if parts["serial"] > 0:
+        score += SCORE_SERIAL
+
+    if birth_date is not None:
+        day, month, year = birth_date
+        if (parts["day"], parts["month"], parts["year2"]) == (day, month, year % 100):
+            score += SCORE_BIRTH_MATCH
+    if female is not None and parts["female"] == female:
+        score += SCORE_GENDER_MATCH
+
+    return score
+
+
+def nik_confidence(nik, birth_date=None, female=None):
+    """
+    Confidence 0..1. Tanpa data tanggal lahir / jenis kelamin, skor
+    dibandingkan dengan maksimum yang mungkin dicapai (bukan MAX_SCORE).
+    """
+    reachable = MAX_SCORE
+    if birth_date is None:
+        reachable -= SCORE_BIRTH_MATCH
+    if female is None:
+        reachable -= SCORE_GENDER_MATCH
+    return score_nik(nik, birth_date, female) / reachable
+
+
+def windows(digits, max_extra=4):
+    """Semua potongan 16 digit dari deretan angka yang sedikit kepanjangan"""
+    if len(digits) < 16 or len(digits) > 16 + max_extra:
+        return []
+    return [digits[i:i + 16] for i in range(len(digits) - 15)]
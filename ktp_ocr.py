@@ -0,0 +1,316 @@
+"""
+OCR backend KTP Scanner.
+
+Backend = object dengan API EasyOCR yang dipakai pipeline:
+    readtext(image) -> [(box, text, confidence), ...]
+    recognize(image, horizontal_list=[...], free_list=[], allowlist=..., detail=1)
+
+Backend tersedia (pilih via env KTP_OCR_BACKEND):
+    easyocr  - EasyOCR + PyTorch (default)
+    onnx     - weight CRAFT + recognizer EasyOCR yang sama, di-export ke ONNX,
+               dynamic-quantized int8, dijalankan onnxruntime (CPU)
+
+Tools:
+    python ktp_ocr.py export                      # buat model ONNX int8 di KTP_ONNX_DIR
+    python ktp_ocr.py parity tests/fixtures/ tests/fixtures/expected.csv
+"""
+import os
+import sys
+import time
+import argparse
+
+LANG_LIST = ['id', 'en']
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".EasyOCR", "onnx")
+DETECTOR_ONNX = "craft_int8.onnx"
+RECOGNIZER_ONNX = "recognizer_int8.onnx"
+
+OCR_BACKEND = os.environ.get("KTP_OCR_BACKEND", "easyocr").strip().lower() or "easyocr"
+
+
+def _easyocr_kwargs(model_dir):
+    model_dir = model_dir or os.environ.get("KTP_MODEL_DIR")
+    if model_dir:
+        # Load dari folder lokal, tanpa cek/download ke internet
+        return {"model_storage_directory": model_dir, "download_enabled": False}
+    return {}
+
+
+def create_easyocr_reader(model_dir=None, threads=None):
+    """EasyOCR reader CPU (PyTorch)"""
+    import easyocr
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return easyocr.Reader(LANG_LIST, gpu=False, verbose=False, **_easyocr_kwargs(model_dir))
+
+
+class _OnnxModule:
+    """
+    Pengganti nn.Module detector/recognizer EasyOCR: terima & kembalikan
+    torch tensor (pre/post-processing EasyOCR tidak berubah), compute di onnxruntime
+    """
+
+    def __init__(self, session, single_output=True):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.single_output = single_output
+
+    def eval(self):
+        return self
+
+    def __call__(self, x, *unused):
+        import torch
+        outputs = self.session.run(None, {self.input_name: x.cpu().numpy()})
+        if self.single_output:
+            return torch.from_numpy(outputs[0])
+        # CRAFT: (score map, feature) - feature tidak dipakai post-processing
+        return torch.from_numpy(outputs[0]), None
+
+
+def _onnx_session(path, threads):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = threads or 0  # 0 = default onnxruntime (semua core)
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def create_onnx_reader(model_dir=None, threads=None, onnx_dir=None):
+    """
+    Reader EasyOCR dengan detector & recognizer diganti session onnxruntime int8.
+    Weight .pth tidak di-load sama sekali, hanya config karakter/bahasa.
+    threads / env KTP_ONNX_THREADS: intra-op thread per session
+    """
+    import easyocr
+    from easyocr.detection import get_textbox
+    from easyocr.utils import CTCLabelConverter
+
+    onnx_dir = onnx_dir or os.environ.get("KTP_ONNX_DIR") or DEFAULT_ONNX_DIR
+    if threads is None:
+        env_threads = os.environ.get("KTP_ONNX_THREADS", "").strip()
+        threads = int(env_threads) if env_threads.isdigit() else None
+
+    detector_path = os.path.join(onnx_dir, DETECTOR_ONNX)
+    recognizer_path = os.path.join(onnx_dir, RECOGNIZER_ONNX)
+    for path in (detector_path, recognizer_path):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Model ONNX tidak ada: {path} (jalankan: python ktp_ocr.py export)")
+
+    reader = easyocr.Reader(
+        LANG_LIST, gpu=False, verbose=False,
+        detector=False, recognizer=False,
+        **_easyocr_kwargs(model_dir)
+    )
+    dict_list = {
+        lang: os.path.join(os.path.dirname(easyocr.__file__), 'dict', lang + ".txt")
+        for lang in LANG_LIST
+    }
+    reader.get_textbox = get_textbox
+    reader.detector = _OnnxModule(_onnx_session(detector_path, threads), single_output=False)
+    reader.recognizer = _OnnxModule(_onnx_session(recognizer_path, threads))
+    reader.converter = CTCLabelConverter(reader.character, {}, dict_list)
+    return reader
+
+
+OCR_BACKENDS = {
+    "easyocr": create_easyocr_reader,
+    "onnx": create_onnx_reader,
+}
+
+
+def register_backend(name, factory):
+    """Tambah backend baru: factory(model_dir=None, threads=None) -> reader"""
+    OCR_BACKENDS[name] = factory
+
+
+def create_reader(model_dir=None, backend=None, threads=None):
+    """
+    Buat OCR reader sesuai backend (default env KTP_OCR_BACKEND, lalu 'easyocr')
+    model_dir / env KTP_MODEL_DIR: load model dari folder lokal tanpa download
+    """
+    backend = backend or OCR_BACKEND
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"OCR backend tidak dikenal: {backend} (pilihan: {', '.join(OCR_BACKENDS)})")
+    return OCR_BACKENDS[backend](model_dir=model_dir, threads=threads)
+
+
+# --- EXPORT ONNX ---
+def export_onnx(onnx_dir=None, model_dir=None, opset=17):
+    """
+    Export CRAFT + recognizer EasyOCR ke ONNX, lalu dynamic quantization int8.
+    Returns: (detector_path, recognizer_path)
+    """
+    import easyocr
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    onnx_dir = onnx_dir or os.environ.get("KTP_ONNX_DIR") or DEFAULT_ONNX_DIR
+    os.makedirs(onnx_dir, exist_ok=True)
+
+    # quantize=False: export weight float asli, quantization dilakukan onnxruntime
+    reader = easyocr.Reader(LANG_LIST, gpu=False, verbose=False, quantize=False, **_easyocr_kwargs(model_dir))
+    return _export_modules(reader.detector, reader.recognizer, onnx_dir, opset,
+                           torch=torch, quantize_dynamic=quantize_dynamic, quant_type=QuantType.QUInt8)
+
+
+def _export_modules(detector, recognizer, onnx_dir, opset, torch, quantize_dynamic, quant_type):
+    class _RecognizerExport(torch.nn.Module):
+        # Forward Model EasyOCR generation2 tanpa argumen text (tidak dipakai CTC)
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            m = self.model
+            feature = m.FeatureExtraction(image).permute(0, 3, 1, 2)
+            # AdaptiveAvgPool2d((None, 1)) == mean di dimensi terakhir,
+            # tapi versi mean bisa di-export dengan lebar input dinamis
+            feature = feature.mean(dim=3)
+            contextual = m.SequenceModeling(feature)
+            return m.Prediction(contextual.contiguous())
+
+    outputs = []
+    specs = [
+        ("craft", detector.eval(), torch.zeros(1, 3, 480, 640), ["image"], ["y", "feature"],
+         {"image": {0: "batch", 2: "height", 3: "width"},
+          "y": {0: "batch", 1: "map_height", 2: "map_width"},
+          "feature": {0: "batch", 2: "map_height", 3: "map_width"}},
+         DETECTOR_ONNX),
+        ("recognizer", _RecognizerExport(recognizer.eval()).eval(), torch.zeros(1, 1, 64, 256), ["image"], ["preds"],
+         {"image": {0: "batch", 3: "width"}, "preds": {0: "batch", 1: "steps"}},
+         RECOGNIZER_ONNX),
+    ]
+    for name, module, dummy, input_names, output_names, dynamic_axes, filename in specs:
+        fp32_path = os.path.join(onnx_dir, f"{name}_fp32.onnx")
+        int8_path = os.path.join(onnx_dir, filename)
+        with torch.no_grad():
+            torch.onnx.export(
+                module, (dummy,), fp32_path,
+                input_names=input_names, output_names=output_names,
+                dynamic_axes=dynamic_axes, opset_version=opset,
+                dynamo=False
+            )
+        quantize_dynamic(fp32_path, int8_path, weight_type=quant_type)
+        os.remove(fp32_path)
+        outputs.append(int8_path)
+    return tuple(outputs)
+
+
+# --- PARITY CHECK ---
+def load_expected(csv_path):
+    """CSV fixture: FILENAME,NAMA,NOMORIDENTITAS -> {filename: (nama, nik)}"""
+    import csv
+    expected = {}
+    with open(csv_path, newline='', encoding='utf-8-sig') as fh:
+        for row in csv.DictReader(fh):
+            filename = (row.get("FILENAME") or "").strip()
+            if not filename:
+                # Header salah / baris kosong
+                continue
+            expected[filename] = ((row.get("NAMA") or "").strip(), (row.get("NOMORIDENTITAS") or "").strip())
+    return expected
+
+
+def run_backend(reader, fixture_dir, filenames):
+    """Scan semua fixture dengan 1 reader. Returns: ({filename: (nama, nik)}, [latency detik])"""
+    from ktp_core import worker_process
+
+    class _FixtureItem:
+        def __init__(self, path):
+            self.name = os.path.basename(path)
+            self.path = path
+
+        def getvalue(self):
+            with open(self.path, 'rb') as fh:
+                return fh.read()
+
+    results = {}
+    latencies = []
+    for filename in filenames:
+        started = time.perf_counter()
+        res = worker_process(_FixtureItem(os.path.join(fixture_dir, filename)), None, reader) or {}
+        latencies.append(time.perf_counter() - started)
+        results[filename] = (res.get("NAMA", ""), res.get("NOMORIDENTITAS", ""))
+    return results, latencies
+
+
+def parity_report(fixture_dir, expected_csv, backends=("easyocr", "onnx"), threads=None):
+    """
+    Bandingkan akurasi NIK/NAMA & latency antar backend di fixture set.
+    Returns: {backend: {"nik_acc", "nama_acc", "p50", "p95", "results"}}
+    Raises ValueError kalau tidak ada baris CSV yang fotonya ada di fixture_dir
+    """
+    expected = load_expected(expected_csv)
+    # Baris CSV yang fotonya tidak ada di folder fixture tidak ikut dihitung
+    filenames = sorted(f for f in expected if os.path.isfile(os.path.join(fixture_dir, f)))
+    if not filenames:
+        raise ValueError(f"Tidak ada fixture yang cocok antara {expected_csv} dan {fixture_dir} "
+                         "(cek kolom FILENAME,NAMA,NOMORIDENTITAS)")
+    report = {}
+    for backend in backends:
+        reader = create_reader(backend=backend, threads=threads)
+        # Warm-up supaya latency pertama tidak ikut load kernel
+        from ktp_core import warm_up_reader
+        warm_up_reader(reader)
+
+        results, latencies = run_backend(reader, fixture_dir, filenames)
+        latencies.sort()
+        n = len(filenames)
+        report[backend] = {
+            "nik_acc": sum(results[f][1] == expected[f][1] for f in filenames) / n,
+            "nama_acc": sum(results[f][0] == expected[f][0] for f in filenames) / n,
+            "p50": latencies[n // 2],
+            "p95": latencies[min(n - 1, int(n * 0.95))],
+            "results": results,
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ktp_ocr', description='Tools OCR backend KTP Scanner')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_export = sub.add_parser('export', help='Export model EasyOCR ke ONNX int8')
+    p_export.add_argument('--onnx-dir', default=None, help=f'Folder output (default: KTP_ONNX_DIR / {DEFAULT_ONNX_DIR})')
+    p_export.add_argument('--model-dir', default=None, help='Folder model EasyOCR (.pth) lokal')
+
+    p_parity = sub.add_parser('parity', help='Cek akurasi NIK/NAMA & latency onnx vs easyocr')
+    p_parity.add_argument('fixture_dir', help='Folder foto KTP fixture')
+    p_parity.add_argument('expected_csv', help='CSV berisi FILENAME,NAMA,NOMORIDENTITAS yang benar')
+    p_parity.add_argument('--threads', type=int, default=None, help='Intra-op thread untuk backend')
+    p_parity.add_argument('--tolerance', type=float, default=0.0,
+                          help='Toleransi penurunan akurasi onnx vs easyocr (default: 0)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        for path in export_onnx(args.onnx_dir, args.model_dir):
+            print(f"💾 {path}")
+        return 0
+
+    try:
+        report = parity_report(args.fixture_dir, args.expected_csv, threads=args.threads)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    for backend, stats in report.items():
+        print(f"{backend:8s} NIK {stats['nik_acc']:.1%}  NAMA {stats['nama_acc']:.1%}  "
+              f"p50 {stats['p50'] * 1000:.0f} ms  p95 {stats['p95'] * 1000:.0f} ms")
+
+    base, onnx = report["easyocr"], report["onnx"]
+    for filename, result in onnx["results"].items():
+        if result != base["results"][filename]:
+            print(f"  ≠ {filename}: easyocr={base['results'][filename]} onnx={result}")
+
+    regressed = (onnx["nik_acc"] < base["nik_acc"] - args.tolerance or
+                 onnx["nama_acc"] < base["nama_acc"] - args.tolerance)
+    if regressed:
+        print("❌ Akurasi onnx turun dibanding easyocr", file=sys.stderr)
+        return 1
+    print("✅ Akurasi onnx setara easyocr")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+ktp-scan: scan folder / glob foto KTP tanpa UI Streamlit.
+
+Contoh:
+    python ktp_scan.py scans/2024-06-01 -o hasil.xlsx
+    python ktp_scan.py "scans/**/*.jpg" -o hasil.csv -o hasil.jsonl --workers 8
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from ktp_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_MB, OcrCache
+from ktp_core import result_to_record
+from ktp_engine import BatchScanner
+from ktp_export import EXPORTERS, build_export_rows
+from ktp_fixes import LearnedFixStore
+from ktp_ingest import ARCHIVE_EXTENSIONS, DOCUMENT_EXTENSIONS, IMAGE_EXTENSIONS, expand_documents
+from ktp_ocr import create_reader
+
+
+class FileScanItem:
+    """File di disk, bytes baru dibaca saat worker butuh (hemat RAM untuk ribuan file)"""
+    __slots__ = ("path", "name")
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def getvalue(self):
+        with open(self.path, 'rb') as fh:
+            return fh.read()
+
+
+def collect_files(inputs, recursive=False):
+    """Expand direktori / glob jadi daftar file gambar & dokumen PDF/TIFF (urut, tanpa duplikat)"""
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                candidates = glob.glob(os.path.join(pattern, '**', '*'), recursive=True)
+            else:
+                candidates = glob.glob(os.path.join(pattern, '*'))
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        paths.extend(
+            p for p in candidates
+            if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS + ARCHIVE_EXTENSIONS)
+        )
+    return sorted(set(paths))
+
+
+def _output_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext == 'xls':
+        ext = 'xlsx'
+    if ext not in EXPORTERS:
+        raise ValueError(f"Format output tidak didukung: {path} (pakai .xlsx, .csv, .jsonl, atau .parquet)")
+    return ext
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='ktp-scan',
+        description='Scan folder foto KTP (crop → quality → rotate → OCR → extract) secara paralel.'
+    )
+    parser.add_argument('inputs', nargs='+', help='Direktori atau glob pattern foto KTP')
+    parser.add_argument('-o', '--output', action='append', required=True,
+                        help='File output (.xlsx / .csv / .jsonl / .parquet), bisa diulang')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Scan sub-direktori juga')
+    parser.add_argument('--workers', type=int, default=None, help='Jumlah worker (default: jumlah core)')
+    parser.add_argument('--memory-budget', type=int, default=None, metavar='MB',
+                        help='Budget RAM untuk worker pool (default: 75%% RAM container)')
+    parser.add_argument('--pool', choices=['process', 'thread'], default=None,
+                        help='Jenis worker pool (default: otomatis dari memory budget)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='Direktori cache OCR (default: %(default)s)')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_MB,
+                        help='Batas ukuran cache OCR dalam MB (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='Selalu OCR ulang, jangan pakai cache')
+    parser.add_argument('--dpi', type=int, default=None,
+                        help='Resolusi render halaman PDF (default: KTP_PDF_DPI atau 200)')
+    parser.add_argument('--metrics-log', metavar='PATH',
+                        help='Tulis timing per stage tiap file ke file JSONL')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Jangan print progress per file')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        formats = [(path, _output_format(path)) for path in args.output]
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    paths = collect_files(args.inputs, args.recursive)
+    if not paths:
+        print("❌ Tidak ada file gambar (.jpg/.jpeg/.png), dokumen (.pdf/.tif), atau arsip (.zip) yang ditemukan", file=sys.stderr)
+        return 1
+
+    use_processes = {"process": True, "thread": False}.get(args.pool)
+    scanner = BatchScanner(args.workers, args.memory_budget, use_processes)
+    if args.metrics_log:
+        scanner.metrics.log_path = args.metrics_log
+
+    reader = None
+    if not scanner.use_processes:
+        try:
+            reader = create_reader()
+        except Exception as e:
+            print(f"❌ Error loading OCR: {e}", file=sys.stderr)
+            return 1
+
+    cache = None if args.no_cache else OcrCache(args.cache_dir, args.cache_max_mb)
+
+    mode = "process" if scanner.use_processes else "thread"
+    print(f"🔍 {len(paths)} file, {scanner.workers} worker ({mode} pool)", file=sys.stderr)
+
+    records = []
+    failed = 0
+    files_done = 0
+    # Isi ZIP baru diketahui saat dibaca, total file tidak pasti
+    total_label = "?" if any(p.lower().endswith(ARCHIVE_EXTENSIONS) for p in paths) else len(paths)
+    started = time.perf_counter()
+    try:
+        # PDF/TIFF dirender per halaman & member ZIP dibaca saat worker siap (tidak sekaligus)
+        items, document_errors = expand_documents((FileScanItem(p) for p in paths), args.dpi)
+        # Koreksi nama dari operator UI (kamus di disk, KTP_FIXES_PATH)
+        # Read-only: jangan padatkan log yang mungkin sedang ditulis server
+        learned_fixes = LearnedFixStore.from_env(read_only=True).snapshot()
+        for item, res in scanner.scan(items, thumbnail_size=None, reader=reader,
+                                      learned_fixes=learned_fixes, cache=cache):
+            # Lembar multi-KTP: 1 file -> beberapa baris, ditandai nomor kartu
+            card_index = res.get("CARD_INDEX", 0) if res else 0
+            page = getattr(item, "page", None)
+            # Member ZIP: nama item = "arsip.zip/member.jpg"
+            path = item.source if page else getattr(item, "path", item.name)
+            if not card_index and (page or 1) == 1:
+                files_done += 1
+            source = f"{path} hal. {page}" if page else path
+            if res and res.get("CARD_COUNT", 1) > 1:
+                source += f" #{card_index + 1}"
+            if res and not res.get("message"):
+                record = result_to_record(res, path)
+                record["FILENAME"] = source
+                record["KETERANGAN"] = res.get("error_detail") or ""
+                status = f"⚠️ {record['KETERANGAN']}" if res.get("error") else "✅"
+            else:
+                failed += 1
+                message = res.get("message", "Tidak bisa diproses") if res else "Tidak bisa diproses"
+                record = result_to_record({"SOURCE_FILE": path, "PAGE": page} if page else {}, path)
+                record["FILENAME"] = source
+                record["KETERANGAN"] = message
+                status = message
+            del record["IMAGE_DATA"]
+            records.append((path, page or 0, card_index, record))
+
+            if not args.quiet:
+                print(f"[{files_done}/{total_label}] {source}: {status}", file=sys.stderr)
+    finally:
+        scanner.shutdown()
+
+    # Dokumen yang gagal dibuka tetap tercatat di output
+    for path, message in document_errors:
+        failed += 1
+        record = result_to_record({}, path)
+        record["FILENAME"] = path
+        record["KETERANGAN"] = f"❌ {message}"
+        del record["IMAGE_DATA"]
+        records.append((path, 0, 0, record))
+        print(f"❌ {path}: {message}", file=sys.stderr)
+
+    # Urutkan sesuai nama file supaya output stabil (hasil pool datang acak)
+    records = [r[-1] for r in sorted(records, key=lambda r: r[:3])]
+    rows = build_export_rows(records, include_source=True)
+    for path, fmt in formats:
+        with open(path, 'wb') as fh:
+            fh.write(EXPORTERS[fmt](rows))
+        print(f"💾 {path}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    if not args.quiet:
+        for row in scanner.metrics.rolling_summary():
+            print(f"   {row['stage']:<12} p50 {row['p50_ms']:>8.1f} ms   p95 {row['p95_ms']:>8.1f} ms", file=sys.stderr)
+    print(f"✅ Selesai: {len(paths)} file, {len(records) - failed} kartu berhasil, {failed} gagal, "
+          f"{elapsed:.1f} detik", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,24 @@
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
 import cv2
 import re
 import io
-import concurrent.futures
+import uuid
 from PIL import Image
-import requests
-import json
 from datetime import datetime
 
+from ktp_core import result_to_record
+from ktp_cache import OcrCache
+from ktp_engine import BatchScanner, OcrWarmup
+from ktp_export import EXPORTERS, build_export_rows, parquet_support
+from ktp_ingest import count_pages, expand_documents, is_archive, is_document, pdf_support
+from ktp_metrics import DEFAULT_METRICS_HOST, STAGES, serve_prometheus
+from ktp_store import RecordStore, new_workspace_id
+from ktp_sync import GSheetSync
+from ktp_fixes import LearnedFixStore
+
 # --- CONFIG ---
 # Load logo untuk favicon
 try:
@@ -178,752 +187,111 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- LAZY LOAD OCR ---
-@st.cache_resource(show_spinner="🔄 Loading OCR engine... (first time only, ~30 sec)")
+# --- PRE-WARM OCR ---
+@st.cache_resource
+def load_scanner():
+    """Worker pool di-share semua session (config via KTP_MAX_WORKERS / KTP_MEMORY_BUDGET_MB)"""
+    return BatchScanner.from_env()
+
+@st.cache_resource
+def load_ocr_warmup():
+    """Load + warm-up model OCR di background, sekali per proses server"""
+    return OcrWarmup(load_scanner()).start()
+
 def load_ocr():
-    try:
-        import easyocr
-        return easyocr.Reader(['id', 'en'], gpu=False, verbose=False)
-    except Exception as e:
-        st.error(f"❌ Error loading OCR: {str(e)}")
+    """Tunggu warm-up selesai. Returns: reader (mode thread), None kalau gagal"""
+    warmup = load_ocr_warmup()
+    if not warmup.is_ready:
+        with st.spinner("🔄 Menyiapkan OCR engine..."):
+            warmup.wait()
+    if warmup.status == "error":
+        st.error(f"❌ Error loading OCR: {warmup.error}")
         st.info("💡 Try refreshing the page or contact support")
         return None
+    return warmup.reader
 
-# --- GOOGLE SHEETS AUTO-SYNC FUNCTIONS ---
-def load_from_gsheet():
-    """AUTO LOAD dari Google Sheets via Apps Script"""
-    try:
-        # Cek apakah ada URL di secrets
-        if 'gsheet' not in st.secrets or 'url' not in st.secrets['gsheet']:
-            return {}
-        
-        url = st.secrets["gsheet"]["url"]
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                count = data.get('count', 0)
-                if count > 0:
-                    st.sidebar.caption(f"📡 Cloud: {count} koreksi loaded")
-                return data.get('data', {})
-        
-        return {}
-    except Exception as e:
-        # Silent fail - fallback ke hardcoded
-        return {}
-
-def save_to_gsheet(wrong_name, correct_name):
-    """AUTO SAVE ke Google Sheets via Apps Script"""
-    try:
-        if 'gsheet' not in st.secrets or 'url' not in st.secrets['gsheet']:
-            return False
-        
-        url = st.secrets["gsheet"]["url"]
-        
-        payload = {
-            "wrong": wrong_name,
-            "correct": correct_name
-        }
-        
-        response = requests.post(
-            url,
-            data=json.dumps(payload),
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('success', False)
-        
-        return False
-    except Exception as e:
-        return False
+# Mulai warm-up begitu server melayani session pertama (bukan saat klik scan)
+ocr_warmup = load_ocr_warmup()
 
-# --- FUNGSI VALIDASI KUALITAS FOTO ---
-def check_image_quality(image):
-    """
-    Validasi kualitas foto KTP sebelum OCR
-    Returns: (is_valid, message, warnings)
-    """
-    try:
-        h, w = image.shape[:2]
-        warnings = []
-        
-        # 1. Cek resolusi minimal (lebih toleran)
-        if w < 200 or h < 150:
-            return False, f"❌ Resolusi terlalu kecil ({w}x{h}). Min: 200x150 px", warnings
-        
-        if w < 400 or h < 250:
-            warnings.append(f"⚠️ Resolusi rendah ({w}x{h}), hasil OCR mungkin kurang akurat")
-        
-        # 2. Cek aspect ratio - SKIP! Terlalu banyak false positive
-        # Banyak foto KTP yang valid tapi aspect ratio aneh karena:
-        # - Foto miring/rotated
-        # - Ada border/margin
-        # - Cropped tidak sempurna
-        # - Screenshot dengan padding
-        
-        # aspect_ratio = w / h if h > 0 else 0
-        # if aspect_ratio < 0.8 or aspect_ratio > 2.5:
-        #     warnings.append(f"⚠️ Rasio foto {aspect_ratio:.2f}:1 (ideal: ~1.5:1)")
-        
-        # 3. Cek blur/focus (lebih toleran)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        
-        if laplacian_var < 30:  # Turunin dari 50
-            return False, f"❌ Foto terlalu blur (score: {laplacian_var:.0f}). Min: 30", warnings
-        
-        if laplacian_var < 80:  # Warning threshold
-            warnings.append(f"⚠️ Foto agak blur (score: {laplacian_var:.0f})")
-        
-        # 4. Cek brightness (lebih toleran)
-        mean_brightness = np.mean(gray)
-        
-        if mean_brightness < 20:  # Turunin dari 30
-            return False, f"❌ Foto terlalu gelap ({mean_brightness:.0f}). Min: 20", warnings
-        
-        if mean_brightness > 245:  # Naikin dari 240
-            return False, f"❌ Foto terlalu terang ({mean_brightness:.0f}). Max: 245", warnings
-        
-        if mean_brightness < 50:
-            warnings.append(f"⚠️ Foto agak gelap ({mean_brightness:.0f})")
-        
-        if mean_brightness > 210:
-            warnings.append(f"⚠️ Foto agak terang ({mean_brightness:.0f})")
-        
-        # All checks passed
-        quality_score = f"OK (focus: {laplacian_var:.0f}, brightness: {mean_brightness:.0f})"
-        return True, quality_score, warnings
-        
-    except Exception as e:
-        # Jika validasi error, tetap lanjut
-        return True, "⚠️ Validasi skip", []
-
-# --- FUNGSI CROP KTP DARI SCREENSHOT ---
-def detect_and_crop_ktp(image):
-    """
-    Deteksi area KTP dalam screenshot/dokumen dan crop
-    Improved: Handle multiple KTP, KTP dengan text form di bawah
-    Returns: cropped KTP image atau original jika tidak detect
-    """
-    try:
-        h, w = image.shape[:2]
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Method 1: Cari KTP area dengan edge detection
-        edges = cv2.Canny(gray, 30, 100)
-        
-        # Dilate untuk connect edges
-        kernel = np.ones((5,5), np.uint8)
-        dilated = cv2.dilate(edges, kernel, iterations=2)
-        
-        # Find contours
-        contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Cari contour yang ukurannya mirip KTP
-        ktp_candidates = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            
-            # KTP minimal 15% dari total area, max 90%
-            if area < (w * h * 0.15) or area > (w * h * 0.90):
-                continue
-            
-            # Get bounding box
-            x, y, cw, ch = cv2.boundingRect(contour)
-            
-            # Skip jika terlalu kecil
-            if cw < 200 or ch < 100:
-                continue
-            
-            # Aspect ratio KTP ~ 1.4-1.7, tapi lebih toleran
-            aspect = cw / ch if ch > 0 else 0
-            if aspect < 1.2 or aspect > 2.0:
-                continue
-            
-            ktp_candidates.append((area, x, y, cw, ch, aspect))
-        
-        # Method 2: Jika tidak detect dengan edge, coba detect blue area (KTP warna biru)
-        if not ktp_candidates:
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-            
-            # Range warna biru KTP (cyan-blue)
-            lower_blue = np.array([80, 40, 40])
-            upper_blue = np.array([130, 255, 255])
-            
-            mask_blue = cv2.inRange(hsv, lower_blue, upper_blue)
-            
-            # Find contours dari blue area
-            contours_blue, _ = cv2.findContours(mask_blue, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            for contour in contours_blue:
-                area = cv2.contourArea(contour)
-                
-                if area < (w * h * 0.15) or area > (w * h * 0.90):
-                    continue
-                
-                x, y, cw, ch = cv2.boundingRect(contour)
-                
-                if cw < 200 or ch < 100:
-                    continue
-                
-                aspect = cw / ch if ch > 0 else 0
-                if aspect < 1.2 or aspect > 2.0:
-                    continue
-                
-                ktp_candidates.append((area, x, y, cw, ch, aspect))
-        
-        # Ambil candidate terbaik (yang paling landscape & cukup besar)
-        if ktp_candidates:
-            # Sort by: aspect ratio mendekati 1.5 (ideal KTP), lalu by area
-            ktp_candidates.sort(key=lambda x: (abs(x[5] - 1.58), -x[0]))
-            
-            _, x, y, cw, ch, _ = ktp_candidates[0]
-            
-            # Crop dengan margin kecil
-            margin = 5
-            x1 = max(0, x - margin)
-            y1 = max(0, y - margin)
-            x2 = min(w, x + cw + margin)
-            y2 = min(h, y + ch + margin)
-            
-            cropped = image[y1:y2, x1:x2]
-            
-            # Validasi crop tidak terlalu kecil
-            if cropped.shape[0] > 100 and cropped.shape[1] > 150:
-                return cropped, True
-        
-        # Jika tidak detect, return original
-        return image, False
-        
-    except Exception as e:
-        return image, False
+@st.cache_resource
+def load_cache():
+    """Cache OCR di disk, di-share semua session (config via KTP_CACHE_DIR / KTP_CACHE_MAX_MB)"""
+    return OcrCache.from_env()
 
-# --- FUNGSI AUTO-ROTATE KTP ---
-def auto_rotate_ktp(image):
-    """
-    Deteksi orientasi KTP dan rotate otomatis
-    Returns: rotated image
-    """
-    try:
-        # Convert ke grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Detect edges
-        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-        
-        # Detect lines menggunakan Hough Transform
-        lines = cv2.HoughLines(edges, 1, np.pi/180, 200)
-        
-        if lines is not None:
-            # Hitung rata-rata sudut dari lines yang terdeteksi
-            angles = []
-            for rho, theta in lines[:20]:  # Ambil 20 lines pertama
-                angle = np.degrees(theta) - 90
-                angles.append(angle)
-            
-            # Median angle untuk avoid outliers
-            median_angle = np.median(angles)
-            
-            # Jika sudut miring > 5 derajat, rotate
-            if abs(median_angle) > 5:
-                # Get image center
-                (h, w) = image.shape[:2]
-                center = (w // 2, h // 2)
-                
-                # Rotation matrix
-                M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-                
-                # Rotate image
-                rotated = cv2.warpAffine(
-                    image, M, (w, h),
-                    flags=cv2.INTER_CUBIC,
-                    borderMode=cv2.BORDER_REPLICATE
-                )
-                
-                return rotated, median_angle
-        
-        return image, 0
-        
-    except Exception as e:
-        # Jika gagal, return image asli
-        return image, 0
+@st.cache_resource
+def load_store():
+    """Penyimpanan data nasabah & foto preview di disk (config via KTP_STORE_DIR)"""
+    return RecordStore.from_env()
 
-def detect_ktp_orientation(image):
+@st.cache_resource
+def start_metrics_endpoint():
     """
-    Deteksi orientasi KTP (landscape vs portrait)
-    dan rotate jika perlu
+    Endpoint Prometheus /metrics kalau KTP_METRICS_PORT di-set (sekali per proses server).
+    Default hanya localhost; KTP_METRICS_HOST=0.0.0.0 untuk dibuka ke jaringan.
     """
+    port = os.environ.get("KTP_METRICS_PORT", "").strip()
+    if not port.isdigit():
+        return None
+    host = os.environ.get("KTP_METRICS_HOST", "").strip() or DEFAULT_METRICS_HOST
     try:
-        h, w = image.shape[:2]
-        
-        # KTP seharusnya landscape (width > height)
-        # Jika portrait (height > width), rotate 90 derajat
-        if h > w:
-            # Rotate 90 degrees
-            rotated = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
-            return rotated, 90
-        
-        return image, 0
-        
-    except Exception as e:
-        return image, 0
-
-# --- FUNGSI EKSTRAKSI ---
-
-def clean_nik_advanced(text):
-    text = text.upper().replace(" ", "").replace(":", "").replace("-", "")
-    replacements = {
-        'O': '0', 'D': '0', 'Q': '0', 'U': '0', 'C': '0',
-        'L': '1', 'I': '1', 'T': '1', 'J': '1', '!': '1',
-        'Z': '2', 'E': '3', 'A': '4', 'S': '5', 
-        'G': '6', 'b': '6', '?': '7', 'B': '8', '&': '8'
-    }
-    for k, v in replacements.items():
-        text = text.replace(k, v)
-    return re.sub(r'\D', '', text)
+        return serve_prometheus(load_scanner().metrics, int(port), host)
+    except OSError:
+        return None
 
-def fix_nama_typo(nama_raw):
-    if not nama_raw: return ""
-    
-    # Kamus koreksi hardcoded (dari testing manual)
-    fixes_tested = {
-        'SUGIHANTI': 'SUGIANTI', 
-        'PCATII': 'PERTIWI', 
-        'PCATI': 'PERTIWI', 
-        'PCATWI': 'PERTIWI', 
-        'MAAGI': 'MARGI', 
-        'HANJTI': 'ANTI', 
-        'ANJTI': 'ANTI'
-    }
-    
-    # Kamus nama Indonesia umum
-    common_names = {
-        'SIT1': 'SITI', 'S1TI': 'SITI', 'SlTI': 'SITI',
-        'DEW1': 'DEWI', 'DEWl': 'DEWI', 'D3WI': 'DEWI',
-        'NUR': 'NUR', 'NUH': 'NUR', 'NUB': 'NUR',
-        'SRI': 'SRI', 'SR1': 'SRI', 'SRl': 'SRI',
-        'ANI': 'ANI', 'AN1': 'ANI', 'ANl': 'ANI',
-        'MUHAMAD': 'MUHAMMAD', 'MUHA MAD': 'MUHAMMAD', 'MOHAMAD': 'MUHAMMAD',
-        'MOIIAMMAD': 'MUHAMMAD', 'MUIIAMMAD': 'MUHAMMAD',
-        'AOMAD': 'AHMAD', 'ACMAD': 'AHMAD', 'AHMAO': 'AHMAD',
-        'AGUS': 'AGUS', 'ACUS': 'AGUS', 'AGU5': 'AGUS',
-        'BUDI': 'BUDI', 'BUD1': 'BUDI', 'BUDl': 'BUDI',
-        'RAHMAWAT1': 'RAHMAWATI', 'RAHMAWAT': 'RAHMAWATI',
-        'RAHMAWAN1': 'RAHMAWANI', 'RAHMAWAN': 'RAHMAWANI',
-        'SUGIARTO': 'SUGIARTO', 'SUG1ARTO': 'SUGIARTO',
-        'PRAT1WI': 'PRATIWI', 'PRATlWI': 'PRATIWI',
-        'PERMATA': 'PERMATA', 'PCRMATA': 'PERMATA',
-        'SUSANT1': 'SUSANTI', 'SUSANTl': 'SUSANTI',
-        'YUDH1': 'YUDHI', 'YUDHl': 'YUDHI',
-        'KUSUMO': 'KUSUMO', 'KUSUMA': 'KUSUMA',
-        'WIBOWO': 'WIBOWO', 'W1BOWO': 'WIBOWO',
-        'UTAM1': 'UTAMI', 'UTAMl': 'UTAMI',
-        'SETYAN1': 'SETYANI', 'SETYANl': 'SETYANI',
-        'WIDOD0': 'WIDODO', 'WID0DO': 'WIDODO',
-        'SUHARTO': 'SUHARTO', 'SUHART0': 'SUHARTO',
-        'WAHYUD1': 'WAHYUDI', 'WAHYUDl': 'WAHYUDI',
-        'SUPRI': 'SUPRI', 'SUPH1': 'SUPRI',
-    }
-    
-    # Gabungkan: cloud_fixes (prioritas tertinggi) > fixes_tested > common_names
-    all_fixes = {**common_names, **fixes_tested}
-    
-    # Tambahkan learned fixes dari cloud/session
-    if 'learned_fixes' in st.session_state and st.session_state.learned_fixes:
-        all_fixes.update(st.session_state.learned_fixes)
-    
-    result = nama_raw
-    for wrong, right in all_fixes.items():
-        result = result.replace(wrong, right)
-    
-    # Koreksi karakter umum
-    char_fixes = {'1': 'I', '0': 'O', '5': 'S'}
-    for w, r in char_fixes.items():
-        result = result.replace(w, r)
-    
-    return result.strip()
+start_metrics_endpoint()
 
-def extract_nik(text_list):
-    """Extract NIK 16 digit"""
-    
-    # STRATEGI 1: Cari setelah label "NIK"
-    for i, text in enumerate(text_list):
-        if re.search(r'\bNIK\b', text, re.IGNORECASE):
-            for j in range(i, min(i + 5, len(text_list))):
-                nums = re.sub(r'[^0-9]', '', text_list[j])
-                if len(nums) == 16:
-                    return nums
-                elif len(nums) > 16:
-                    return nums[:16]
-    
-    # STRATEGI 2: Cari 16 digit di semua text
-    for text in text_list:
-        nums = re.sub(r'[^0-9]', '', text)
-        if len(nums) == 16:
-            return nums
-        elif len(nums) > 16 and len(nums) < 20:
-            # Sliding window cari 16 digit
-            for start in range(len(nums) - 15):
-                candidate = nums[start:start+16]
-                # Simple validation: NIK dimulai 3 (untuk Jawa)
-                if candidate[0] == '3':
-                    return candidate
-    
-    # STRATEGI 3: Clean advanced typo
-    for text in text_list:
-        cleaned = clean_nik_advanced(text)
-        if len(cleaned) == 16:
-            return cleaned
-        elif len(cleaned) > 16:
-            return cleaned[:16]
-    
-    return ""
+def render_metrics_panel(container, stage):
+    """Tabel p50/p95 per stage + histogram latency 1 stage (rolling window)"""
+    metrics = load_scanner().metrics
+    summary = metrics.rolling_summary()
+    with container.container():
+        if not summary:
+            st.caption("Belum ada file yang diproses.")
+            return
+        st.dataframe(
+            pd.DataFrame(summary).set_index("stage"),
+            use_container_width=True
+        )
+        histogram = metrics.rolling_histogram(stage)
+        if histogram:
+            st.caption(f"Histogram latency **{stage}** ({sum(c for _, c in histogram)} file terakhir)")
+            st.bar_chart(pd.DataFrame(histogram, columns=["latency", "file"]).set_index("latency"))
 
-def extract_form_data(text_list):
-    """
-    Extract data tambahan dari form text di bawah KTP
-    (nama lengkap, nama ibu kandung, no HP, email)
-    Returns: dict with extracted data
-    """
-    form_data = {
-        "NAMA_FORM": "",
-        "NAMA_IBU": "",
-        "NO_HP": "",
-        "EMAIL": ""
-    }
-    
-    try:
-        for i, text in enumerate(text_list):
-            text_clean = text.strip()
-            text_upper = text_clean.upper()
-            
-            # Extract NAMA LENGKAP dari form
-            if re.search(r'nama\s*lengkap\s*:', text_upper):
-                # Ambil text setelah ":"
-                match = re.search(r'nama\s*lengkap\s*:\s*(.+)', text_clean, re.IGNORECASE)
-                if match:
-                    nama = match.group(1).strip()
-                    # Clean
-                    nama = re.sub(r'[^A-Za-z\s]', '', nama).upper().strip()
-                    if len(nama) > 5:
-                        form_data["NAMA_FORM"] = nama
-                # Atau di baris berikutnya
-                elif i + 1 < len(text_list):
-                    nama = text_list[i + 1].strip()
-                    nama = re.sub(r'[^A-Za-z\s]', '', nama).upper().strip()
-                    if len(nama) > 5:
-                        form_data["NAMA_FORM"] = nama
-            
-            # Extract NAMA IBU KANDUNG
-            if re.search(r'nama\s*ibu\s*kandung|nama\s*gadis\s*ibu', text_upper):
-                match = re.search(r':\s*(.+)', text_clean)
-                if match:
-                    nama_ibu = match.group(1).strip()
-                    nama_ibu = re.sub(r'[^A-Za-z\s]', '', nama_ibu).upper().strip()
-                    if len(nama_ibu) > 3:
-                        form_data["NAMA_IBU"] = nama_ibu
-                elif i + 1 < len(text_list):
-                    nama_ibu = text_list[i + 1].strip()
-                    nama_ibu = re.sub(r'[^A-Za-z\s]', '', nama_ibu).upper().strip()
-                    if len(nama_ibu) > 3:
-                        form_data["NAMA_IBU"] = nama_ibu
-            
-            # Extract NO HP / NO TELP
-            if re.search(r'no\s*\.?\s*hp|no\s*\.?\s*telp|telepon|handphone', text_upper):
-                # Cari nomor HP (08xxx atau 62xxx, 10-15 digit)
-                match = re.search(r':\s*([0-9\s\-\+]+)', text_clean)
-                if match:
-                    hp = re.sub(r'[^0-9]', '', match.group(1))
-                    if 10 <= len(hp) <= 15:
-                        form_data["NO_HP"] = hp
-                # Atau cari di baris yang sama/berikutnya
-                else:
-                    for j in range(i, min(i + 2, len(text_list))):
-                        nums = re.sub(r'[^0-9]', '', text_list[j])
-                        if 10 <= len(nums) <= 15 and (nums.startswith('08') or nums.startswith('62')):
-                            form_data["NO_HP"] = nums
-                            break
-            
-            # Extract EMAIL
-            if re.search(r'email|e-mail|e\s*mail', text_upper):
-                # Cari email pattern
-                match = re.search(r':\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', text_clean, re.IGNORECASE)
-                if match:
-                    form_data["EMAIL"] = match.group(1).lower()
-                # Atau cari di baris berikutnya
-                elif i + 1 < len(text_list):
-                    email_match = re.search(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', text_list[i + 1], re.IGNORECASE)
-                    if email_match:
-                        form_data["EMAIL"] = email_match.group(1).lower()
-            
-            # Cari email pattern di semua text (tanpa label)
-            if not form_data["EMAIL"]:
-                email_match = re.search(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', text_clean, re.IGNORECASE)
-                if email_match:
-                    form_data["EMAIL"] = email_match.group(1).lower()
-        
-        return form_data
-        
-    except Exception as e:
-        return form_data
+# --- GOOGLE SHEETS AUTO-SYNC FUNCTIONS ---
+# Maksimal tunggu load koreksi pertama, hanya kalau kamus di disk masih kosong
+GSHEET_INITIAL_LOAD_SECONDS = 10
 
-def extract_nama(text_list):
-    """Extract nama dengan filtering sederhana tapi efektif"""
-    
-    # Blacklist kata yang BUKAN nama
-    blacklist = [
-        "PROVINSI", "KABUPATEN", "KOTA", "NIK", "NAMA", "LAHIR", "DARAH", 
-        "ALAMAT", "RT/RW", "KEL/DESA", "KECAMATAN", "AGAMA", "KAWIN", 
-        "PEKERJAAN", "ISLAM", "KRISTEN", "KATOLIK", "HINDU", "BUDDHA", "KONGHUCU",
-        "WNI", "BELUM", "STATUS", "PERKAWINAN", "PERKAWNAN", "BERLAKU", 
-        "HINGGA", "SEUMUR", "HIDUP", "TANGGAL", "TEMPAT", "JENIS", "KELAMIN", 
-        "GOLONGAN", "GOLAN", "KEWARGANEGARAAN", "WARGA", "NEGARA", "REPUBLIK", 
-        "INDONESIA", "SIDOARJO", "SURABAYA", "MOJOKERTO", "MALANG", "GRESIK",
-        "PASURUAN", "PROBOLINGGO", "JAWA", "TIMUR", "BARAT", "SELATAN", "UTARA", 
-        "TENGAH", "KARYAWAN", "SWASTA", "PEDAGANG", "PETANI", "BURUH", "PNS", 
-        "TNI", "POLRI", "MENGURUS", "RUMAH", "TANGGA", "PELAJAR", "MAHASISWA",
-        "WIRASWASTA", "WIRAUSAHA"
-    ]
-    
-    # STRATEGI 1: Cari setelah label "Nama"
-    for i, text in enumerate(text_list):
-        if re.search(r'\bnama\b|namà', text, re.IGNORECASE):
-            for j in range(i + 1, min(i + 3, len(text_list))):
-                candidate = text_list[j].strip()
-                cleaned = re.sub(r'[^A-Za-z\s]', '', candidate).upper().strip()
-                
-                # Basic filters
-                if len(cleaned) < 5 or len(cleaned) > 50:
-                    continue
-                if not ' ' in cleaned:  # Harus ada spasi
-                    continue
-                if any(word in cleaned for word in blacklist):
-                    continue
-                
-                # Check angka di original text
-                digit_count = sum(c.isdigit() for c in candidate)
-                if digit_count > 3:
-                    continue
-                
-                return fix_nama_typo(cleaned)
-    
-    # STRATEGI 2: Cari text yang kayak nama (panjang & ada spasi)
-    candidates = []
-    for text in text_list:
-        cleaned = re.sub(r'[^A-Z\s]', '', text.upper()).strip()
-        
-        # Filter basic
-        if len(cleaned) < 10 or len(cleaned) > 50:
-            continue
-        
-        words = cleaned.split()
-        if len(words) < 2 or len(words) > 5:
-            continue
-        
-        # Skip blacklist
-        if any(word in cleaned for word in blacklist):
-            continue
-        
-        # Skip jika ada kata yang terlalu panjang
-        if any(len(word) > 20 for word in words):
-            continue
-        
-        # Check digit count
-        digit_count = sum(c.isdigit() for c in text)
-        if digit_count > 3:
-            continue
-        
-        candidates.append(cleaned)
-    
-    # Return yang terpanjang
-    if candidates:
-        return fix_nama_typo(max(candidates, key=len))
-    
-    return ""
+@st.cache_resource
+def load_fix_store():
+    """Kamus learned fixes bersama semua session (disimpan di disk, KTP_FIXES_PATH)"""
+    return LearnedFixStore.from_env()
 
-# --- WORKER PROCESS ---
-def worker_process(file_item, thumbnail_size, reader):
+@st.cache_resource
+def load_gsheet_sync():
+    """Worker sync Google Sheets di background, 1 per proses server (None kalau URL belum di-set)"""
     try:
-        if reader is None:
+        if 'gsheet' not in st.secrets or 'url' not in st.secrets['gsheet']:
             return None
-            
-        f_bytes = file_item.getvalue()
-        nparr = np.frombuffer(f_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            return {
-                "error": True,
-                "message": f"❌ Cannot decode image: {file_item.name}",
-                "FILENAME": file_item.name
-            }
-        
-        # STEP 0: Detect & Crop KTP dari screenshot (jika ada text/form di sekitar KTP)
-        img, was_cropped = detect_and_crop_ktp(img)
-        
-        # MEMORY OPTIMIZATION: Reduce image size jika terlalu besar
-        h_orig, w_orig = img.shape[:2]
-        max_dimension = 2000  # Max width/height sebelum OCR
-        
-        if w_orig > max_dimension or h_orig > max_dimension:
-            scale = max_dimension / max(w_orig, h_orig)
-            new_w = int(w_orig * scale)
-            new_h = int(h_orig * scale)
-            img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-            
-            # Force cleanup
-            import gc
-            gc.collect()
-        
-        # VALIDASI KUALITAS FOTO (CRITICAL!)
-        is_valid, quality_msg, warnings = check_image_quality(img)
-        
-        if not is_valid:
-            return {
-                "error": True,
-                "message": f"{file_item.name}: {quality_msg}",
-                "FILENAME": file_item.name
-            }
-        
-        # STEP 1: Deteksi orientasi (portrait vs landscape)
-        img, orientation_angle = detect_ktp_orientation(img)
-        
-        # STEP 2: Auto-rotate untuk koreksi kemiringan
-        img, rotation_angle = auto_rotate_ktp(img)
-        
-        h, w = img.shape[:2]
-        
-        # STEP 3: Resize untuk OCR - OPTIMIZED untuk cloud
-        h, w = img.shape[:2]
-        
-        # Adaptive sizing: lebih kecil untuk file besar
-        if w > 2000 or h > 1500:
-            target_width = 1200  # Smaller untuk save memory
-        else:
-            target_width = 1500  # Normal size
-        
-        img_ocr = cv2.resize(img, (target_width, int(h * (target_width/w))), interpolation=cv2.INTER_AREA)
-        
-        # Clear original large image dari memory
-        del img
-        import gc
-        gc.collect()
-        
-        # STEP 4: Preprocessing - SIMPLE IS BETTER!
-        gray = cv2.cvtColor(img_ocr, cv2.COLOR_BGR2GRAY)
-        
-        # Just blur, jangan terlalu banyak processing
-        processed = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Clear intermediate
-        del gray
-        gc.collect()
-        
-        # STEP 5: OCR
-        results = reader.readtext(processed)
-        
-        # Clear processed image
-        del processed
-        gc.collect()
-        
-        # Simple text extraction - jangan over-filter!
-        text_list = [r[1].strip() for r in results if len(r[1].strip()) > 1]
-        
-        # Clear OCR results
-        del results
-        gc.collect()
-        
-        # STEP 6: Extract data dari KTP
-        extracted_name = extract_nama(text_list)
-        extracted_nik = extract_nik(text_list)
-        
-        # STEP 6B: Extract data dari FORM TEXT (fallback/supplement)
-        form_data = extract_form_data(text_list)
-        
-        # MERGE DATA: Gunakan form data sebagai fallback atau perbandingan
-        final_name = extracted_name or form_data.get("NAMA_FORM", "")
-        final_nik = extracted_nik
-        final_nama_ibu = form_data.get("NAMA_IBU", "")
-        final_hp = form_data.get("NO_HP", "")
-        final_email = form_data.get("EMAIL", "")
-        
-        # Perbandingan nama (jika ada kedua-duanya)
-        if extracted_name and form_data.get("NAMA_FORM") and extracted_name != form_data["NAMA_FORM"]:
-            # Ada perbedaan - prioritas form (lebih jelas)
-            final_name = form_data["NAMA_FORM"]
-        
-        # Clear text list
-        del text_list
-        import gc
-        gc.collect()
-        
-        # VALIDASI HASIL OCR - Tetap simpan foto walaupun gagal!
-        has_error = False
-        error_detail = ""
-        
-        if not final_name and not final_nik:
-            has_error = True
-            error_detail = "Nama & NIK tidak terdeteksi"
-        elif not final_name:
-            has_error = True
-            error_detail = "Nama tidak terdeteksi"
-        elif not final_nik:
-            has_error = True  
-            error_detail = "NIK tidak terdeteksi"
-        
-        # STEP 7: Simpan preview - ORIGINAL QUALITY (tidak compress)
-        # Baca ulang dari file bytes untuk quality terbaik
-        preview_img = Image.open(io.BytesIO(f_bytes))
-        
-        # Resize proporsional ke lebar target (maintain quality)
-        w_prev, h_prev = preview_img.size
-        if w_prev > thumbnail_size:
-            ratio = thumbnail_size / w_prev
-            new_h = int(h_prev * ratio)
-            preview_img = preview_img.resize((thumbnail_size, new_h), Image.LANCZOS)
-        
-        img_buffer = io.BytesIO()
-        # High quality JPEG - tidak terlalu compress
-        preview_img.save(img_buffer, format='JPEG', quality=95, optimize=False)
-        img_buffer.seek(0)
-        
-        # Clear preview
-        del preview_img
-        gc.collect()
-        
-        rotation_info = quality_msg
-        if was_cropped:
-            rotation_info += " | Auto-cropped dari screenshot"
-        if warnings:
-            rotation_info += " | " + " | ".join(warnings)
-        if orientation_angle != 0:
-            rotation_info += f" | Rotated {orientation_angle}°"
-        if rotation_angle != 0:
-            rotation_info += f" | Adjusted {rotation_angle:.1f}°"
-        
-        # Return data dengan flag error (tapi tetap ada foto!)
-        return {
-            "error": has_error,
-            "error_detail": error_detail if has_error else None,
-            "IMAGE_DATA": img_buffer.getvalue(),
-            "NAMA": final_name,
-            "NOMORIDENTITAS": final_nik,
-            "NAMA_IBU": final_nama_ibu,  # NEW!
-            "NO_HP": final_hp,            # NEW!
-            "EMAIL": final_email,         # NEW!
-            "FILENAME": file_item.name,
-            "ROTATION_INFO": rotation_info
-        }
-    except Exception as e:
-        return {
-            "error": True,
-            "message": f"❌ Error processing {file_item.name}: {str(e)}",
-            "FILENAME": file_item.name
-        }
+        url = st.secrets["gsheet"]["url"]
+        # POST batch hanya untuk Apps Script yang sudah mendukungnya (opt-in)
+        batch = st.secrets["gsheet"].get("batch")
+    except Exception:
+        return None
+    fix_store = load_fix_store()
+    # Hasil refresh dari Sheets langsung di-merge ke kamus bersama
+    sync = GSheetSync.from_env(url, listener=fix_store.merge,
+                               batch=None if batch is None else bool(batch)).start()
+    if not len(fix_store.snapshot()):
+        sync.wait_loaded(GSHEET_INITIAL_LOAD_SECONDS)
+    return sync
+
+def save_to_gsheet(wrong_name, correct_name):
+    """AUTO SAVE: antre koreksi, dikirim di background (tidak blocking UI)"""
+    sync = load_gsheet_sync()
+    if sync is None:
+        return False
+    sync.submit(wrong_name, correct_name)
+    return True
 
 # --- UI MAIN ---
 # Header dengan branding BRI
@@ -980,19 +348,25 @@ except:
     pass
 
 st.sidebar.markdown("### ⚙️ Pengaturan Sistem")
+if ocr_warmup.status == "ready":
+    st.sidebar.success("🟢 OCR engine siap", icon="✅")
+elif ocr_warmup.status == "loading":
+    st.sidebar.info("🟡 OCR engine sedang disiapkan (warm-up)...", icon="⏳")
+else:
+    st.sidebar.error(f"🔴 OCR engine gagal dimuat: {ocr_warmup.error}", icon="❌")
 st.sidebar.markdown("---")
 
 st.sidebar.info("""
 **⌨️ PANDUAN PENGGUNAAN:**
 1. Foto KTP dengan kamera langsung
-2. **1 KTP per foto** (penting!)
+2. 1 KTP per foto, atau lembar scan berisi beberapa KTP (tidak saling menempel)
 3. Landscape, fokus, cahaya cukup
 4. Klik **MULAI PEMINDAIAN**
 5. **TAB** = Pindah antar field
 6. Data tersimpan otomatis
 
 ❌ **JANGAN:**
-• Multiple KTP dalam 1 foto
+• KTP saling tumpang tindih dalam 1 foto
 • Screenshot dari PDF/WhatsApp
 • Foto blur atau gelap
 • Foto terlalu miring
@@ -1000,14 +374,14 @@ st.sidebar.info("""
 
 st.sidebar.warning("""
 **⚠️ Tips Optimal Processing:**
-- **1 file per detik** (with cleanup)
+- File diproses **paralel** (worker pool)
 - **Max 8-10 file** per batch (recommended)
 - File >1MB: Max 5 per batch
 - Jika crash: Batch lebih kecil (3-5 files)
 
 ⏱️ **Estimasi waktu:**
-- 5 files: ~10 detik
-- 10 files: ~20 detik
+- Tergantung jumlah core server
+- 8 core: 10 files ≈ waktu 1-2 file sequential
 
 💡 **Best practice:** Upload 5-8 files per batch!
 """, icon="⚠️")
@@ -1047,43 +421,276 @@ show_field_numbers = st.sidebar.checkbox(
 )
 
 # ===== INISIALISASI SESSION STATE =====
+# Data nasabah disimpan di disk per workspace (id di URL ?ws=...), session
+# hanya pegang baris ringan tanpa foto -> tetap ada setelah refresh/restart
+record_store = load_store()
+if 'workspace' not in st.session_state:
+    workspace = st.query_params.get("ws") or new_workspace_id()
+    st.query_params["ws"] = workspace
+    st.session_state.workspace = workspace
+workspace = st.session_state.workspace
+
 if 'data_db' not in st.session_state:
-    st.session_state.data_db = []
+    st.session_state.data_db = record_store.records(workspace)
 if 'processed_files' not in st.session_state:
-    st.session_state.processed_files = set()
+    st.session_state.processed_files = record_store.processed_keys(workspace)
 
-# Load learned fixes dari Google Sheets (AUTO-SYNC!)
-if 'learned_fixes' not in st.session_state:
-    cloud_fixes = load_from_gsheet()
-    st.session_state.learned_fixes = cloud_fixes
+# Learned fixes: 1 kamus per proses server, di-update Google Sheets (AUTO-SYNC!)
+# & koreksi semua operator. Tiap rerun baca snapshot terbaru (tanpa lock/copy).
+fix_store = load_fix_store()
+gsheet_sync = load_gsheet_sync()
+learned_fixes = fix_store.snapshot()
     
 if 'original_ocr_results' not in st.session_state:
-    st.session_state.original_ocr_results = {}
+    st.session_state.original_ocr_results = record_store.ocr_results(workspace)
+# Naik setiap data_db berubah -> preview & file export dibangun ulang hanya kalau perlu
+if 'data_version' not in st.session_state:
+    st.session_state.data_version = 0
+if 'export_state' not in st.session_state:
+    # Dibaca callable st.download_button (thread lain, tanpa akses st.session_state):
+    # data_db & data_version terkini + file export yang sudah dibuat per (version, format)
+    st.session_state.export_state = {"db": st.session_state.data_db, "version": 0, "files": {}}
+
+def bump_data_version():
+    st.session_state.data_version += 1
+    export_state = st.session_state.export_state
+    export_state["db"] = st.session_state.data_db
+    export_state["version"] = st.session_state.data_version
+
+def update_field(row, field, value):
+    """Edit 1 field kartu: session + store di disk"""
+    row[field] = value
+    record_store.update(row["ROW_ID"], field, value)
+    bump_data_version()
+
+def mark_processed(keys):
+    keys = set(keys)
+    st.session_state.processed_files.update(keys)
+    record_store.mark_processed(workspace, keys)
 
 # Panel learned fixes
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 🧠 Pembelajaran Sistem")
 
-if st.session_state.learned_fixes:
-    total = len(st.session_state.learned_fixes)
+if learned_fixes:
+    total = len(learned_fixes)
     st.sidebar.success(f"📚 {total} koreksi tersimpan")
     
     with st.sidebar.expander(f"📖 Database ({total} koreksi)"):
-        for idx, (wrong, right) in enumerate(sorted(st.session_state.learned_fixes.items()), 1):
+        for idx, (wrong, right) in enumerate(sorted(learned_fixes.items()), 1):
             st.write(f"{idx}. `{wrong}` → `{right}`")
 else:
     st.sidebar.info("💡 Belum ada pembelajaran.\n\nSistem akan otomatis belajar saat admin mengoreksi nama OCR.", icon="🎓")
 
+if gsheet_sync is not None:
+    sync_status = gsheet_sync.status()
+    if sync_status["pending"]:
+        st.sidebar.caption(f"📡 {sync_status['pending']} koreksi antre dikirim ke Google Sheets")
+    if sync_status["last_error"]:
+        st.sidebar.caption(f"⚠️ Sync Google Sheets: {sync_status['last_error']} (dicoba lagi otomatis)")
+
+ocr_cache = load_cache()
+if ocr_cache is not None:
+    cache_count, cache_bytes = ocr_cache.stats()
+    st.sidebar.caption(f"💾 Cache OCR: {cache_count} foto ({cache_bytes / 1024 / 1024:.1f} MB)")
+st.sidebar.caption(f"🗂️ Workspace `{workspace}`: {len(st.session_state.data_db)} kartu tersimpan di server. "
+                   "Buka URL yang sama untuk melanjutkan setelah refresh.")
+
+# Panel metrics per stage - update live selama scan
+with st.sidebar.expander("📈 Metrics per Stage"):
+    metrics_stage = st.selectbox(
+        "Histogram stage",
+        options=list(STAGES),
+        index=list(STAGES).index("readtext"),
+        help="Latency per stage dari file-file terakhir (rolling window)"
+    )
+    metrics_placeholder = st.empty()
+render_metrics_panel(metrics_placeholder, metrics_stage)
+
 uploaded_files = st.file_uploader(
     "📤 Upload Foto KTP Nasabah", 
-    type=['jpg','png','jpeg'], 
+    type=['jpg','png','jpeg','pdf','tif','tiff','zip'], 
     accept_multiple_files=True,
-    help="💡 Recommended: 10-15 file per batch | File >2MB: 5-10 per batch"
+    help="💡 Recommended: 10-15 file per batch | File >2MB: 5-10 per batch | PDF/TIFF multi-halaman diproses per halaman | Ratusan foto: upload 1 file ZIP"
 )
 
 button_placeholder = st.container()
 status_placeholder = st.container()
 
+# Filter review kartu: nama -> fungsi(row) -> bool
+CARD_FILTERS = {
+    "Semua kartu": lambda row: True,
+    "Hanya kartu error": lambda row: bool(row.get("KETERANGAN")),
+    "NIK kosong / belum 16 digit": lambda row: not re.fullmatch(r"\d{16}", row.get("NOMORIDENTITAS") or ""),
+}
+CARD_ROWS_PER_PAGE = (5, 10, 25)
+# Interval refresh panel progres (detik), edit kartu tidak rerun seluruh app
+PROGRESS_REFRESH_SECONDS = 2
+
+def delete_record(row_id):
+    """Hapus 1 kartu dari session & store di disk"""
+    db = st.session_state.data_db
+    idx = next(i for i, r in enumerate(db) if r["ROW_ID"] == row_id)
+    record_store.delete(db.pop(idx)["ROW_ID"])
+    bump_data_version()
+
+@st.fragment
+def render_card(idx, row):
+    """
+    1 kartu nasabah. Fragment: ketik di 1 field hanya rerun kartu ini,
+    bukan seluruh halaman (kartu lain, preview export, dll). Progres & preview
+    punya fragment sendiri (render_progress, render_export_preview), tombol
+    download membaca data_db terbaru saat diklik.
+    Widget key pakai ROW_ID supaya tetap nempel ke kartunya walau ada yang dihapus.
+    """
+    row_id = row["ROW_ID"]
+    with st.container():
+        col_h1, col_h2 = st.columns([3, 1])
+        with col_h1:
+            st.markdown(f"### 💳 Nasabah #{idx + 1}")
+        with col_h2:
+            if st.button("🗑️", key=f"del_{row_id}", help="Hapus KTP ini"):
+                delete_record(row_id)
+                # Hapus kartu mengubah nomor & jumlah halaman -> rerun seluruh app
+                st.rerun()
+
+        if row.get("KETERANGAN"):
+            st.caption(f"⚠️ {row['KETERANGAN']}")
+        st.divider()
+
+        # LAYOUT: Foto di kiri (lebih kecil), Form di kanan (lebih lebar)
+        # Ratio disesuaikan agar form punya space lebih untuk input
+        col_foto, col_form = st.columns([1, 2])  # 1:2 ratio
+
+        with col_foto:
+            st.markdown("**📸 Preview KTP**")
+            # Foto dibaca dari disk hanya saat kartu ditampilkan
+            thumb_path = record_store.thumbnail(row.get("THUMB"))
+            if thumb_path:
+                st.image(thumb_path, use_container_width=True)
+            else:
+                st.warning("Foto tidak tersedia")
+
+        with col_form:
+            st.markdown("**📝 Informasi Identitas**")
+
+            label_nama = "1️⃣ Nama Lengkap" if show_field_numbers else "Nama Lengkap"
+            new_nama = st.text_input(
+                label_nama,
+                value=row["NAMA"],
+                key=f"nama_{row_id}",
+                placeholder="Masukkan nama lengkap",
+                help="Tab untuk pindah ke NIK"
+            )
+
+            # AUTO-SAVE ke Google Sheets saat ada perubahan
+            if new_nama != row["NAMA"] and row.get("KTP_ID"):
+                ktp_id = row["KTP_ID"]
+                if ktp_id in st.session_state.original_ocr_results:
+                    original_nama = st.session_state.original_ocr_results[ktp_id]["NAMA"]
+
+                    if new_nama and original_nama and new_nama != original_nama:
+                        # Langsung berlaku untuk semua operator di server ini
+                        fix_store.merge({original_nama: new_nama})
+
+                        # AUTO-SAVE ke Google Sheets
+                        if save_to_gsheet(original_nama, new_nama):
+                            st.success(f"🧠 Auto-sync: `{original_nama}` → `{new_nama}` (dikirim ke Google Sheets di background)", icon="✅")
+                        else:
+                            st.info(f"💾 Saved locally: `{original_nama}` → `{new_nama}`", icon="ℹ️")
+
+                update_field(row, "NAMA", new_nama)
+
+            label_nik = "2️⃣ NIK (16 digit)" if show_field_numbers else "NIK (16 digit)"
+            new_nik = st.text_input(
+                label_nik,
+                value=row["NOMORIDENTITAS"],
+                key=f"nik_{row_id}",
+                placeholder="3516XXXXXXXXXXXX",
+                max_chars=16,
+                help="Tab untuk pindah ke Nama Ibu"
+            )
+            if new_nik != row["NOMORIDENTITAS"]:
+                update_field(row, "NOMORIDENTITAS", new_nik)
+
+            st.markdown("**ℹ️ Data Pelengkap Nasabah**")
+
+            label_ibu = "3️⃣ Nama Gadis Ibu" if show_field_numbers else "Nama Gadis Ibu"
+            ibu_value = row.get("NAMA GADIS IBU", "")
+            new_ibu = st.text_input(
+                label_ibu + (" ✨" if ibu_value else ""),  # Indicator jika auto-filled
+                value=ibu_value,
+                key=f"ibu_{row_id}",
+                placeholder="Nama gadis ibu kandung",
+                help="✨ = Auto-filled dari form text" if ibu_value else "Tab untuk pindah ke CIF"
+            )
+            if new_ibu != row.get("NAMA GADIS IBU", ""):
+                update_field(row, "NAMA GADIS IBU", new_ibu)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                label_cif = "4️⃣ CIF No" if show_field_numbers else "CIF No"
+                new_cif = st.text_input(
+                    label_cif,
+                    value=row.get("CIF NO", ""),
+                    key=f"cif_{row_id}",
+                    placeholder="CIF",
+                    help="Tab untuk pindah ke No HP"
+                )
+                if new_cif != row.get("CIF NO", ""):
+                    update_field(row, "CIF NO", new_cif)
+
+            with col2:
+                label_hp = "5️⃣ No HP" if show_field_numbers else "No HP"
+                hp_value = row.get("NO HP", "")
+                new_hp = st.text_input(
+                    label_hp + (" ✨" if hp_value else ""),  # Indicator jika auto-filled
+                    value=hp_value,
+                    key=f"hp_{row_id}",
+                    placeholder="08XXXXXXXXXX",
+                    help="✨ = Auto-filled dari form text" if hp_value else "Tab untuk pindah ke Email"
+                )
+                if new_hp != row.get("NO HP", ""):
+                    update_field(row, "NO HP", new_hp)
+
+            label_email = "6️⃣ Email" if show_field_numbers else "Email"
+            email_value = row.get("EMAIL", "")
+            new_email = st.text_input(
+                label_email + (" ✨" if email_value else ""),  # Indicator jika auto-filled
+                value=email_value,
+                key=f"email_{row_id}",
+                placeholder="email@example.com",
+                help="✨ = Auto-filled dari form text" if email_value else "Field terakhir"
+            )
+            if new_email != row.get("EMAIL", ""):
+                update_field(row, "EMAIL", new_email)
+
+            # Status validation dengan info auto-fill
+            auto_filled_count = sum([1 for x in [ibu_value, hp_value, email_value] if x])
+            if new_nama and new_nik:
+                if auto_filled_count > 0:
+                    st.success(f"✅ Data lengkap | {auto_filled_count} field auto-filled ✨")
+                else:
+                    st.success("✅ Data lengkap tersimpan otomatis")
+            elif new_nama or new_nik:
+                st.warning("⚠️ Data belum lengkap")
+
+        st.markdown("---")
+
+@st.fragment(run_every=PROGRESS_REFRESH_SECONDS)
+def render_progress():
+    """
+    Progres input + jumlah kartu per filter. Fragment sendiri yang di-refresh
+    berkala (cuma hitung ulang data_db di memory), jadi edit di kartu tidak
+    perlu rerun seluruh app.
+    """
+    db = st.session_state.data_db
+    filled = sum(1 for r in db if r.get("NAMA") and r.get("NOMORIDENTITAS"))
+    st.metric("Progres Input", f"{filled}/{len(db)}")
+    counts = [(name, sum(1 for r in db if match(r))) for name, match in CARD_FILTERS.items()
+              if name != "Semua kartu"]
+    st.caption(" · ".join(f"{name}: {count}" for name, count in counts))
+
 # Display data as cards
 if st.session_state.data_db:
     st.divider()
@@ -1092,153 +699,41 @@ if st.session_state.data_db:
     with col_title:
         st.subheader(f"📋 Data Nasabah Terdeteksi")
     with col_progress:
-        total = len(st.session_state.data_db)
-        filled = sum(1 for r in st.session_state.data_db if r.get("NAMA") and r.get("NOMORIDENTITAS"))
-        st.metric("Progres Input", f"{filled}/{total}")
+        render_progress()
+    
+    # Hanya halaman yang sedang dilihat yang dirender (widget & foto)
+    col_filter, col_size, col_page = st.columns([2, 1, 1])
+    with col_filter:
+        card_filter = st.selectbox("🔎 Tampilkan", list(CARD_FILTERS), key="card_filter")
+    with col_size:
+        rows_per_page = st.selectbox("Baris per halaman", CARD_ROWS_PER_PAGE, key="card_rows_per_page")
     
-    for i in range(0, len(st.session_state.data_db), cards_per_row):
+    visible = [(idx, row) for idx, row in enumerate(st.session_state.data_db) if CARD_FILTERS[card_filter](row)]
+    page_size = rows_per_page * cards_per_row
+    page_count = max(1, -(-len(visible) // page_size))
+    with col_page:
+        page = st.number_input("Halaman", min_value=1, max_value=page_count,
+                               value=min(st.session_state.get("card_page", 1), page_count), step=1)
+    st.session_state.card_page = page
+    st.caption(f"Menampilkan {min(len(visible), (page - 1) * page_size + 1)}–"
+               f"{min(len(visible), page * page_size)} dari {len(visible)} kartu")
+    
+    page_cards = visible[(page - 1) * page_size:page * page_size]
+    for i in range(0, len(page_cards), cards_per_row):
         cols = st.columns(cards_per_row)
-        
-        for j in range(cards_per_row):
-            idx = i + j
-            if idx >= len(st.session_state.data_db):
-                break
-            
-            row = st.session_state.data_db[idx]
-            
-            with cols[j]:
-                with st.container():
-                    col_h1, col_h2 = st.columns([3, 1])
-                    with col_h1:
-                        st.markdown(f"### 💳 Nasabah #{idx + 1}")
-                    with col_h2:
-                        if st.button("🗑️", key=f"del_{idx}", help="Hapus KTP ini"):
-                            st.session_state.data_db.pop(idx)
-                            st.rerun()
-                    
-                    st.divider()
-                    
-                    # LAYOUT: Foto di kiri (lebih kecil), Form di kanan (lebih lebar)
-                    # Ratio disesuaikan agar form punya space lebih untuk input
-                    col_foto, col_form = st.columns([1, 2])  # 1:2 ratio
-                    
-                    with col_foto:
-                        st.markdown("**📸 Preview KTP**")
-                        if row.get("IMAGE_DATA"):
-                            st.image(row["IMAGE_DATA"], use_container_width=True)
-                        else:
-                            st.warning("Foto tidak tersedia")
-                    
-                    with col_form:
-                        st.markdown("**📝 Informasi Identitas**")
-                        
-                        label_nama = "1️⃣ Nama Lengkap" if show_field_numbers else "Nama Lengkap"
-                        new_nama = st.text_input(
-                            label_nama,
-                            value=row["NAMA"],
-                            key=f"nama_{idx}",
-                            placeholder="Masukkan nama lengkap",
-                            help="Tab untuk pindah ke NIK"
-                        )
-                        
-                        # AUTO-SAVE ke Google Sheets saat ada perubahan
-                        if new_nama != row["NAMA"] and row.get("KTP_ID"):
-                            ktp_id = row["KTP_ID"]
-                            if ktp_id in st.session_state.original_ocr_results:
-                                original_nama = st.session_state.original_ocr_results[ktp_id]["NAMA"]
-                                
-                                if new_nama and original_nama and new_nama != original_nama:
-                                    # Update session state
-                                    st.session_state.learned_fixes[original_nama] = new_nama
-                                    
-                                    # AUTO-SAVE ke Google Sheets
-                                    if save_to_gsheet(original_nama, new_nama):
-                                        st.success(f"🧠 Auto-saved: `{original_nama}` → `{new_nama}`", icon="✅")
-                                    else:
-                                        st.info(f"💾 Saved locally: `{original_nama}` → `{new_nama}`", icon="ℹ️")
-                            
-                            st.session_state.data_db[idx]["NAMA"] = new_nama
-                        
-                        label_nik = "2️⃣ NIK (16 digit)" if show_field_numbers else "NIK (16 digit)"
-                        new_nik = st.text_input(
-                            label_nik,
-                            value=row["NOMORIDENTITAS"],
-                            key=f"nik_{idx}",
-                            placeholder="3516XXXXXXXXXXXX",
-                            max_chars=16,
-                            help="Tab untuk pindah ke Nama Ibu"
-                        )
-                        if new_nik != row["NOMORIDENTITAS"]:
-                            st.session_state.data_db[idx]["NOMORIDENTITAS"] = new_nik
-                        
-                        st.markdown("**ℹ️ Data Pelengkap Nasabah**")
-                        
-                        label_ibu = "3️⃣ Nama Gadis Ibu" if show_field_numbers else "Nama Gadis Ibu"
-                        ibu_value = row.get("NAMA GADIS IBU", "")
-                        new_ibu = st.text_input(
-                            label_ibu + (" ✨" if ibu_value else ""),  # Indicator jika auto-filled
-                            value=ibu_value,
-                            key=f"ibu_{idx}",
-                            placeholder="Nama gadis ibu kandung",
-                            help="✨ = Auto-filled dari form text" if ibu_value else "Tab untuk pindah ke CIF"
-                        )
-                        if new_ibu != row.get("NAMA GADIS IBU", ""):
-                            st.session_state.data_db[idx]["NAMA GADIS IBU"] = new_ibu
-                        
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            label_cif = "4️⃣ CIF No" if show_field_numbers else "CIF No"
-                            new_cif = st.text_input(
-                                label_cif,
-                                value=row.get("CIF NO", ""),
-                                key=f"cif_{idx}",
-                                placeholder="CIF",
-                                help="Tab untuk pindah ke No HP"
-                            )
-                            if new_cif != row.get("CIF NO", ""):
-                                st.session_state.data_db[idx]["CIF NO"] = new_cif
-                        
-                        with col2:
-                            label_hp = "5️⃣ No HP" if show_field_numbers else "No HP"
-                            hp_value = row.get("NO HP", "")
-                            new_hp = st.text_input(
-                                label_hp + (" ✨" if hp_value else ""),  # Indicator jika auto-filled
-                                value=hp_value,
-                                key=f"hp_{idx}",
-                                placeholder="08XXXXXXXXXX",
-                                help="✨ = Auto-filled dari form text" if hp_value else "Tab untuk pindah ke Email"
-                            )
-                            if new_hp != row.get("NO HP", ""):
-                                st.session_state.data_db[idx]["NO HP"] = new_hp
-                        
-                        label_email = "6️⃣ Email" if show_field_numbers else "Email"
-                        email_value = row.get("EMAIL", "")
-                        new_email = st.text_input(
-                            label_email + (" ✨" if email_value else ""),  # Indicator jika auto-filled
-                            value=email_value,
-                            key=f"email_{idx}",
-                            placeholder="email@example.com",
-                            help="✨ = Auto-filled dari form text" if email_value else "Field terakhir"
-                        )
-                        if new_email != row.get("EMAIL", ""):
-                            st.session_state.data_db[idx]["EMAIL"] = new_email
-                        
-                        # Status validation dengan info auto-fill
-                        auto_filled_count = sum([1 for x in [ibu_value, hp_value, email_value] if x])
-                        if new_nama and new_nik:
-                            if auto_filled_count > 0:
-                                st.success(f"✅ Data lengkap | {auto_filled_count} field auto-filled ✨")
-                            else:
-                                st.success("✅ Data lengkap tersimpan otomatis")
-                        elif new_nama or new_nik:
-                            st.warning("⚠️ Data belum lengkap")
-                    
-                    st.markdown("---")
+        for col, (idx, row) in zip(cols, page_cards[i:i + cards_per_row]):
+            with col:
+                render_card(idx, row)
+
 
 with button_placeholder:
     if uploaded_files:
         new_files = [f for f in uploaded_files if f.name not in st.session_state.processed_files]
         
+        if any(f.name.lower().endswith('.pdf') for f in new_files) and not pdf_support():
+            st.warning("⚠️ Scan PDF butuh package `pypdfium2` di server (pip install pypdfium2). "
+                       "File PDF akan dilewati.", icon="⚠️")
+        
         # Soft limit warning untuk batch besar
         if len(new_files) > 10:
             st.error(f"""
@@ -1262,6 +757,9 @@ with button_placeholder:
             - Data yang sudah ter-process akan hilang
             - Harus refresh & upload ulang
             
+            **Opsi 3:** Upload 1 file ZIP berisi semua foto
+            - Isi ZIP dibaca satu per satu saat worker siap, RAM tetap stabil
+            
             💡 **Best practice:** Cancel upload ini, upload ulang 5-8 files saja!
             """, icon="🚨")
         
@@ -1271,14 +769,16 @@ with button_placeholder:
             
             Upload {len(new_files)} file. Recommended: 5-8 file per batch.
             
-            Proses akan berjalan lebih lambat (~1 detik per file) untuk stabilitas.
+            File diproses paralel, jumlah worker otomatis disesuaikan dengan RAM server.
             """, icon="⚠️")
         
         if new_files:
             if st.button("🚀 MULAI PEMINDAIAN", type="primary", use_container_width=True):
+                scanner = load_scanner()
+                # Mode process: tiap worker load model sendiri, reader = None
                 reader = load_ocr()
                 
-                if reader is None:
+                if not load_ocr_warmup().is_ready:
                     st.error("❌ Sistem OCR gagal dimuat. Silakan refresh halaman ini.", icon="❌")
                 else:
                     with status_placeholder:
@@ -1290,56 +790,69 @@ with button_placeholder:
                     success_list = []
                     error_list = []
                     
-                    # Process satu-satu dengan delay untuk avoid memory spike
-                    for i, file_item in enumerate(new_files):
-                        # Update progress
-                        progress_pct = (i / len(new_files))
-                        bar.progress(progress_pct)
-                        
-                        txt.info(f"⏳ Memproses {i+1}/{len(new_files)}: **{file_item.name}**")
-                        status_detail.caption(f"🔄 Queue: {len(new_files) - i - 1} file menunggu...")
-                        
-                        # IMPORTANT: Force garbage collection sebelum process
-                        import gc
-                        gc.collect()
-                        
-                        # Process file
-                        res = worker_process(file_item, preview_width, reader)
+                    # PDF/TIFF dihitung per halaman (tanpa render), ZIP per member untuk progress bar
+                    total_files = sum(count_pages(f, f.name) if is_archive(f.name)
+                                      else count_pages(f.getvalue(), f.name) if is_document(f.name) else 1
+                                      for f in new_files)
+                    txt.info(f"⏳ Memproses {total_files} foto/halaman dengan {scanner.workers} worker paralel...")
+                    
+                    # Halaman dokumen dirender & member ZIP di-decompress satu per satu saat
+                    # ada worker kosong; member ZIP yang isinya sudah pernah diproses di-skip
+                    scan_items, document_errors = expand_documents(
+                        new_files, seen=set(st.session_state.processed_files))
+                    
+                    # Proses paralel - hasil masuk sesuai urutan selesai
+                    results = scanner.scan(
+                        scan_items, preview_width,
+                        reader=reader,
+                        learned_fixes=fix_store.snapshot(),
+                        cache=ocr_cache
+                    )
+                    files_done = 0
+                    for file_item, res in results:
+                        # Lembar multi-KTP: 1 file -> beberapa hasil (CARD_INDEX 0..N-1)
+                        if not res or not res.get("CARD_INDEX"):
+                            files_done += 1
+                        status_detail.caption(f"🔄 Queue: {total_files - files_done} foto/halaman menunggu...")
+                        card_label = file_item.name
+                        if res and res.get("CARD_COUNT", 1) > 1:
+                            card_label += f" (kartu {res['CARD_INDEX'] + 1}/{res['CARD_COUNT']})"
                         
                         if res and res.get("IMAGE_DATA"):
                             # Ada foto - SELALU SIMPAN (walaupun error OCR)
-                            ktp_id = f"ktp_{len(st.session_state.data_db)}_{res['FILENAME']}"
+                            # ID unik: len(data_db) bisa terpakai ulang setelah ada kartu dihapus
+                            ktp_id = f"ktp_{uuid.uuid4().hex}_{res['FILENAME']}"
                             
+                            original = None
                             if res.get("NAMA") or res.get("NOMORIDENTITAS"):
                                 # Ada data OCR yang berhasil
-                                st.session_state.original_ocr_results[ktp_id] = {
+                                original = {
                                     "NAMA": res.get("NAMA", ""),
                                     "NOMORIDENTITAS": res.get("NOMORIDENTITAS", "")
                                 }
+                                st.session_state.original_ocr_results[ktp_id] = original
                             
-                            st.session_state.data_db.append({
-                                "KTP_ID": ktp_id,
-                                "IMAGE_DATA": res["IMAGE_DATA"],
-                                "NAMA": res.get("NAMA", ""),
-                                "NOMORIDENTITAS": res.get("NOMORIDENTITAS", ""),
-                                "NAMA GADIS IBU": res.get("NAMA_IBU", ""),  # Auto-fill dari form!
-                                "CIF NO": "",
-                                "NO HP": res.get("NO_HP", ""),              # Auto-fill dari form!
-                                "EMAIL": res.get("EMAIL", "")               # Auto-fill dari form!
-                            })
-                            st.session_state.processed_files.add(res["FILENAME"])
+                            # Foto langsung ke disk, yang tinggal di session cuma key-nya
+                            st.session_state.data_db.append(
+                                record_store.add(workspace, result_to_record(res, ktp_id), original))
+                            bump_data_version()
+                            # Halaman PDF/TIFF: yang ditandai selesai file dokumennya,
+                            # member ZIP: hash isinya (dedupe upload ZIP berikutnya)
+                            mark_processed([
+                                getattr(file_item, "digest", None)
+                                or (file_item.source if getattr(file_item, "page", None) else res["FILENAME"])])
                             
                             # Show status
                             if res.get("error"):
-                                error_list.append((file_item.name, res.get("error_detail", "Unknown error")))
-                                txt.warning(f"⚠️ {file_item.name}: {res.get('error_detail')} | Foto tersimpan, silakan isi manual")
+                                error_list.append((card_label, res.get("error_detail", "Unknown error")))
+                                txt.warning(f"⚠️ {card_label}: {res.get('error_detail')} | Foto tersimpan, silakan isi manual")
                             else:
-                                success_list.append(file_item.name)
-                                txt.success(f"✅ {file_item.name}: {res.get('ROTATION_INFO', 'OK')}")
+                                success_list.append(card_label)
+                                txt.success(f"✅ {card_label}: {res.get('ROTATION_INFO', 'OK')}")
                         
                         elif res and res.get("error") and not res.get("IMAGE_DATA"):
                             # Error fatal (gambar tidak bisa di-decode, dll)
-                            error_list.append((file_item.name, res.get("message", "Fatal error")))
+                            error_list.append((card_label, res.get("message", "Fatal error")))
                             txt.error(res.get("message", f"❌ {file_item.name} gagal total"))
                         
                         else:
@@ -1348,23 +861,12 @@ with button_placeholder:
                             txt.warning(f"⚠️ {file_item.name} tidak bisa diproses")
                         
                         # Update progress
-                        bar.progress((i + 1) / len(new_files))
-                        
-                        # AGGRESSIVE DELAY & CLEANUP untuk avoid memory spike
-                        # Skip delay untuk file terakhir
-                        if i < len(new_files) - 1:
-                            import time
-                            import gc
-                            
-                            # Longer delay untuk stabilitas
-                            time.sleep(1.0)  # 1 second delay (was 0.5s)
-                            
-                            # Force aggressive cleanup
-                            gc.collect()
-                            gc.collect()  # Double cleanup
-                            
-                            # Small pause untuk system breathing
-                            time.sleep(0.2)
+                        bar.progress(min(1.0, files_done / total_files))
+                        render_metrics_panel(metrics_placeholder, metrics_stage)
+                    
+                    for name, message in document_errors:
+                        error_list.append((name, message))
+                    mark_processed(f.name for f in new_files if is_archive(f.name))
                     
                     # Clear progress indicators
                     bar.empty()
@@ -1405,27 +907,52 @@ with button_placeholder:
                     
                     st.rerun()
 
-# Preview & Download
-if st.session_state.data_db:
-    st.divider()
-    
-    st.subheader("📊 Preview Data Export Excel")
-    st.caption("Tabel berikut adalah data nasabah yang siap di-download dalam format Excel (tanpa foto KTP)")
-    
-    df_preview = []
-    for idx, row in enumerate(st.session_state.data_db):
-        df_preview.append({
-            "NO": idx + 1,
-            "NAMA": row["NAMA"],
-            "NOMORIDENTITAS": row["NOMORIDENTITAS"],
-            "NAMA GADIS IBU": row.get("NAMA GADIS IBU", ""),
-            "CIF NO": row.get("CIF NO", ""),
-            "NO HP": row.get("NO HP", ""),
-            "EMAIL": row.get("EMAIL", "")
-        })
-    
-    df_display = pd.DataFrame(df_preview)
-    
+# Format download: ekstensi -> (label, MIME)
+EXPORT_FORMATS = {
+    "xlsx": ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV", "text/csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+def export_preview(version):
+    """DataFrame preview export, dibangun ulang hanya kalau data_version berubah"""
+    cached = st.session_state.get("export_preview")
+    if cached is None or cached[0] != version:
+        cached = (version, pd.DataFrame(build_export_rows(st.session_state.data_db)))
+        st.session_state.export_preview = cached
+    return cached[1]
+
+def export_file(fmt):
+    """
+    Callable untuk st.download_button: dijalankan (di thread lain) hanya saat
+    tombol diklik. Baris export dibangun dari data_db saat itu (bukan snapshot
+    waktu tombol dirender), hasil di-cache per (data_version, format).
+    """
+    state = st.session_state.export_state
+
+    def build():
+        version = state["version"]
+        files = state["files"]
+        key = (version, fmt)
+        data = files.get(key)
+        if data is None:
+            data = EXPORTERS[fmt](build_export_rows(list(state["db"])))
+            for stale in [k for k in files if k[0] != version]:
+                files.pop(stale, None)
+            files[key] = data
+        return data
+    return build
+
+@st.fragment
+def render_export_preview():
+    """
+    Tabel preview export. Fragment sendiri: edit di kartu tidak merender ulang
+    tabel, tombol 🔄 membangun ulang tabel dari data_db terbaru (hanya kalau
+    data_version berubah). File download tetap selalu dari data terbaru.
+    """
+    # Klik = rerun fragment ini saja
+    st.button("🔄 Perbarui preview", key="refresh_export_preview")
+    df_display = export_preview(st.session_state.data_version)
     st.dataframe(
         df_display,
         use_container_width=True,
@@ -1440,42 +967,46 @@ if st.session_state.data_db:
             "EMAIL": st.column_config.TextColumn("Email", width="large"),
         }
     )
+
+# Preview & Download
+if st.session_state.data_db:
+    st.divider()
+    
+    st.subheader("📊 Preview Data Export Excel")
+    st.caption("Tabel berikut adalah data nasabah yang siap di-download dalam format Excel (tanpa foto KTP)")
+    
+    render_export_preview()
     
     st.divider()
     
     c1, c2, c3 = st.columns([2, 2, 1])
     
     with c1:
-        df_export = []
-        for idx, row in enumerate(st.session_state.data_db):
-            df_export.append({
-                "NO": idx + 1,
-                "NAMA": row["NAMA"],
-                "NOMORIDENTITAS": row["NOMORIDENTITAS"],
-                "NAMA GADIS IBU": row.get("NAMA GADIS IBU", ""),
-                "CIF NO": row.get("CIF NO", ""),
-                "NO HP": row.get("NO HP", ""),
-                "EMAIL": row.get("EMAIL", "")
-            })
-        df_dl = pd.DataFrame(df_export)
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='xlsxwriter') as wr:
-            df_dl.to_excel(wr, index=False, sheet_name='Data KTP')
-        
+        formats = [f for f in EXPORT_FORMATS if f != "parquet" or parquet_support()]
+        export_format = st.radio(
+            "Format", formats, horizontal=True, key="export_format",
+            format_func=lambda f: EXPORT_FORMATS[f][0],
+            help="CSV / Parquet lebih ringan untuk ratusan baris"
+        )
+        label, mime = EXPORT_FORMATS[export_format]
+        # File baru dibuat saat tombol diklik (bukan setiap rerun)
         st.download_button(
-            "📥 Download File Excel",
-            buffer.getvalue(),
-            "Data_Nasabah_BRI.xlsx",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            f"📥 Download File {label}",
+            export_file(export_format),
+            f"Data_Nasabah_BRI.{export_format}",
+            mime,
             use_container_width=True,
-            help="Download data nasabah dalam format Excel"
+            help=f"Download data nasabah dalam format {label}"
         )
     
     with c2:
         if st.button("🗑️ Hapus Semua Data", type="secondary", use_container_width=True):
             if st.session_state.get('confirm_delete', False):
+                record_store.clear(workspace)
                 st.session_state.data_db = []
                 st.session_state.processed_files = set()
+                st.session_state.original_ocr_results = {}
+                bump_data_version()
                 st.session_state.confirm_delete = False
                 st.rerun()
             else:
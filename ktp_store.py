@@ -0,0 +1,188 @@
+"""
+Penyimpanan data nasabah hasil scan di disk (bukan di st.session_state).
+
+- Baris data (NAMA, NIK, ...) di SQLite (WAL): store_dir/records.sqlite3
+- Foto preview KTP di folder blob, nama file = SHA-256 isinya
+  (store_dir/thumbs/ab/abcdef...jpg), foto yang sama hanya disimpan sekali
+
+Session UI cuma pegang baris ringan + key thumbnail; foto dibaca dari disk
+saat kartunya ditampilkan. Data dikelompokkan per workspace (id di URL),
+jadi tetap ada setelah browser di-refresh atau server restart.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "ktp-scanner")
+# Magic bytes -> ekstensi file thumbnail
+_THUMB_FORMATS = ((b"\xff\xd8", ".jpg"), (b"RIFF", ".webp"), (b"\x89PNG", ".png"))
+# Kolom record yang tidak disimpan di JSON fields (punya kolom/blob sendiri)
+_NON_FIELD_KEYS = ("IMAGE_DATA", "ROW_ID", "THUMB")
+
+
+def new_workspace_id():
+    return uuid.uuid4().hex[:12]
+
+
+class RecordStore:
+    """
+    SQLite (WAL) + blob dir thumbnail. Koneksi dibuat per thread, aman
+    di-share semua session Streamlit (st.cache_resource).
+    Record yang dikembalikan: dict kolom data_db + "ROW_ID" (id baris) &
+    "THUMB" (key thumbnail, None kalau tanpa foto), tanpa IMAGE_DATA.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, "records.sqlite3")
+        self.thumb_dir = os.path.join(store_dir, "thumbs")
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """Config dari env: KTP_STORE_DIR"""
+        return cls(os.environ.get("KTP_STORE_DIR") or DEFAULT_STORE_DIR)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.store_dir, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " workspace TEXT NOT NULL,"
+                " fields TEXT NOT NULL,"
+                " thumb TEXT,"
+                " ocr TEXT,"
+                " created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_workspace ON records(workspace, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_thumb ON records(thumb)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed ("
+                " workspace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " PRIMARY KEY (workspace, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    # ----- thumbnail -----
+
+    def thumb_path(self, key):
+        """Path file thumbnail dari key (tidak dicek ada/tidak)"""
+        digest, ext = os.path.splitext(key)
+        return os.path.join(self.thumb_dir, digest[:2], digest + ext)
+
+    def put_thumbnail(self, data):
+        """Simpan bytes thumbnail (idempotent). Returns: key"""
+        ext = next((e for magic, e in _THUMB_FORMATS if data.startswith(magic)), ".bin")
+        key = hashlib.sha256(data).hexdigest() + ext
+        path = self.thumb_path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Tulis ke file sementara lalu rename, tidak ada thumbnail setengah jadi
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        return key
+
+    def thumbnail(self, key):
+        """Path thumbnail untuk st.image, None kalau tidak ada"""
+        if not key:
+            return None
+        path = self.thumb_path(key)
+        return path if os.path.exists(path) else None
+
+    def _drop_thumbnails(self, conn, keys):
+        # Hapus file thumbnail yang sudah tidak dipakai record manapun
+        for key in set(k for k in keys if k):
+            if conn.execute("SELECT 1 FROM records WHERE thumb = ? LIMIT 1", (key,)).fetchone() is None:
+                try:
+                    os.remove(self.thumb_path(key))
+                except OSError:
+                    pass
+
+    # ----- record -----
+
+    def add(self, workspace, record, ocr=None):
+        """
+        Simpan 1 baris data_db (IMAGE_DATA dipindah ke blob dir)
+        ocr: hasil OCR asli {"NAMA", "NOMORIDENTITAS"} untuk deteksi koreksi
+        Returns: record tersimpan (tanpa IMAGE_DATA)
+        """
+        image_data = record.get("IMAGE_DATA")
+        thumb = self.put_thumbnail(image_data) if image_data else None
+        fields = {k: v for k, v in record.items() if k not in _NON_FIELD_KEYS}
+        cursor = self._conn().execute(
+            "INSERT INTO records (workspace, fields, thumb, ocr, created) VALUES (?, ?, ?, ?, ?)",
+            (workspace, json.dumps(fields, ensure_ascii=False), thumb,
+             json.dumps(ocr, ensure_ascii=False) if ocr else None, time.time())
+        )
+        return dict(fields, ROW_ID=cursor.lastrowid, THUMB=thumb)
+
+    def records(self, workspace):
+        """Semua record workspace, urut waktu scan"""
+        rows = self._conn().execute(
+            "SELECT id, fields, thumb FROM records WHERE workspace = ? ORDER BY id", (workspace,)
+        )
+        return [dict(json.loads(fields), ROW_ID=row_id, THUMB=thumb) for row_id, fields, thumb in rows]
+
+    def ocr_results(self, workspace):
+        """Hasil OCR asli per KTP_ID (pengganti original_ocr_results di session)"""
+        rows = self._conn().execute(
+            "SELECT fields, ocr FROM records WHERE workspace = ? AND ocr IS NOT NULL", (workspace,)
+        )
+        results = {}
+        for fields, ocr in rows:
+            ktp_id = json.loads(fields).get("KTP_ID")
+            if ktp_id:
+                results[ktp_id] = json.loads(ocr)
+        return results
+
+    def update(self, row_id, field, value):
+        """Update 1 field record (edit di form kartu)"""
+        conn = self._conn()
+        row = conn.execute("SELECT fields FROM records WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            return
+        fields = json.loads(row[0])
+        fields[field] = value
+        conn.execute("UPDATE records SET fields = ? WHERE id = ?",
+                     (json.dumps(fields, ensure_ascii=False), row_id))
+
+    def delete(self, row_id):
+        conn = self._conn()
+        row = conn.execute("SELECT thumb FROM records WHERE id = ?", (row_id,)).fetchone()
+        conn.execute("DELETE FROM records WHERE id = ?", (row_id,))
+        if row is not None:
+            self._drop_thumbnails(conn, [row[0]])
+
+    def clear(self, workspace):
+        """Hapus semua record & daftar file terproses 1 workspace"""
+        conn = self._conn()
+        thumbs = [t for (t,) in conn.execute("SELECT thumb FROM records WHERE workspace = ?", (workspace,))]
+        conn.execute("DELETE FROM records WHERE workspace = ?", (workspace,))
+        conn.execute("DELETE FROM processed WHERE workspace = ?", (workspace,))
+        self._drop_thumbnails(conn, thumbs)
+
+    # ----- file terproses -----
+
+    def processed_keys(self, workspace):
+        """Nama file / content_key yang sudah diproses di workspace"""
+        rows = self._conn().execute("SELECT key FROM processed WHERE workspace = ?", (workspace,))
+        return {key for (key,) in rows}
+
+    def mark_processed(self, workspace, keys):
+        self._conn().executemany(
+            "INSERT OR IGNORE INTO processed (workspace, key) VALUES (?, ?)",
+            [(workspace, key) for key in keys]
+        )
@@ -0,0 +1,317 @@
+"""
+Sinkronisasi koreksi nama (learned fixes) dengan Google Sheets (Apps Script)
+di background thread, supaya UI tidak menunggu request HTTP.
+
+- Koreksi masuk antrean lokal, koreksi untuk nama OCR yang sama digabung
+  (yang terakhir menang), lalu dikirim bergantian (default) atau sekaligus
+  dalam 1 POST kalau mode batch aktif
+- Gagal kirim -> dicoba lagi dengan backoff eksponensial, antrean tidak hilang
+- Daftar koreksi di-refresh tiap interval; server yang mengirim ETag /
+  "version" tidak perlu mengirim ulang data yang sama
+- 1 requests.Session (koneksi di-reuse) untuk semua request
+
+Format request (Apps Script):
+    GET  -> {"success": true, "data": {salah: benar}, "version": ..., "batch": true}
+    POST {"wrong": .., "correct": ..}                           (default, 1 koreksi)
+    POST {"corrections": [{"wrong": .., "correct": ..}, ...]}   (batch)
+Format batch hanya dipakai kalau diaktifkan (KTP_GSHEET_BATCH=1 / secrets
+gsheet.batch) atau response GET mengumumkan "batch": true. Apps Script lama
+yang tidak memvalidasi payload bisa menjawab success untuk POST batch tanpa
+menyimpan apa pun, jadi jangan ditebak dari response POST.
+"""
+import os
+import json
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_REFRESH_SECONDS = 300
+# Tunggu sebentar sebelum kirim, supaya koreksi beruntun ikut 1 batch
+DEFAULT_FLUSH_SECONDS = 2.0
+MAX_BATCH = 50
+REQUEST_TIMEOUT = 10
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class GSheetSync:
+    """
+    Worker sync (1 per proses server). fixes() mengembalikan snapshot dict
+    terbaru; dict itu tidak pernah diubah, tiap perubahan = dict baru +
+    version naik, jadi aman dibaca dari thread manapun tanpa lock.
+    """
+
+    def __init__(self, url, refresh_interval=DEFAULT_REFRESH_SECONDS, flush_delay=DEFAULT_FLUSH_SECONDS,
+                 max_batch=MAX_BATCH, timeout=REQUEST_TIMEOUT, session=None, listener=None, batch=False):
+        self.url = url
+        # listener(fixes): dipanggil dari thread worker setiap hasil refresh berubah
+        self.listener = listener
+        self.refresh_interval = refresh_interval
+        self.flush_delay = flush_delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.session = session or self._make_session()
+
+        self.version = 0
+        self.last_error = None
+        self.last_sync = None
+        self._fixes = {}
+        self._etag = None
+        self._server_version = None
+        # Format batch: opt-in atau diumumkan server lewat GET ("batch": true)
+        self._batch_supported = bool(batch)
+
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()   # serialisasi penulis snapshot _fixes
+        self._pending = {}          # salah -> benar, urut waktu masuk
+        self._pending_since = None
+        self._inflight = {}         # batch yang sedang dikirim (belum tentu sudah ada di server)
+        self._attempt = 0
+        self._retry_at = 0.0
+        self._force = False
+        self._stopping = False
+        self._loaded = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, url, listener=None, batch=None):
+        """
+        Config dari env: KTP_GSHEET_REFRESH_S (default: 300), KTP_GSHEET_FLUSH_S (default: 2),
+        KTP_GSHEET_BATCH (1 = kirim format batch, default: 1 koreksi per POST; argumen batch menang)
+        """
+        def _seconds(name, default):
+            try:
+                return max(0.0, float(os.environ.get(name, "").strip()))
+            except ValueError:
+                return default
+        if batch is None:
+            batch = os.environ.get("KTP_GSHEET_BATCH", "").strip().lower() in ("1", "true", "yes")
+        return cls(url, _seconds("KTP_GSHEET_REFRESH_S", DEFAULT_REFRESH_SECONDS),
+                   _seconds("KTP_GSHEET_FLUSH_S", DEFAULT_FLUSH_SECONDS), listener=listener, batch=batch)
+
+    @staticmethod
+    def _make_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    # ----- API (dipanggil dari thread Streamlit) -----
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ktp-gsheet-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait_loaded(self, timeout=None):
+        """Tunggu load pertama selesai (berhasil atau gagal). Returns: bool"""
+        return self._loaded.wait(timeout)
+
+    def fixes(self):
+        """Snapshot koreksi terbaru (jangan diubah, copy dulu kalau perlu)"""
+        return self._fixes
+
+    def submit(self, wrong, correct):
+        """Antre 1 koreksi (langsung return, dikirim worker di background)"""
+        with self._cond:
+            self._pending.pop(wrong, None)
+            self._pending[wrong] = correct
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            self._cond.notify_all()
+        self._merge({wrong: correct})
+
+    def status(self):
+        """Returns: dict {pending, last_error, last_sync, version}"""
+        with self._cond:
+            pending = len(self._pending) + len(self._inflight)
+        return {"pending": pending, "last_error": self.last_error,
+                "last_sync": self.last_sync, "version": self.version}
+
+    def flush(self, timeout=None):
+        """Kirim antrean sekarang (tanpa tunggu flush_delay). Returns: True kalau antrean kosong"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._force = True
+            self._cond.notify_all()
+            while self._pending or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=REQUEST_TIMEOUT):
+        """Coba kirim sisa antrean sekali, lalu hentikan worker"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.session.close()
+
+    # ----- worker thread -----
+
+    def _merge(self, fixes):
+        # Copy-on-write: pembaca lama tetap pegang dict lamanya
+        with self._write_lock:
+            merged = dict(self._fixes)
+            merged.update(fixes)
+            self._fixes = merged
+            self.version += 1
+
+    def _flush_due(self, now):
+        if not self._pending:
+            return False
+        if self._stopping:
+            return True
+        if now < self._retry_at:
+            return False
+        return self._force or now >= self._pending_since + self.flush_delay
+
+    def _next_wakeup(self, now, next_refresh):
+        wakeup = next_refresh
+        if self._pending:
+            # flush() tidak menunggu flush_delay lagi, cukup backoff retry
+            due = self._retry_at if self._force else max(self._retry_at, self._pending_since + self.flush_delay)
+            wakeup = min(wakeup, due)
+        return max(0.01, wakeup - now)
+
+    def _take_batch(self):
+        keys = list(self._pending)[:self.max_batch]
+        batch = [(k, self._pending.pop(k)) for k in keys]
+        self._pending_since = time.monotonic() if self._pending else None
+        self._inflight = dict(batch)
+        return batch
+
+    def _run(self):
+        self.refresh()
+        self._loaded.set()
+        next_refresh = time.monotonic() + self.refresh_interval
+        while True:
+            now = time.monotonic()
+            with self._cond:
+                due = self._flush_due(now)
+                if not due and not self._stopping and now < next_refresh:
+                    self._cond.wait(self._next_wakeup(now, next_refresh))
+                    continue
+                batch = self._take_batch() if due else []
+                stopping = self._stopping
+
+            failed = self._send(batch) if batch else []
+            with self._cond:
+                self._inflight = {}
+                if failed:
+                    # Koreksi yang lebih baru untuk nama yang sama tetap menang
+                    for wrong, correct in failed:
+                        self._pending.setdefault(wrong, correct)
+                    if self._pending_since is None:
+                        self._pending_since = time.monotonic()
+                    self._retry_at = time.monotonic() + min(BACKOFF_SECONDS * 2 ** self._attempt, MAX_BACKOFF_SECONDS)
+                    self._attempt += 1
+                elif batch:
+                    self._attempt = 0
+                    self._retry_at = 0.0
+                if not self._pending:
+                    self._force = False
+                self._cond.notify_all()
+
+            if stopping and (not batch or failed):
+                break
+            if not stopping and time.monotonic() >= next_refresh:
+                self.refresh()
+                next_refresh = time.monotonic() + self.refresh_interval
+
+    def _post(self, payload):
+        """Returns: True (sukses), False (ditolak server), None (error jaringan/HTTP, retry)"""
+        try:
+            response = self.session.post(
+                self.url, data=json.dumps(payload), headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                self.last_error = f"HTTP {response.status_code}"
+                return None
+            if response.json().get("success"):
+                return True
+            self.last_error = "Ditolak server"
+            return False
+        except (requests.RequestException, ValueError) as e:
+            self.last_error = str(e)
+            return None
+
+    def _send(self, batch):
+        """Kirim batch. Returns: list koreksi yang perlu dicoba lagi"""
+        if self._batch_supported:
+            result = self._post({"corrections": [{"wrong": w, "correct": c} for w, c in batch]})
+            if result is None:
+                return batch
+            if result:
+                self._sent()
+                return []
+            # Server menolak format batch dengan jelas: kirim ulang 1 per 1
+            self._batch_supported = False
+
+        failed = []
+        rejected = False
+        for index, (wrong, correct) in enumerate(batch):
+            result = self._post({"wrong": wrong, "correct": correct})
+            if result is None:
+                # Server/jaringan bermasalah: sisa batch dicoba lagi nanti
+                failed.extend(batch[index:])
+                break
+            # Ditolak server (False): tidak di-retry, last_error tetap terlihat
+            rejected = rejected or not result
+        if not failed:
+            self._sent(clear_error=not rejected)
+        return failed
+
+    def _sent(self, clear_error=True):
+        self.last_sync = time.time()
+        if clear_error:
+            self.last_error = None
+
+    def refresh(self):
+        """GET daftar koreksi. Returns: True kalau ada perubahan"""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        try:
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                return False
+            if response.status_code != 200:
+                self.last_error = f"HTTP {response.status_code}"
+                return False
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self.last_error = str(e)
+            return False
+        if not data.get("success"):
+            return False
+        if data.get("batch") is True:
+            # Apps Script versi baru mengumumkan dukungan POST batch
+            self._batch_supported = True
+
+        self._etag = response.headers.get("ETag")
+        version = data.get("version")
+        if version is not None and version == self._server_version:
+            return False
+        self._server_version = version
+
+        fixes = dict(data.get("data") or {})
+        with self._write_lock:
+            with self._cond:
+                # Koreksi yang belum terkirim / sedang dikirim belum tentu ada di
+                # response ini, jangan sampai hilang (antrean = yang terbaru)
+                fixes.update(self._inflight)
+                fixes.update(self._pending)
+            if fixes == self._fixes:
+                return False
+            self._fixes = fixes
+            self.version += 1
+        if self.listener is not None:
+            self.listener(fixes)
+        return True
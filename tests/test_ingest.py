@@ -0,0 +1,99 @@
+"""
+Cek ktp_ingest: halaman / frame / member yang rusak jadi entry error,
+sisanya tetap di-yield (tanpa OCR): python -m pytest tests/
+"""
+import io
+import os
+import sys
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ktp_ingest  # noqa: E402
+from ktp_engine import ScanItem  # noqa: E402
+
+
+def make_tiff(frames=3, corrupt=None):
+    """TIFF multi-frame; frame index `corrupt` isinya diganti sampah"""
+    images = [Image.fromarray(np.full((120, 160, 3), 40 * (i + 1), np.uint8)) for i in range(frames)]
+    buf = io.BytesIO()
+    images[0].save(buf, format="TIFF", save_all=True, append_images=images[1:], compression="tiff_deflate")
+    data = bytearray(buf.getvalue())
+    if corrupt is not None:
+        with Image.open(io.BytesIO(bytes(data))) as image:
+            image.seek(corrupt)
+            offset, size = image.tag_v2[273][0], image.tag_v2[279][0]
+        data[offset:offset + size] = b"\xff" * size
+    return bytes(data)
+
+
+def make_pdf(pages=3):
+    pdfium = pytest.importorskip("pypdfium2")
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(pages):
+        pdf.new_page(200, 120)
+    buf = io.BytesIO()
+    pdf.save(buf)
+    pdf.close()
+    return buf.getvalue()
+
+
+def test_tiff_corrupt_frame_is_skipped():
+    errors = []
+    pages = list(ktp_ingest.iter_tiff_pages(make_tiff(3, corrupt=1), "scan.tif", errors))
+    assert [p.page for p in pages] == [1, 3]
+    assert [name for name, _ in errors] == ["scan.tif (hal. 2)"]
+
+
+def test_pdf_render_failure_is_skipped(monkeypatch):
+    data = make_pdf(3)
+    render = ktp_ingest._render_pdf_page
+
+    def flaky(pdf, index, scale):
+        if index == 1:
+            raise RuntimeError("render gagal")
+        return render(pdf, index, scale)
+
+    monkeypatch.setattr(ktp_ingest, "_render_pdf_page", flaky)
+    errors = []
+    pages = list(ktp_ingest.iter_pdf_pages(data, "berkas.pdf", dpi=36, errors=errors))
+    assert [p.page for p in pages] == [1, 3]
+    assert errors == [("berkas.pdf (hal. 2)", "gagal dirender: render gagal")]
+
+
+def test_expand_documents_keeps_going():
+    files = [
+        ScanItem("rusak.pdf", b"%PDF-bukan pdf"),
+        ScanItem("scan.tif", make_tiff(2, corrupt=0)),
+        ScanItem("foto.jpg", b"jpeg"),
+    ]
+    items, errors = ktp_ingest.expand_documents(files)
+    names = [item.name for item in items]
+    assert names == ["scan.tif (hal. 2)", "foto.jpg"]
+    assert [name for name, _ in errors] == ["rusak.pdf", "scan.tif (hal. 1)"]
+
+
+def test_zip_bad_members_are_skipped():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("a.jpg", b"foto a" * 100)
+        archive.writestr("rusak.jpg", b"foto rusak" * 100)
+        archive.writestr("dalam/rusak.pdf", b"%PDF-bukan pdf")
+        archive.writestr("dalam/scan.tif", make_tiff(2))
+        archive.writestr("b.png", b"foto b" * 100)
+    data = bytearray(buf.getvalue())
+    # Rusak-kan isi deflate member rusak.jpg (CRC / zlib error saat dibaca)
+    with zipfile.ZipFile(io.BytesIO(bytes(data))) as archive:
+        info = archive.getinfo("rusak.jpg")
+    start = info.header_offset + 30 + len(info.filename) + len(info.extra)
+    data[start:start + info.compress_size] = b"\x00" * info.compress_size
+
+    items, errors = ktp_ingest.expand_documents([ScanItem("arsip.zip", bytes(data))])
+    names = [item.name for item in items]
+    assert names == ["arsip.zip/a.jpg", "arsip.zip/dalam/scan.tif (hal. 1)", "arsip.zip/dalam/scan.tif (hal. 2)",
+                     "arsip.zip/b.png"]
+    assert [name for name, _ in errors] == ["arsip.zip/dalam/rusak.pdf", "arsip.zip/rusak.jpg"]
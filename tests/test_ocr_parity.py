@@ -0,0 +1,102 @@
+"""
+Cek ktp_ocr.parity_report dengan fixture sintetis: reader palsu untuk harness
+(tanpa model), plus parity asli ONNX vs EasyOCR kalau model sudah ada di disk
+(python ktp_ocr.py export). Jalankan: python -m pytest tests/
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ktp_ocr  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EXPECTED_CSV = os.path.join(FIXTURE_DIR, "expected.csv")
+# Weight EasyOCR (detector CRAFT + recognizer latin) yang dipakai LANG_LIST id/en
+EASYOCR_WEIGHTS = ("craft_mlt_25k.pth", "latin_g2.pth")
+# Selisih akurasi maksimal ONNX int8 terhadap EasyOCR
+PARITY_TOLERANCE = 0.05
+
+
+def _models_missing():
+    """Alasan skip parity asli, atau None kalau model EasyOCR & ONNX lengkap"""
+    for module in ("easyocr", "onnxruntime"):
+        if importlib.util.find_spec(module) is None:
+            return f"{module} tidak terpasang"
+    model_dir = os.environ.get("KTP_MODEL_DIR") or os.path.join(os.path.expanduser("~"), ".EasyOCR", "model")
+    onnx_dir = os.environ.get("KTP_ONNX_DIR") or ktp_ocr.DEFAULT_ONNX_DIR
+    paths = [os.path.join(model_dir, name) for name in EASYOCR_WEIGHTS]
+    paths += [os.path.join(onnx_dir, name) for name in (ktp_ocr.DETECTOR_ONNX, ktp_ocr.RECOGNIZER_ONNX)]
+    missing = [path for path in paths if not os.path.isfile(path)]
+    return f"model tidak ada: {', '.join(missing)}" if missing else None
+
+
+MODELS_MISSING = _models_missing()
+
+
+class FakeReader:
+    """API EasyOCR minimal: readtext selalu mengembalikan teks KTP yang sama"""
+    LINES = ["PROVINSI JAWA TIMUR", "NIK : 3515011234560001", "Nama : BUDI SANTOSO",
+             "Tempat/Tgl Lahir : SIDOARJO, 01-01-1990"]
+
+    def readtext(self, image, **kwargs):
+        h, w = image.shape[:2]
+        step = h // (len(self.LINES) + 1)
+        return [([[0, i * step], [w, i * step], [w, (i + 1) * step], [0, (i + 1) * step]], text, 0.95)
+                for i, text in enumerate(self.LINES)]
+
+    def recognize(self, image, horizontal_list=None, free_list=None, **kwargs):
+        return []
+
+
+@pytest.fixture
+def fake_backends(monkeypatch):
+    monkeypatch.setattr(ktp_ocr, "create_reader", lambda backend=None, **kwargs: FakeReader())
+
+
+def test_parity_report_fixture(fake_backends):
+    report = ktp_ocr.parity_report(FIXTURE_DIR, EXPECTED_CSV)
+    for backend in ("easyocr", "onnx"):
+        stats = report[backend]
+        assert stats["nik_acc"] == 1.0
+        assert stats["nama_acc"] == 1.0
+        assert stats["p50"] <= stats["p95"]
+        assert stats["results"]["ktp_sintetis.png"] == ("BUDI SANTOSO", "3515011234560001")
+
+
+def test_parity_report_empty_csv(fake_backends, tmp_path):
+    csv_path = tmp_path / "expected.csv"
+    csv_path.write_text("FILENAME,NAMA,NOMORIDENTITAS\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        ktp_ocr.parity_report(FIXTURE_DIR, str(csv_path))
+
+
+def test_parity_report_mismatched_csv(fake_backends, tmp_path):
+    # Header salah & nama file yang tidak ada di folder fixture
+    csv_path = tmp_path / "expected.csv"
+    csv_path.write_text("FILE,NAME,NIK\nktp_sintetis.png,BUDI,1\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        ktp_ocr.parity_report(FIXTURE_DIR, str(csv_path))
+    csv_path.write_text("FILENAME,NAMA,NOMORIDENTITAS\ntidak_ada.jpg,BUDI,1\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        ktp_ocr.parity_report(FIXTURE_DIR, str(csv_path))
+
+
+def test_parity_cli_reports_error(fake_backends, tmp_path, capsys):
+    csv_path = tmp_path / "expected.csv"
+    csv_path.write_text("", encoding="utf-8")
+    assert ktp_ocr.main(["parity", FIXTURE_DIR, str(csv_path)]) == 2
+    assert ktp_ocr.main(["parity", FIXTURE_DIR, EXPECTED_CSV]) == 0
+
+
+@pytest.mark.skipif(MODELS_MISSING is not None, reason=MODELS_MISSING or "")
+def test_onnx_parity_with_easyocr():
+    # Reader asli: create_reader("onnx") vs EasyOCR PyTorch di fixture yang sama
+    report = ktp_ocr.parity_report(FIXTURE_DIR, EXPECTED_CSV, threads=1)
+    easy, onnx = report["easyocr"], report["onnx"]
+    assert onnx["nik_acc"] >= easy["nik_acc"] - PARITY_TOLERANCE
+    assert onnx["nama_acc"] >= easy["nama_acc"] - PARITY_TOLERANCE
+    assert onnx["p50"] <= onnx["p95"]
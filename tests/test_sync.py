@@ -0,0 +1,211 @@
+"""
+Cek ktp_sync.GSheetSync terhadap server HTTP lokal pengganti Apps Script
+(batch, backoff, fallback format lama, ETag/304, koreksi in-flight):
+python -m pytest tests/
+"""
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ktp_sync  # noqa: E402
+from ktp_sync import GSheetSync  # noqa: E402
+
+
+class FakeAppsScript:
+    """
+    State server: data {salah: benar}, posts (jumlah koreksi per POST yang
+    diterima), post_times, fail (jumlah POST berikutnya yang dijawab HTTP 500),
+    legacy (tolak format batch), advertise_batch (GET mengumumkan "batch": true),
+    hold (Event: POST menunggu sampai di-set)
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.posts = []
+        self.post_times = []
+        self.gets = 0
+        self.not_modified = 0
+        self.fail = 0
+        self.legacy = False
+        self.advertise_batch = False
+        self.hold = None
+        self.received = threading.Event()
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, code, payload=None, headers=None):
+                body = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(code)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server.gets += 1
+                etag = '"%d"' % hash(tuple(sorted(server.data.items())))
+                if self.headers.get("If-None-Match") == etag:
+                    server.not_modified += 1
+                    return self._reply(304)
+                payload = {"success": True, "data": server.data}
+                if server.advertise_batch:
+                    payload["batch"] = True
+                self._reply(200, payload, {"ETag": etag})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.post_times.append(time.monotonic())
+                server.received.set()
+                if server.hold is not None:
+                    server.hold.wait(5)
+                if server.fail > 0:
+                    server.fail -= 1
+                    return self._reply(500, {"success": False})
+                if "corrections" in payload:
+                    if server.legacy:
+                        return self._reply(200, {"success": False, "error": "wrong undefined"})
+                    items = payload["corrections"]
+                else:
+                    items = [payload]
+                server.posts.append(len(items))
+                for item in items:
+                    server.data[item["wrong"]] = item["correct"]
+                self._reply(200, {"success": True})
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/exec"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.hold is not None:
+            self.hold.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    fake = FakeAppsScript()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def make_sync(server, monkeypatch):
+    monkeypatch.setattr(ktp_sync, "BACKOFF_SECONDS", 0.1)
+    created = []
+
+    def _make(**kwargs):
+        kwargs.setdefault("refresh_interval", 60)
+        kwargs.setdefault("flush_delay", 60)
+        sync = GSheetSync(server.url, timeout=5, **kwargs).start()
+        assert sync.wait_loaded(5)
+        created.append(sync)
+        return sync
+
+    yield _make
+    for sync in created:
+        sync.stop(timeout=5)
+
+
+def test_batches_and_coalesces(server, make_sync):
+    server.data = {"BUDl": "BUDI"}
+    sync = make_sync(max_batch=3, batch=True)
+    assert sync.fixes() == {"BUDl": "BUDI"}
+
+    for i in range(10):
+        sync.submit(f"W{i % 4}", f"C{i}")
+    assert sync.status()["pending"] == 4
+    assert sync.flush(5)
+    # 10 koreksi untuk 4 nama -> 4 koreksi (yang terakhir menang), max 3 per POST
+    assert server.posts == [3, 1]
+    assert server.data == {"BUDl": "BUDI", "W0": "C8", "W1": "C9", "W2": "C6", "W3": "C7"}
+    assert sync.status()["last_error"] is None
+
+
+def test_backoff_retries_until_sent(server, make_sync):
+    sync = make_sync()
+    server.fail = 2
+    sync.submit("X", "Y")
+    assert sync.flush(5)
+    assert server.data["X"] == "Y"
+    assert len(server.post_times) == 3
+    first, second, third = server.post_times
+    # Backoff eksponensial: 0.1 s lalu 0.2 s
+    assert second - first >= 0.09
+    assert third - second >= 0.19
+    assert sync.status()["last_error"] is None
+
+
+def test_single_posts_by_default(server, make_sync):
+    sync = make_sync()
+    for i in range(3):
+        sync.submit(f"W{i}", f"C{i}")
+    assert sync.flush(5)
+    # Tanpa opt-in, Apps Script lama tidak pernah menerima payload batch
+    assert server.posts == [1, 1, 1]
+    assert server.data == {"W0": "C0", "W1": "C1", "W2": "C2"}
+
+
+def test_batch_advertised_by_server(server, make_sync):
+    server.advertise_batch = True
+    sync = make_sync()
+    sync.submit("A", "1")
+    sync.submit("B", "2")
+    assert sync.flush(5)
+    assert server.posts == [2]
+
+
+def test_legacy_endpoint_fallback(server, make_sync):
+    server.legacy = True
+    sync = make_sync(batch=True)
+    sync.submit("L1", "A")
+    sync.submit("L2", "B")
+    assert sync.flush(5)
+    assert server.posts == [1, 1]
+    sync.submit("L3", "C")
+    assert sync.flush(5)
+    # Format batch tidak dicoba lagi setelah ditolak
+    assert server.posts == [1, 1, 1]
+    assert server.data == {"L1": "A", "L2": "B", "L3": "C"}
+
+
+def test_refresh_not_modified(server, make_sync):
+    server.data = {"A": "B"}
+    sync = make_sync()
+    version = sync.version
+    assert sync.refresh() is False
+    assert server.not_modified == 1
+    assert sync.version == version
+
+    server.data = {"A": "B", "SERVER": "BARU"}
+    assert sync.refresh() is True
+    assert sync.fixes()["SERVER"] == "BARU"
+
+
+def test_refresh_keeps_inflight_batch(server, make_sync):
+    sync = make_sync()
+    server.hold = threading.Event()
+    sync.submit("SEDANG", "DIKIRIM")
+    sync.flush(0)
+    assert server.received.wait(5)
+    # POST belum selesai: server belum punya koreksinya
+    server.data = {"LAIN": "X"}
+    assert sync.refresh() is True
+    assert sync.fixes() == {"LAIN": "X", "SEDANG": "DIKIRIM"}
+    server.hold.set()
+    assert sync.flush(5)
+    assert server.data["SEDANG"] == "DIKIRIM"